@@ -105,14 +105,20 @@ class Document(models.Model):
         return f'tid: {self.tid}, title: {self.title}, date: {self.date}'
 
 
-def import_csv_to_document_model(csv_path):
+def import_csv_to_document_model(csv_path, workers=1):
     """
     Reads csv of docs and create Document model
     :param csv_path: Path to csv file
+    :param workers: int, number of processes used to parse the raw names
     :return: None
     """
     # Read csv into dataframe
     docs = pd.read_csv(csv_path).fillna('')
+    # Parse all raw names up front (in parallel if workers > 1), so new DjangoPersons created
+    # by match_djangoperson_from_name get their parse results from the cache
+    Person.parse_many([name.upper() for column in ['au', 'au_person', 'rc', 'rc_person']
+                       for column_value in docs[column]
+                       for name in parse_column_person(column_value)], workers=workers)
     # For each row, create & save the appropriate Document object
     for _, row in docs.iterrows():
         doc = Document(au=row['au'],
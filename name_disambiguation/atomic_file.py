@@ -0,0 +1,97 @@
+"""
+Atomic writes of the files of the pipeline (people db pickles, checkpoints, stores, decisions).
+Every file gets written to a temporary file next to it first, which then replaces the file, so
+readers never see a partial file and an interrupted write keeps the previous file.
+"""
+
+import os
+import stat
+import tempfile
+import unittest
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def atomic_write(file_path, mode='wb', encoding=None):
+    """
+    Opens a temporary file next to file_path for writing, which replaces file_path once the
+    with block is done. If the with block raises, file_path stays as it was.
+    The file keeps the permissions of the file it replaces. New files get the usual permissions
+    of the process (0o666 without the umask), unlike files created by tempfile, which only
+    their owner can read.
+    e.g.
+        with atomic_write(file_path, 'w', encoding='utf-8') as outfile:
+            json.dump(decisions, outfile)
+
+    :param file_path: Path
+    :param mode: str, 'wb' or 'w'
+    :param encoding: str, encoding of text files
+    :return: file object of the temporary file
+    """
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(f'.{file_path.name}.{uuid.uuid4().hex}.tmp')
+    # os.open applies the umask to 0o666 like open does
+    file_descriptor = os.open(str(temp_path),
+                              os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0),
+                              0o666)
+    try:
+        with open(file_descriptor, mode, encoding=encoding) as outfile:
+            yield outfile
+        if file_path.exists():
+            os.chmod(str(temp_path), stat.S_IMODE(file_path.stat().st_mode))
+        os.replace(str(temp_path), str(file_path))
+    finally:
+        # only left over if writing or moving the file failed
+        if temp_path.exists():
+            os.remove(str(temp_path))
+
+
+class TestAtomicWrite(unittest.TestCase):
+    """
+    Tests writing files with atomic_write
+    """
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()     # pylint: disable=R1732
+        self.addCleanup(temp_dir.cleanup)
+        self.file_path = Path(temp_dir.name, 'people_db.pickle')
+
+    def test_write(self):
+        """
+        Binary and text files get written, an interrupted write keeps the previous file
+        """
+        with atomic_write(self.file_path) as outfile:
+            outfile.write(b'binary')
+        self.assertEqual(self.file_path.read_bytes(), b'binary')
+        with atomic_write(self.file_path, 'w', encoding='utf-8') as outfile:
+            outfile.write('text é')
+        self.assertEqual(self.file_path.read_text(encoding='utf-8'), 'text é')
+
+        # no temporary file is left behind
+        with self.assertRaises(ValueError):
+            with atomic_write(self.file_path, 'w', encoding='utf-8') as outfile:
+                outfile.write('partial')
+                raise ValueError
+        self.assertEqual(self.file_path.read_text(encoding='utf-8'), 'text é')
+        self.assertEqual(os.listdir(str(self.file_path.parent)), [self.file_path.name])
+
+    @unittest.skipUnless(os.name == 'posix', 'file permissions')
+    def test_permissions(self):
+        """
+        New files get 0o666 without the umask, replaced files keep their permissions
+        """
+        previous_umask = os.umask(0o022)
+        self.addCleanup(os.umask, previous_umask)
+        with atomic_write(self.file_path) as outfile:
+            outfile.write(b'new')
+        self.assertEqual(stat.S_IMODE(self.file_path.stat().st_mode), 0o644)
+
+        os.chmod(str(self.file_path), 0o640)
+        with atomic_write(self.file_path) as outfile:
+            outfile.write(b'replaced')
+        self.assertEqual(stat.S_IMODE(self.file_path.stat().st_mode), 0o640)
+
+
+if __name__ == '__main__':
+    unittest.main()
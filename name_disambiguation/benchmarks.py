@@ -0,0 +1,335 @@
+"""
+Benchmarks for the name disambiguation pipeline.
+Each benchmark compares a faster implementation against the previous one on the raw names in
+tobacco_names_raw_test.json and checks that both produce identical results.
+
+Run from the name_disambiguation folder with: python benchmarks.py (the benchmarks of the people
+db are in people_db_benchmarks.py)
+"""
+
+import json
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+from nameparser import HumanName
+
+from name_disambiguation.clean_org_names import ORG_DICTIONARY, OrgDictionary
+from name_disambiguation.config import DATA_PATH
+from name_disambiguation.network_generation import check_if_name_looks_like_an_organization, \
+    classify_names
+from name_disambiguation.fast_name_parser import NAME_SPLIT_COUNTER, configure_nameparser, \
+    get_fast_path_share
+from name_disambiguation.name_parse_cache import NAME_PARSE_CACHE, persistent_name_parse_cache
+from name_disambiguation.person import Person
+
+TEST_NAMES_PATH = Path(DATA_PATH, 'name_disambiguation', 'tobacco_names_raw_test.json')
+
+
+def load_test_names(file_path=TEST_NAMES_PATH):
+    """
+    Loads the Counter of raw names used for the benchmarks
+    :param file_path: Path to json file (dict of raw names and counts)
+    :return: dict
+    """
+    with open(file_path, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def extract_raw_orgs_with_dict_loop(name_raw):
+    """
+    The org extraction loop that Person.extract_known_raw_org_names replaced: builds and runs
+    one regex per entry of ORG_DICTIONARY.raw_to_clean.
+    Kept as the reference implementation for benchmark_org_extraction
+
+    :param name_raw: str
+    :return: str (name_raw without the raw org names), list of str (extracted clean org names)
+    """
+    extracted_positions = []
+
+    for raw_org, clean_org in ORG_DICTIONARY.raw_to_clean.items():
+        while True:
+            search_hit = None
+            for search_hit in re.finditer(r'\b' + raw_org + r'\b', name_raw):
+                pass
+
+            if not search_hit:
+                break
+
+            if len(raw_org) >= 3:
+                name_raw = name_raw[0:search_hit.start()] + name_raw[search_hit.end():]
+                if not clean_org == "@skip@":
+                    extracted_positions.append(clean_org)
+
+            elif len(raw_org) == 2:
+                name_raw_test = name_raw[0:search_hit.start()] + name_raw[search_hit.end():]
+                name = HumanName(name_raw_test)
+                if not name.first and not name.middle:
+                    break
+                if not name.last:
+                    break
+                extracted_positions.append(clean_org)
+                name_raw = name_raw_test
+
+    return name_raw, extracted_positions
+
+
+def benchmark_org_extraction(names=None):
+    """
+    Compares Person.extract_known_raw_org_names (single scan with RAW_ORG_MATCHER) against the
+    old loop over all entries of ORG_DICTIONARY.raw_to_clean.
+    Raises a ValueError if the two disagree on any name.
+
+    :param names: list of raw names (str). Defaults to the names in tobacco_names_raw_test.json
+    :return: dict with the time in seconds each implementation took
+    """
+    if names is None:
+        names = list(load_test_names())
+
+    # the reference loop uses HumanName directly -> configure it like split_name does
+    configure_nameparser()
+
+    start_time = time.time()
+    loop_results = [extract_raw_orgs_with_dict_loop(name) for name in names]
+    loop_time = time.time() - start_time
+
+    start_time = time.time()
+    matcher_results = [Person.extract_known_raw_org_names(name) for name in names]
+    matcher_time = time.time() - start_time
+
+    for name, loop_result, matcher_result in zip(names, loop_results, matcher_results):
+        if matcher_result != loop_result:
+            raise ValueError(f'Org extraction differs for {name}: {loop_result} (loop) vs. '
+                             f'{matcher_result} (matcher)')
+
+    print(f'Org extraction of {len(names)} names. dict loop: {loop_time:.2f}s. '
+          f'matcher: {matcher_time:.2f}s. speedup: {loop_time / matcher_time:.1f}x')
+    return {'loop': loop_time, 'matcher': matcher_time}
+
+
+def benchmark_persistent_parse_store(names=None):
+    """
+    Parses all names twice, each time with an empty in-memory NAME_PARSE_CACHE backed by the
+    same (temporary) PersistentParseStore: the first run parses every name, the second (warm)
+    run should find all of them on disk.
+
+    :param names: list of raw names (str). Defaults to the names in tobacco_names_raw_test.json
+    :return: dict with the time in seconds of the cold and the warm run
+    """
+    if names is None:
+        names = list(load_test_names())
+
+    times = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store_path = Path(temp_dir, 'name_parse_cache.sqlite3')
+        for run in ['cold', 'warm']:
+            NAME_PARSE_CACHE.clear()
+            NAME_SPLIT_COUNTER.clear()
+            start_time = time.time()
+            with persistent_name_parse_cache(store_path) as store:
+                for name in names:
+                    try:
+                        Person.parse_raw_name(name, 1)
+                    except IndexError:
+                        pass
+                print(f'{run} run: {NAME_PARSE_CACHE.stats()}, store hits: {store.hits}, '
+                      f'fast path share: {get_fast_path_share():.1%}')
+            times[run] = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    print(f'Parsing {len(names)} names. cold: {times["cold"]:.2f}s. warm: {times["warm"]:.2f}s.')
+    return times
+
+
+class DictPerson:                                                   # pylint: disable=R0903
+    """
+    Person layout before Person used __slots__ and packed positions/aliases: attributes in a
+    __dict__, un-interned strings, and two Counters. Used as the reference in
+    benchmark_person_memory
+    """
+    def __init__(self, person):
+        """
+        :param person: Person to copy the data from
+        """
+        self.last = ''.join(list(person.last))
+        self.first = ''.join(list(person.first))
+        self.middle = ''.join(list(person.middle))
+        self.positions = Counter({''.join(list(position)): count
+                                  for position, count in person.position_items()})
+        self.aliases = Counter({''.join(list(alias)): count
+                                for alias, count in person.alias_items()})
+        self.count = person.count
+
+
+def get_allocated_bytes(create_objects):
+    """
+    Returns the objects created by create_objects and the number of bytes they hold
+    :param create_objects: function without arguments that returns the objects to measure
+    :return: object, int
+    """
+    tracemalloc.start()
+    start_size = tracemalloc.get_traced_memory()[0]
+    objects = create_objects()
+    size = tracemalloc.get_traced_memory()[0] - start_size
+    tracemalloc.stop()
+    return objects, size
+
+
+def benchmark_person_memory(names=None):
+    """
+    Measures the memory per person of compact Persons (__slots__, interned strings, packed
+    positions and aliases) against the previous layout with a __dict__ and two Counters.
+
+    :param names: dict of raw names and counts. Defaults to tobacco_names_raw_test.json
+    :return: dict with the bytes per person of both layouts
+    """
+    if names is None:
+        names = load_test_names()
+
+    # parse all names first so that the measurements do not include the parse cache
+    Person.parse_many(list(names))
+
+    def create_people():
+        people = []
+        for name, count in names.items():
+            try:
+                people.append(Person(name_raw=name, count=count))
+            except IndexError:
+                pass
+        return people
+
+    people, compact_size = get_allocated_bytes(create_people)
+    _, dict_size = get_allocated_bytes(lambda: [DictPerson(person) for person in people])
+    NAME_PARSE_CACHE.clear()
+
+    results = {'dict': dict_size / len(people), 'compact': compact_size / len(people)}
+    print(f'Memory of {len(people)} persons. dict + Counters: {results["dict"]:.0f} bytes per '
+          f'person. compact: {results["compact"]:.0f} bytes per person.')
+    return results
+
+
+def classify_names_one_by_one(names, raw_org_to_clean_org_dict):
+    """
+    Classifies names the way parse_authors_or_recipients_of_doc did before classify_names:
+    creates a Person for every name. Kept as the reference for benchmark_name_classification
+    :param names: list of str
+    :param raw_org_to_clean_org_dict: dict
+    :return: dict of label -> Counter of names (like the counters of
+    parse_authors_or_recipients_of_doc)
+    """
+    counters = {label: Counter() for label in ['valid', 'organization_from_person', 'invalid',
+                                               'error']}
+    for name in names:
+        try:
+            if name in raw_org_to_clean_org_dict or len(name) < 4:
+                continue
+            person = Person(name_raw=name)
+            if person.check_if_this_person_looks_valid():
+                counters['valid'][name] += 1
+            elif check_if_name_looks_like_an_organization(name):
+                counters['organization_from_person'][name] += 1
+            else:
+                counters['invalid'][name] += 1
+        except:    # pylint: disable=W0702
+            counters['error'][name] += 1
+    return counters
+
+
+def benchmark_name_classification(names=None):
+    """
+    Compares classify_names against creating one Person per name. All names get parsed before
+    (as create_db_of_1970s_docs_from_csv does), so this measures the classification itself.
+    Raises a ValueError if the two produce different counters.
+
+    :param names: list of raw names (str). Defaults to the names in tobacco_names_raw_test.json
+    :return: dict with the time in seconds each implementation took
+    """
+    if names is None:
+        names = list(load_test_names())
+
+    NAME_PARSE_CACHE.clear()
+    Person.parse_many(names)
+
+    start_time = time.time()
+    loop_counters = classify_names_one_by_one(names, ORG_DICTIONARY.raw_to_clean)
+    loop_time = time.time() - start_time
+
+    start_time = time.time()
+    labels = classify_names(names, ORG_DICTIONARY.raw_to_clean)
+    label_of_name = dict(zip(labels.index, labels))
+    counters = {label: Counter() for label in loop_counters}
+    for name in names:
+        if label_of_name[name] in counters:
+            counters[label_of_name[name]][name] += 1
+    vectorized_time = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    if counters != loop_counters:
+        raise ValueError('classify_names produced different counters than the Person loop')
+
+    print(f'Classification of {len(names)} names. Person loop: {loop_time:.2f}s. '
+          f'classify_names: {vectorized_time:.2f}s. Counts: '
+          f'{ {label: sum(counter.values()) for label, counter in counters.items()} }')
+    return {'loop': loop_time, 'vectorized': vectorized_time}
+
+
+def get_import_time(statement, runs=5):
+    """
+    Runs statement in fresh interpreters and returns the median time it took
+    :param statement: str (python code)
+    :param runs: int
+    :return: float (seconds)
+    """
+    code = f'import time\nstart = time.perf_counter()\n{statement}\n' \
+           f'print(time.perf_counter() - start)'
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout
+        times.append(float(output.strip().split('\n')[-1]))
+    return statistics.median(times)
+
+
+def benchmark_import_time(runs=5):
+    """
+    Measures how long importing the name disambiguation modules takes in a fresh interpreter,
+    and how long the first use of the org dictionary takes (loading the precompiled file vs.
+    rebuilding it from the json).
+
+    :param runs: int, number of fresh interpreters per measurement
+    :return: dict with times in seconds
+    """
+    times = {}
+    for module in ['name_disambiguation.clean_org_names', 'name_disambiguation.person',
+                   'name_disambiguation.people_db']:
+        times[module] = get_import_time(f'import {module}', runs)
+
+    # make sure the precompiled file exists before measuring the warm load
+    OrgDictionary().load()
+    times['org dictionary (precompiled)'] = get_import_time(
+        'from name_disambiguation.clean_org_names import ORG_DICTIONARY\n'
+        'ORG_DICTIONARY.matcher', runs)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        org_dictionary = OrgDictionary(file_path=Path(temp_dir, 'clean_org_names.pickle'))
+        start_time = time.perf_counter()
+        org_dictionary.load()
+        times['org dictionary (rebuilt)'] = time.perf_counter() - start_time
+
+    for name, seconds in times.items():
+        print(f'{name}: {seconds * 1000:.1f}ms')
+    return times
+
+
+if __name__ == '__main__':
+    benchmark_org_extraction()
+    benchmark_persistent_parse_store()
+    benchmark_person_memory()
+    benchmark_import_time()
+    benchmark_name_classification()
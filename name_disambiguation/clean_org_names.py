@@ -1,13 +1,29 @@
 """
 Contains helper function to get RAW_ORG_TO_CLEAN_ORG_DICT (convert raw org names to clean names)
+and the RawOrgMatcher that finds those raw org names inside of raw name strings.
+Both get loaded lazily through ORG_DICTIONARY, which keeps them in a precompiled pickle file
+that gets rebuilt whenever clean_org_names_to_raw_org_names.json changes.
 """
 from pathlib import Path
 import json
+import os
+import pickle
+import re
+from name_disambiguation.atomic_file import atomic_write
 from name_disambiguation.config import DATA_PATH
+from name_disambiguation.parse_store import ORG_NAMES_PATH, get_file_fingerprint
 
+ORG_DICTIONARY_PATH = Path(DATA_PATH, 'name_disambiguation', 'clean_org_names.pickle')
 
-def get_clean_org_names(file_name=Path(DATA_PATH, 'name_disambiguation',
-                                       'clean_org_names_to_raw_org_names.json')):
+# increase whenever a change to get_clean_org_names or RawOrgMatcher changes what gets stored in
+# the ORG_DICTIONARY_PATH file
+ORG_DICTIONARY_VERSION = 1
+
+# characters that end the literal prefix of a raw org name (raw org names are used as regexes)
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\|()')
+
+
+def get_clean_org_names(file_name=ORG_NAMES_PATH):
     """
     Create dict that maps raw organization names to clean organization names
     by inverting a dict that maps clean names to raw names
@@ -15,7 +31,7 @@ def get_clean_org_names(file_name=Path(DATA_PATH, 'name_disambiguation',
     :return: dict, maps raw organization names to clean organization names
     """
     # read clean_org_names
-    with open(file_name, 'r') as infile:
+    with open(file_name, 'r', encoding='utf-8') as infile:
         name_dict = json.load(infile)
 
     # invert dict
@@ -31,4 +47,275 @@ def get_clean_org_names(file_name=Path(DATA_PATH, 'name_disambiguation',
 
     return inv_name_dict
 
-RAW_ORG_TO_CLEAN_ORG_DICT = get_clean_org_names()
+
+def get_literal_prefix(raw_org):
+    """
+    Returns the part of a raw org name that every regex match of it has to start with, i.e.
+    everything up to the first regex metacharacter.
+
+    >>> get_literal_prefix('B&W')
+    'B&W'
+    >>> get_literal_prefix('R.J. Reynolds')
+    'R'
+    >>> get_literal_prefix('BAT (UK and Export) Limited')
+    'BAT '
+
+    :param raw_org: str
+    :return: str (empty if the raw org name could start with anything)
+    """
+    # a top level alternation could start with either branch -> no common prefix
+    if '|' in raw_org:
+        return ''
+
+    prefix = []
+    for char in raw_org:
+        if char in REGEX_METACHARACTERS:
+            # a quantifier makes the preceding character optional
+            if char in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+class RawOrgMatcher:
+    """
+    Finds all raw org names of a raw_org_to_clean_org dict that can occur in a string with a
+    single scan.
+    The literal prefixes of all raw org names are compiled into an Aho-Corasick automaton,
+    which returns (a superset of) the raw orgs present in a string. Only those candidates then
+    get checked with their (precompiled) word boundary regex.
+
+    Attributes:
+        raw_orgs (list of str): raw org names in the order of the dict
+        clean_orgs (list of str): clean org names, same order as raw_orgs
+        patterns (list of compiled regexes): word boundary regex of each raw org, same order as
+                                            raw_orgs. Compiling all of them takes a while, so
+                                            use get_pattern to compile only the ones needed
+    """
+    def __init__(self, raw_org_to_clean_org_dict):
+        """
+        Builds the automaton from a dict that maps raw org names to clean org names
+        :param raw_org_to_clean_org_dict: dict
+        """
+        self.raw_orgs = list(raw_org_to_clean_org_dict.keys())
+        self.clean_orgs = list(raw_org_to_clean_org_dict.values())
+        self._patterns = [None] * len(self.raw_orgs)
+
+        # raw orgs without a literal prefix are candidates for every string
+        self._always_candidates = set()
+
+        # automaton states: transitions, fail links, and the raw org ids found in each state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for raw_org_id, raw_org in enumerate(self.raw_orgs):
+            prefix = get_literal_prefix(raw_org)
+            if not prefix:
+                self._always_candidates.add(raw_org_id)
+                continue
+
+            state = 0
+            for char in prefix:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].add(raw_org_id)
+
+        # breadth first pass to set fail links and merge outputs of suffix states
+        queue = list(self._goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and char not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def __len__(self):
+        """
+        :return: int (number of raw org names in the matcher)
+        """
+        return len(self.raw_orgs)
+
+    def __getstate__(self):
+        """
+        Returns the state for pickling without the compiled regexes
+        :return: dict
+        """
+        state = self.__dict__.copy()
+        state['_patterns'] = [None] * len(self.raw_orgs)
+        return state
+
+    @property
+    def patterns(self):
+        """
+        :return: list of compiled regexes (see get_pattern)
+        """
+        return [self.get_pattern(raw_org_id) for raw_org_id in range(len(self.raw_orgs))]
+
+    def get_pattern(self, raw_org_id):
+        """
+        Returns the word boundary regex of a raw org, compiling it on first use
+        :param raw_org_id: int (position of the raw org in raw_orgs)
+        :return: compiled regex
+        """
+        pattern = self._patterns[raw_org_id]
+        if pattern is None:
+            pattern = re.compile(r'\b' + self.raw_orgs[raw_org_id] + r'\b')
+            self._patterns[raw_org_id] = pattern
+        return pattern
+
+    def get_candidate_ids(self, text):
+        """
+        Scans text once and returns the ids of all raw orgs that could match it, sorted by their
+        position in the raw_org_to_clean_org dict.
+        Every raw org whose regex matches text is guaranteed to be included.
+
+        :param text: str
+        :return: list of int
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        candidate_ids = set(self._always_candidates)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                candidate_ids |= output[state]
+
+        return sorted(candidate_ids)
+
+
+class OrgDictionary:
+    """
+    Lazily loaded raw_org_to_clean_org dict and RawOrgMatcher.
+    Nothing gets loaded until raw_to_clean or matcher are used for the first time. Then both
+    get read from a pickle file, which stores them together with the modification time, size,
+    and hash of the json they were built from. If the json changed since, they get rebuilt
+    from the json and the pickle file gets replaced.
+
+    Attributes:
+        json_path (Path): clean_org_names_to_raw_org_names.json
+        file_path (Path): pickle file with the precompiled dict and matcher
+        rebuilt (bool): if the dict and matcher had to be built from the json (None until
+                        they get loaded)
+    """
+    def __init__(self, json_path=ORG_NAMES_PATH, file_path=ORG_DICTIONARY_PATH):
+        """
+        :param json_path: Path
+        :param file_path: Path
+        """
+        self.json_path = json_path
+        self.file_path = file_path
+        self.rebuilt = None
+        self._raw_to_clean = None
+        self._matcher = None
+
+    @property
+    def raw_to_clean(self):
+        """
+        dict that maps raw org names (incl. upper case versions) to clean org names
+        :return: dict
+        """
+        if self._raw_to_clean is None:
+            self.load()
+        return self._raw_to_clean
+
+    @property
+    def matcher(self):
+        """
+        RawOrgMatcher for all raw org names of raw_to_clean
+        :return: RawOrgMatcher
+        """
+        if self._matcher is None:
+            self.load()
+        return self._matcher
+
+    def load(self):
+        """
+        Loads dict and matcher from the pickle file or, if the json changed, rebuilds them
+        :return: None
+        """
+        json_stat = os.stat(self.json_path)
+        stored = None
+        try:
+            with open(self.file_path, 'rb') as infile:
+                stored = pickle.load(infile)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # missing, partial, or written by an incompatible version -> rebuild
+            pass
+
+        if stored is not None and stored['version'] == ORG_DICTIONARY_VERSION:
+            # same modification time and size -> unchanged. Otherwise, compare the hash
+            if (stored['mtime'] == json_stat.st_mtime_ns and
+                    stored['size'] == json_stat.st_size):
+                self._set(stored, rebuilt=False)
+                return
+            if stored['fingerprint'] == get_file_fingerprint(self.json_path):
+                stored.update({'mtime': json_stat.st_mtime_ns, 'size': json_stat.st_size})
+                self._store(stored)
+                self._set(stored, rebuilt=False)
+                return
+
+        raw_to_clean = get_clean_org_names(self.json_path)
+        stored = {
+            'version': ORG_DICTIONARY_VERSION,
+            'mtime': json_stat.st_mtime_ns,
+            'size': json_stat.st_size,
+            'fingerprint': get_file_fingerprint(self.json_path),
+            'raw_to_clean': raw_to_clean,
+            'matcher': RawOrgMatcher(raw_to_clean)
+        }
+        self._store(stored)
+        self._set(stored, rebuilt=True)
+
+    def _set(self, stored, rebuilt):
+        """
+        :param stored: dict with raw_to_clean and matcher
+        :param rebuilt: bool
+        :return: None
+        """
+        self._raw_to_clean = stored['raw_to_clean']
+        self._matcher = stored['matcher']
+        self.rebuilt = rebuilt
+
+    def _store(self, stored):
+        """
+        Writes the pickle file (to a temporary file first so readers never see a partial file).
+        If the data folder is not writable, the dict and matcher just do not get stored.
+        :param stored: dict
+        :return: None
+        """
+        try:
+            with atomic_write(self.file_path) as outfile:
+                pickle.dump(stored, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+
+
+ORG_DICTIONARY = OrgDictionary()
+
+
+def __getattr__(name):
+    """
+    Keeps RAW_ORG_TO_CLEAN_ORG_DICT and RAW_ORG_MATCHER importable from this module. They get
+    loaded when they are first imported
+    :param name: str
+    :return: dict or RawOrgMatcher
+    """
+    if name == 'RAW_ORG_TO_CLEAN_ORG_DICT':
+        return ORG_DICTIONARY.raw_to_clean
+    if name == 'RAW_ORG_MATCHER':
+        return ORG_DICTIONARY.matcher
+    raise AttributeError(f'module {__name__} has no attribute {name}')
@@ -8,6 +8,9 @@ from pathlib import Path
 
 DATA_PATH = Path(Path(os.path.abspath(os.path.dirname(__file__))).parent, 'data')
 
+# maximum number of raw names whose parse results are kept in memory (see NameParseCache)
+NAME_PARSE_CACHE_SIZE = 200000
+
 COMPANY_ABBREVIATIONS_TO_SKIP = {
     'b&w', 'ctr', 'lorillard', 'rjr', 'philip morris', 'ti', 't.i.',
     'ftc',
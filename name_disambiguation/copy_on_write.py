@@ -0,0 +1,127 @@
+"""
+Copy-on-write snapshots of a PeopleDatabase (see CopyOnWriteMixin.copy).
+A copy shares the containers, index sets and persons of the db it was copied from, and each of
+them gets copied by the first db that changes it.
+"""
+
+from name_disambiguation.person import Person
+
+
+class CopyOnWriteMixin:
+    """
+    Methods of PeopleDatabase that create copy-on-write copies and keep them apart. Uses the
+    _shares_containers, _shared_person_id_limit, _owned_person_ids and _owned_index_keys
+    attributes of PeopleDatabase.
+    """
+    def unshare_containers(self):
+        """
+        Copies the containers that are shared with a copy of the db (see copy): people, the last
+        name and alias indexes, _alias_to_person_dict and raw_org_to_clean_org_dict. Has to be
+        called before any of them gets changed. The sets in the indexes stay shared (see
+        get_index_set)
+        :return: None
+        """
+        if self._shares_containers:
+            self.people = self.people.copy()
+            self._alias_to_person_dict = self._alias_to_person_dict.copy()
+            self._last_name_to_people = self._last_name_to_people.copy()
+            self._alias_to_person_ids = self._alias_to_person_ids.copy()
+            self.raw_org_to_clean_org_dict = self.raw_org_to_clean_org_dict.copy()
+            self._shares_containers = False
+
+    def get_index_set(self, index_name, key):
+        """
+        Returns the set of _last_name_to_people or _alias_to_person_ids under key, ready to be
+        changed: sets that are still shared with a copy of the db (see copy) get copied first
+        :param index_name: str, '_last_name_to_people' or '_alias_to_person_ids'
+        :param key: str, last name or alias
+        :return: set
+        """
+        self.unshare_containers()
+        index = getattr(self, index_name)
+        if self._owned_index_keys is not None and self._owned_index_keys[index_name] is not None:
+            owned_keys = self._owned_index_keys[index_name]
+            if key not in owned_keys:
+                owned_keys.add(key)
+                index[key] = set(index[key]) if key in index else set()
+                # once every set of the index is owned, no set is shared anymore
+                if len(owned_keys) >= len(index):
+                    self._owned_index_keys[index_name] = None
+        return index[key]
+
+    def delete_index_key(self, index_name, key):
+        """
+        Deletes an (empty) set from _last_name_to_people or _alias_to_person_ids
+        :param index_name: str, '_last_name_to_people' or '_alias_to_person_ids'
+        :param key: str, last name or alias
+        :return: None
+        """
+        del getattr(self, index_name)[key]
+        if self._owned_index_keys is not None and self._owned_index_keys[index_name] is not None:
+            # a set added under the key later is not shared
+            self._owned_index_keys[index_name].discard(key)
+
+    def own_person(self, person: Person):
+        """
+        Returns a person of the db that can be changed in place. Persons that may be shared with
+        a copy of the db (see copy) get replaced in the db and its indexes by a clone first.
+        Entries of the _alias_to_person_dict get moved to the clone for the aliases and the full
+        name of the person.
+        Persons whose last name or aliases change still have to be removed before and added
+        again after the change (see remove_person)
+        :param person: Person in the db
+        :return: Person (the person or its clone)
+        """
+        if (
+                person.person_id is None or
+                person.person_id >= self._shared_person_id_limit or
+                person.person_id in self._owned_person_ids
+        ):
+            return person
+
+        self.unshare_containers()
+        clone = person.clone()
+        self._owned_person_ids.add(person.person_id)
+        # persons are equal by person_id -> remove the shared person before adding the clone
+        self.people.discard(person)
+        self.people.add(clone)
+        last_name_people = self.get_index_set('_last_name_to_people', person.last)
+        last_name_people.discard(person)
+        last_name_people.add(clone)
+        for alias in list(person.alias_keys()) + [person.full_name]:
+            if self._alias_to_person_dict.get(alias.lower()) is person:
+                self._alias_to_person_dict[alias.lower()] = clone
+        return clone
+
+    def copy(self):
+        """
+        Copies a people_db object as a copy-on-write snapshot: both dbs share their containers,
+        the sets in their last name and alias indexes and their persons until one of them
+        changes them (see unshare_containers, get_index_set and own_person). Nothing gets copied
+        up front, so copying a large db takes microseconds, and every change only copies what
+        it touches.
+        Only changes made through PeopleDatabase methods are kept apart. Persons taken from
+        people, the indexes or get_person_from_alias of either db are shared with the other db
+        and must not be changed directly: use own_person to get a person that can be changed,
+        or clone it (as generate_people_network does for the persons of its network).
+        :return: a copied people_db object
+        """
+        # pylint: disable=W0212
+        people_db_copy = type(self).__new__(type(self))
+        people_db_copy.people = self.people
+        people_db_copy.next_person_id = self.next_person_id
+        people_db_copy._alias_to_person_dict = self._alias_to_person_dict
+        people_db_copy._last_name_to_people = self._last_name_to_people
+        people_db_copy._alias_to_person_ids = self._alias_to_person_ids
+        people_db_copy.raw_org_to_clean_org_dict = self.raw_org_to_clean_org_dict
+        people_db_copy.post_load_fingerprint = self.post_load_fingerprint
+        people_db_copy.merge_log = None
+
+        # from now on, all current containers, index sets and persons are shared by both dbs
+        for people_db in [self, people_db_copy]:
+            people_db._shares_containers = True
+            people_db._shared_person_id_limit = self.next_person_id
+            people_db._owned_person_ids = set()
+            people_db._owned_index_keys = {'_last_name_to_people': set(),
+                                           '_alias_to_person_ids': set()}
+        return people_db_copy
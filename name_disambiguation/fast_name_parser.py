@@ -0,0 +1,214 @@
+"""
+Fast path for splitting raw names into first, middle, last name and suffix.
+Most names in the archive come in a few simple shapes like "DUNN,WL", "Dunn, William L",
+"DUNN WL" (also "DUNN-WL" once parse_raw_name has replaced the dash) or "TEAGUE CE JR".
+split_name handles those shapes directly with the same rules as nameparser's HumanName and only
+hands everything else to HumanName.
+"""
+
+import re
+import unittest
+from collections import Counter
+
+from nameparser import HumanName
+from nameparser.config import CONSTANTS
+
+# one or two groups of letter-only words, separated by a single comma
+SIMPLE_NAME_REGEX = re.compile(r'^ *([A-Za-z]+(?: +[A-Za-z]+)*) *'
+                               r'(?:, *([A-Za-z]+(?: +[A-Za-z]+)*) *)?$')
+
+# set to False to send every name through HumanName (e.g. to compare both paths in tests)
+USE_FAST_PATH = True
+
+# counts how many names took the 'fast_path' and how many went to 'nameparser'
+NAME_SPLIT_COUNTER = Counter()
+
+
+def configure_nameparser():
+    """
+    Removes all titles from nameparser's CONSTANTS so that e.g. "JUDGE" or "DEAN" get parsed as
+    names. Runs before the first name gets split rather than on import because CONSTANTS are
+    shared with every other user of nameparser in the process.
+    :return: None
+    """
+    if len(CONSTANTS.titles) > 0:
+        CONSTANTS.titles.remove(*CONSTANTS.titles)
+
+
+def is_initial(piece):
+    """
+    Same as HumanName.is_an_initial for letter-only pieces: a single uppercase letter
+    :param piece: str
+    :return: bool
+    """
+    return bool(CONSTANTS.regexes.initial.match(piece))
+
+
+def is_suffix(piece):
+    """
+    Same as HumanName.is_suffix for letter-only pieces, e.g. "JR" or "PHD" but not "V"
+    :param piece: str
+    :return: bool
+    """
+    return (
+        (piece.lower() in CONSTANTS.suffix_acronyms or
+         piece.lower() in CONSTANTS.suffix_not_acronyms) and
+        not is_initial(piece)
+    )
+
+
+def needs_nameparser(piece):
+    """
+    Returns True if a piece could be a title, conjunction or last name prefix. HumanName joins
+    those with the pieces around them, which the fast path does not do.
+    :param piece: str
+    :return: bool
+    """
+    lower_piece = piece.lower()
+    return (
+        lower_piece in CONSTANTS.titles or
+        lower_piece in CONSTANTS.prefixes or
+        (lower_piece in CONSTANTS.conjunctions and not is_initial(piece))
+    )
+
+
+def fast_split_name(name_raw):
+    """
+    Splits names of the simple shapes "LAST, FIRST [MIDDLE...] [SUFFIX...]" and
+    "FIRST [MIDDLE...] LAST [SUFFIX...]" (letters only) exactly like HumanName does.
+    Returns None for any other name.
+
+    >>> fast_split_name('DUNN,WL')
+    ('WL', '', 'DUNN', '')
+    >>> fast_split_name('Dunn, William Lee')
+    ('William', 'Lee', 'Dunn', '')
+    >>> fast_split_name('Dunn, W. L.') is None
+    True
+
+    :param name_raw: str
+    :return: tuple (first, middle, last, suffix) of str or None
+    """
+    match = SIMPLE_NAME_REGEX.match(name_raw)
+    if not match:
+        return None
+
+    # HumanName moves "ph d" to the suffixes before it splits the name
+    if CONSTANTS.regexes.phd.search(name_raw):
+        return None
+
+    before_comma = match.group(1).split()
+    after_comma = match.group(2).split() if match.group(2) else None
+    for piece in before_comma + (after_comma or []):
+        if needs_nameparser(piece):
+            return None
+
+    first = []
+    middle = []
+    last = []
+    suffix = []
+
+    if after_comma is None:
+        # no comma: first middle middle last suffix
+        first.append(before_comma[0])
+        pieces = before_comma
+        for i in range(1, len(pieces)):
+            next_piece = pieces[i + 1] if i + 1 < len(pieces) else None
+            if (
+                    all(is_suffix(piece) for piece in pieces[i + 1:]) or
+                    (next_piece and CONSTANTS.regexes.roman_numeral.match(next_piece) and
+                     i == len(pieces) - 2 and not is_initial(pieces[i]))
+            ):
+                last.append(pieces[i])
+                suffix += pieces[i + 1:]
+                break
+            middle.append(pieces[i])
+
+    else:
+        # "last suffix, first suffix" would be parsed as "first last, suffix" by HumanName
+        if all(is_suffix(piece) for piece in after_comma) and len(before_comma) > 1:
+            return None
+
+        # last comma: last [suffix], first middle [suffix]
+        for piece in before_comma:
+            if is_suffix(piece) and last:
+                suffix.append(piece)
+            else:
+                last.append(piece)
+        first.append(after_comma[0])
+        for piece in after_comma[1:]:
+            if is_suffix(piece):
+                suffix.append(piece)
+            else:
+                middle.append(piece)
+
+    return ' '.join(first), ' '.join(middle), ' '.join(last), ', '.join(suffix)
+
+
+def split_name(name_raw):
+    """
+    Splits a name into first, middle, last name and suffix: with fast_split_name if possible,
+    otherwise with HumanName.
+
+    :param name_raw: str
+    :return: tuple (first, middle, last, suffix) of str
+    """
+    configure_nameparser()
+    if USE_FAST_PATH:
+        result = fast_split_name(name_raw)
+        if result is not None:
+            NAME_SPLIT_COUNTER['fast_path'] += 1
+            return result
+
+    NAME_SPLIT_COUNTER['nameparser'] += 1
+    name = HumanName(name_raw)
+    return name.first, name.middle, name.last, name.suffix
+
+
+def get_fast_path_share():
+    """
+    Returns the share of names that split_name handled without HumanName
+    :return: float (0 if no names have been split yet)
+    """
+    total = NAME_SPLIT_COUNTER['fast_path'] + NAME_SPLIT_COUNTER['nameparser']
+    return NAME_SPLIT_COUNTER['fast_path'] / total if total else 0.0
+
+
+class TestFastNameParser(unittest.TestCase):
+    """
+    Tests that the fast path splits names exactly like HumanName
+    """
+    def test_fast_path(self):
+        """
+        Compares both paths on common shapes and edge cases (suffixes, prefixes, conjunctions,
+        roman numerals)
+        """
+        names = [
+            'DUNN,WL', 'DUNN, WL', 'Dunn, William L', 'Dunn, William Lee', 'DUNN WL', 'DUNN W',
+            'TEAGUE CE JR', 'teague ce jr', 'Baker, JR', 'D Cantrell', 'A B Cantrell',
+            'William Lee Dunn', 'SMITH, E', 'Smith e Jones', 'VAN BUREN, M', 'de la Vega, J',
+            'SMITH JONES IV', 'SMITH J IV', 'Jones, Jr, Bob', 'Smith Jr, Bob', 'Smith, Bob Jr',
+            'JOHN SMITH PH D', 'Smith, MD', 'TEMKO', 'TEMKO PM', 'Hughes, Ivor Wallace',
+            'JONES AND SMITH', 'Jones & Smith', 'DUNN V', 'DUNN v', 'Dunn, II',
+        ]
+        for name in names:
+            human_name = HumanName(name)
+            expected = (human_name.first, human_name.middle, human_name.last, human_name.suffix)
+            fast_result = fast_split_name(name)
+            if fast_result is not None:
+                self.assertEqual(fast_result, expected, msg=name)
+
+    def test_fast_path_share(self):
+        """
+        Simple names should take the fast path, names with periods should not
+        """
+        NAME_SPLIT_COUNTER.clear()
+        split_name('DUNN,WL')
+        split_name('Dunn, William L')
+        split_name('DUNN WL')
+        split_name('Dunn, W. L.')
+        self.assertEqual(NAME_SPLIT_COUNTER['fast_path'], 3)
+        self.assertEqual(get_fast_path_share(), 0.75)
+
+
+if __name__ == '__main__':
+    unittest.main()
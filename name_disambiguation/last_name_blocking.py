@@ -0,0 +1,291 @@
+"""
+Finds last names that are probably spelling or OCR variants of each other, e.g. "WAKEHAM" and
+"WAKEHAN" or "AHRENSFELD" and "ARENSFELD".
+Comparing all pairs of last names is too slow for large people databases. Instead, last names
+get grouped by their Soundex key and only names within a group get compared, through a BK-tree
+that finds all names within a maximum edit distance without comparing every pair.
+"""
+
+import random
+import re
+import unittest
+from collections import defaultdict
+
+SOUNDEX_CODES = {}
+for soundex_letters, soundex_code in [('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'), ('L', '4'),
+                                      ('MN', '5'), ('R', '6')]:
+    for soundex_letter in soundex_letters:
+        SOUNDEX_CODES[soundex_letter] = soundex_code
+
+NON_LETTERS_REGEX = re.compile(r'[^A-Z]')
+
+
+def soundex(name):
+    """
+    Returns the (American) Soundex key of a name: its first letter followed by three digits
+    for the following consonants. Similar sounding names get the same key.
+
+    >>> soundex('Wakeham'), soundex('Wakehan')
+    ('W250', 'W250')
+    >>> soundex('Ahrensfeld'), soundex('Arensfeld')
+    ('A652', 'A652')
+
+    :param name: str
+    :return: str ('' for names without letters)
+    """
+    letters = NON_LETTERS_REGEX.sub('', name.upper())
+    if not letters:
+        return ''
+
+    key = letters[0]
+    previous_code = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        code = SOUNDEX_CODES.get(letter, '')
+        if code and code != previous_code:
+            key += code
+            if len(key) == 4:
+                break
+        # H and W do not separate letters with the same code, vowels do
+        if letter not in 'HW':
+            previous_code = code
+    return key.ljust(4, '0')
+
+
+def strip_common_affixes(word1, word2):
+    """
+    Removes the longest common prefix and then the longest common suffix of two words
+
+    >>> strip_common_affixes('wakeham', 'wakehan')
+    ('m', 'n')
+
+    :param word1: str
+    :param word2: str
+    :return: str, str
+    """
+    start = 0
+    while start < len(word1) and start < len(word2) and word1[start] == word2[start]:
+        start += 1
+    end = 0
+    while (end < len(word1) - start and end < len(word2) - start and
+           word1[-1 - end] == word2[-1 - end]):
+        end += 1
+    return word1[start:len(word1) - end], word2[start:len(word2) - end]
+
+
+def levenshtein_distance(word1, word2):
+    """
+    Returns the number of insertions, deletions and substitutions needed to turn word1 into
+    word2.
+    Uses the bit-parallel algorithm of Myers (1999) in the formulation of Hyyrö (2001): one
+    column of the dynamic programming table is stored as the bits of two ints, so every
+    character of the longer word takes a few int operations instead of a loop over the shorter
+    word.
+    :param word1: str
+    :param word2: str
+    :return: int
+    """
+    # common prefixes and suffixes do not change the distance
+    word1, word2 = strip_common_affixes(word1, word2)
+
+    if len(word1) < len(word2):
+        word1, word2 = word2, word1
+    if not word2:
+        return len(word1)
+
+    # bit i of char_masks[char] is set if word2[i] == char
+    char_masks = {}
+    for idx, char in enumerate(word2):
+        char_masks[char] = char_masks.get(char, 0) | (1 << idx)
+    mask = (1 << len(word2)) - 1
+    last_bit = 1 << (len(word2) - 1)
+
+    # bits of the vertical +1/-1 differences between neighboring cells of the column
+    plus_vertical = mask
+    minus_vertical = 0
+    distance = len(word2)
+    for char in word1:
+        char_mask = char_masks.get(char, 0)
+        x_vertical = char_mask | minus_vertical
+        x_horizontal = (((char_mask & plus_vertical) + plus_vertical) ^ plus_vertical) | char_mask
+        plus_horizontal = minus_vertical | ~(x_horizontal | plus_vertical)
+        minus_horizontal = plus_vertical & x_horizontal
+        if plus_horizontal & last_bit:
+            distance += 1
+        elif minus_horizontal & last_bit:
+            distance -= 1
+        plus_horizontal = ((plus_horizontal << 1) | 1) & mask
+        minus_horizontal = (minus_horizontal << 1) & mask
+        plus_vertical = minus_horizontal | (~(x_vertical | plus_horizontal) & mask)
+        minus_vertical = plus_horizontal & x_vertical
+    return distance
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of words. Every child of a node is stored under its edit distance to
+    the node, so a search only has to visit the children whose distance is within
+    max_distance of the distance between the node and the searched word.
+
+    Attributes:
+        root (list): [word, dict of distance -> child node] or None for an empty tree
+    """
+    def __init__(self, words=()):
+        """
+        Returns a BK-tree of words
+        :param words: iterable of str
+        """
+        self.root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        """
+        Adds a word to the tree
+        :param word: str
+        :return: None
+        """
+        if self.root is None:
+            self.root = [word, {}]
+            return
+
+        node = self.root
+        while True:
+            distance = levenshtein_distance(word, node[0])
+            if distance == 0:
+                return
+            if distance not in node[1]:
+                node[1][distance] = [word, {}]
+                return
+            node = node[1][distance]
+
+    def search(self, word, max_distance):
+        """
+        Returns all words of the tree within max_distance of word
+        :param word: str
+        :param max_distance: int
+        :return: list of (distance, word) tuples
+        """
+        results = []
+        nodes = [self.root] if self.root else []
+        while nodes:
+            node_word, children = nodes.pop()
+            distance = levenshtein_distance(word, node_word)
+            if distance <= max_distance:
+                results.append((distance, node_word))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return results
+
+
+def find_similar_last_names(last_names, max_distance=1, min_length=5):
+    """
+    Returns pairs of last names with the same Soundex key and an edit distance of at most
+    max_distance. Short names get skipped because too many of them are one edit apart
+    (e.g. "LEE" and "LEVY").
+
+    >>> find_similar_last_names(['WAKEHAM', 'WAKEHAN', 'WAKEFIELD', 'DUNN', 'DUNNE'])
+    [('WAKEHAM', 'WAKEHAN')]
+
+    :param last_names: iterable of str
+    :param max_distance: int
+    :param min_length: int, minimum length of both last names
+    :return: sorted list of (str, str) tuples, each pair sorted
+    """
+    soundex_to_last_names = defaultdict(list)
+    for last_name in sorted(set(last_names)):
+        if len(last_name) >= min_length:
+            soundex_to_last_names[soundex(last_name)].append(last_name)
+
+    similar_last_names = set()
+    for soundex_key, soundex_last_names in soundex_to_last_names.items():
+        if not soundex_key or len(soundex_last_names) < 2:
+            continue
+        bk_tree = BKTree(soundex_last_names)
+        for last_name in soundex_last_names:
+            for distance, other_last_name in bk_tree.search(last_name, max_distance):
+                if distance > 0:
+                    similar_last_names.add(tuple(sorted([last_name, other_last_name])))
+    return sorted(similar_last_names)
+
+
+class TestLastNameBlocking(unittest.TestCase):
+    """
+    Tests for Soundex keys, the BK-tree and finding similar last names
+    """
+    def test_soundex(self):
+        """
+        Standard Soundex examples, including H/W between letters with the same code
+        """
+        for name, key in [('Robert', 'R163'), ('Rupert', 'R163'), ('Rubin', 'R150'),
+                          ('Ashcraft', 'A261'), ('Tymczak', 'T522'), ('Pfister', 'P236'),
+                          ('Lee', 'L000'), ("D'Agostino", 'D223'), ('', '')]:
+            self.assertEqual(soundex(name), key, msg=name)
+
+    def test_levenshtein_distance(self):
+        """
+        Test edit distances
+        """
+        self.assertEqual(levenshtein_distance('KITTEN', 'SITTING'), 3)
+        self.assertEqual(levenshtein_distance('WAKEHAM', 'WAKEHAN'), 1)
+        self.assertEqual(levenshtein_distance('AHRENSFELD', 'ARENSFELD'), 1)
+        self.assertEqual(levenshtein_distance('', 'DUNN'), 4)
+        self.assertEqual(levenshtein_distance('DUNN', 'DUNN'), 0)
+        self.assertEqual(levenshtein_distance('AAB', 'AB'), 1)
+        self.assertEqual(levenshtein_distance('ABAB', 'AB'), 2)
+
+    def test_levenshtein_reference(self):
+        """
+        The bit-parallel distance has to be the same as the one of the textbook dynamic
+        programming algorithm on random words
+        """
+        def dynamic_programming_distance(word1, word2):
+            previous_row = list(range(len(word2) + 1))
+            for idx1, char1 in enumerate(word1, 1):
+                row = [idx1]
+                for idx2, char2 in enumerate(word2, 1):
+                    row.append(min(previous_row[idx2] + 1, row[idx2 - 1] + 1,
+                                   previous_row[idx2 - 1] + (char1 != char2)))
+                previous_row = row
+            return previous_row[-1]
+
+        random_generator = random.Random(0)
+        for _ in range(2000):
+            word1 = ''.join(random_generator.choice('ABC')
+                            for _ in range(random_generator.randint(0, 12)))
+            word2 = ''.join(random_generator.choice('ABC')
+                            for _ in range(random_generator.randint(0, 70)))
+            self.assertEqual(levenshtein_distance(word1, word2),
+                             dynamic_programming_distance(word1, word2), msg=(word1, word2))
+
+    def test_bk_tree_matches_all_pairs(self):
+        """
+        The BK-tree has to find the same words as comparing all words
+        """
+        words = ['DUNN', 'DUNNE', 'DUN', 'DUNNING', 'DONN', 'DAWN', 'WAKEHAM', 'WAKEHAN',
+                 'WAKEFIELD', 'WAKEMAN', 'TEAGUE', 'TEAGLE', 'TAGUE']
+        bk_tree = BKTree(words)
+        for word in words + ['DUNA', 'WAKE']:
+            for max_distance in range(4):
+                expected = sorted((levenshtein_distance(word, other_word), other_word)
+                                  for other_word in words
+                                  if levenshtein_distance(word, other_word) <= max_distance)
+                self.assertEqual(sorted(bk_tree.search(word, max_distance)), expected)
+
+    def test_find_similar_last_names(self):
+        """
+        Test candidate pairs
+        """
+        self.assertEqual(
+            find_similar_last_names(['AHRENSFELD', 'ARENSFELD', 'WAKEHAM', 'WAKEHAN', 'WAKEMAN',
+                                     'LEE', 'LEVY']),
+            [('AHRENSFELD', 'ARENSFELD'), ('WAKEHAM', 'WAKEHAN')])
+        self.assertEqual(find_similar_last_names(['WAKEHAM', 'WAKEMAN'], max_distance=2), [])
+        # LEE and LEVY are within the edit distance but have different Soundex keys
+        self.assertEqual(find_similar_last_names(['LEE', 'LEVY', 'LEVI'], max_distance=2,
+                                                 min_length=3),
+                         [('LEVI', 'LEVY')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+"""
+Manual merging of a PeopleDatabase (ManualMergeMixin.manually_merge_db) and its persisted
+decisions.
+Every answer to "Should these 2 people get merged?" gets stored under the full names of the two
+persons, so rebuilding a network only asks about pairs that have not been decided before and
+runs unattended once all pairs are decided.
+"""
+
+import itertools
+import json
+import tempfile
+import unittest
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from name_disambiguation.atomic_file import atomic_write
+from name_disambiguation.config import DATA_PATH
+from name_disambiguation.merge_log import MERGE_RULE_MANUAL_INPUT
+from name_disambiguation.person import Person
+
+MANUAL_MERGE_DECISIONS_PATH = Path(DATA_PATH, 'name_disambiguation',
+                                   'manual_merge_decisions.json')
+
+
+def get_pair_key(person1, person2):
+    """
+    Returns the key of a pair of persons in the decisions file: their full names in sorted
+    order, so that the key does not depend on the order of the persons
+
+    >>> get_pair_key(Person(name_raw='Dunn, William L'), Person(name_raw='DUNN,WL'))
+    'W. L. Dunn <-> William L. Dunn'
+
+    :param person1: Person
+    :param person2: Person
+    :return: str
+    """
+    return ' <-> '.join(sorted([person1.full_name, person2.full_name]))
+
+
+class ManualMergeDecisions:
+    """
+    Manual merge decisions, stored as a json dict of pair key (see get_pair_key) -> bool
+    (True: merge, False: keep apart).
+
+    Attributes:
+        file_path (Path): location of the json file or None to keep the decisions in memory
+        decisions (dict): pair key -> bool
+    """
+    def __init__(self, file_path=MANUAL_MERGE_DECISIONS_PATH):
+        """
+        Loads the decisions from file_path if it exists
+        :param file_path: Path or None
+        """
+        self.file_path = file_path
+        self.decisions = {}
+        if file_path is not None and Path(file_path).exists():
+            with open(str(file_path), 'r', encoding='utf-8') as infile:
+                self.decisions = json.load(infile)
+
+    def __len__(self):
+        return len(self.decisions)
+
+    def get(self, person1, person2):
+        """
+        Returns the decision for a pair of persons
+        :param person1: Person
+        :param person2: Person
+        :return: bool (True: merge, False: keep apart) or None if the pair is undecided
+        """
+        return self.decisions.get(get_pair_key(person1, person2))
+
+    def set(self, person1, person2, merge):
+        """
+        Stores the decision for a pair of persons. The file gets written right away, so no
+        answer gets lost if the merge gets interrupted
+        :param person1: Person
+        :param person2: Person
+        :param merge: bool
+        :return: None
+        """
+        self.decisions[get_pair_key(person1, person2)] = bool(merge)
+        self.store()
+
+    def store(self):
+        """
+        Writes the decisions to the json file (through a temporary file, so that the previous
+        decisions survive an interrupted write)
+        :return: None
+        """
+        if self.file_path is None:
+            return
+        with atomic_write(self.file_path, 'w', encoding='utf-8') as outfile:
+            json.dump(self.decisions, outfile, indent=2, sort_keys=True)
+
+
+class ManualMergeMixin:
+    """
+    Methods of PeopleDatabase that merge persons by user input and stored decisions
+    """
+    def manually_merge_db(self, decisions_path=MANUAL_MERGE_DECISIONS_PATH, interactive=True):
+        """
+        Manually merge the names in the database.
+        Allows user to merge, for example, "Kornegay, Horace A." with "Kornegay H.", which the
+        automated merger does not do.
+        Every answer gets stored in the decisions file (see ManualMergeDecisions) and gets
+        applied without asking on later runs, so only pairs that have not been decided before
+        need user input.
+        Relies on user input -> use only for small people databases.
+
+        :param decisions_path: Path of the decisions json file or None to not store decisions
+        :param interactive: bool, if False, undecided pairs do not get merged instead of asking
+        :return: Counter with the number of pairs that were decided by the user ('prompted'),
+                 decided by stored decisions ('stored'), or left undecided ('undecided'), and
+                 the number of merges ('merges')
+        """
+        decisions = ManualMergeDecisions(decisions_path)
+
+        last_name_to_candidates = defaultdict(list)
+        for person in self.people:
+            last = person.last.upper().replace('*', '')
+            last_name_to_candidates[last].append(person)
+
+        report = Counter()
+        for last_name in sorted(last_name_to_candidates):
+            report += self.manually_merge_last_name(last_name, decisions, interactive,
+                                                    last_name_to_candidates[last_name])
+        print(f"Manual merge: {report['merges']} merges. {report['stored']} pairs decided by "
+              f"{decisions_path}, {report['prompted']} by user input, {report['undecided']} "
+              f"undecided.")
+        return report
+
+    def manually_merge_last_name(self, last_name, decisions=None, interactive=True,
+                                 candidates=None):
+        """
+        manually merges everyone in the database with a given last name.
+        Every pair of candidates gets decided once, from the stored decisions or by user input.
+        After a merge, the later pairs of the two merged persons refer to the new person, and
+        every pair of current persons only gets decided once: after merging A and B, the merged
+        person gets compared to C through (A, C) only, not again through (B, C).
+
+        :param last_name: str
+        :param decisions: ManualMergeDecisions or None
+        :param interactive: bool, if False, undecided pairs do not get merged instead of asking
+        :param candidates: list of the persons whose last name (upper case, without '*') is
+                           last_name. Found by looking at all persons if None
+        :return: Counter (see manually_merge_db)
+        """
+        if candidates is None:
+            candidates = [person for person in self.people
+                          if person.last.upper().replace('*', '') == last_name]
+        candidates = sorted(candidates, key=lambda x: (-x.count, x.person_id))
+        # candidate person_id -> the person the candidate is part of now
+        current_persons = {person.person_id: person for person in candidates}
+        # after a merge, several candidate pairs can refer to the same pair of current persons,
+        # which only gets decided once
+        decided_pairs = set()
+
+        report = Counter()
+        for candidate1, candidate2 in itertools.combinations(candidates, 2):
+            person1 = current_persons[candidate1.person_id]
+            person2 = current_persons[candidate2.person_id]
+            pair = frozenset([person1.person_id, person2.person_id])
+            if person1 is person2 or pair in decided_pairs:
+                continue
+            if person1.first and person2.first and person1.first[0] != person2.first[0]:
+                print('skipping because of different first names', person1.full_name,
+                      person2.full_name)
+                continue
+
+            # decisions are stored for the candidates as they were before the manual merges
+            merge = decisions.get(candidate1, candidate2) if decisions is not None else None
+            if merge is not None:
+                report['stored'] += 1
+            elif not interactive:
+                report['undecided'] += 1
+                continue
+            else:
+                merge = self.ask_if_persons_should_be_merged(person1, person2)
+                if merge is None:
+                    # neither merge nor store anything -> asked again next time
+                    report['undecided'] += 1
+                    continue
+                report['prompted'] += 1
+                if decisions is not None:
+                    decisions.set(candidate1, candidate2, merge)
+
+            decided_pairs.add(pair)
+            if merge:
+                new_p = self.merge_two_persons(person1, person2, rule=MERGE_RULE_MANUAL_INPUT)
+                print("new", new_p)
+                report['merges'] += 1
+                current_persons = {
+                    person_id: new_p if person is person1 or person is person2 else person
+                    for person_id, person in current_persons.items()
+                }
+        return report
+
+    @staticmethod
+    def ask_if_persons_should_be_merged(person1, person2):
+        """
+        Asks the user if two persons should get merged
+        :param person1: Person
+        :param person2: Person
+        :return: bool or None if the answer was neither 'y' nor 'n'
+        """
+        print(f'\n\nMerge candidate: {person1.full_name} <-> {person2.full_name}')
+        print("\n", person1)
+        print("\n", person2)
+
+        selection = input("Should these 2 people get merged? (y/n):   ")
+        if selection not in ('y', 'n'):
+            return None
+        return selection == 'y'
+
+
+class TestManualMergeDecisions(unittest.TestCase):
+    """
+    Tests for storing and loading manual merge decisions
+    """
+    def test_round_trip(self):
+        """
+        Decisions have to be found for both orders of the persons, also after reloading
+        """
+        dunn_wl = Person(name_raw='DUNN,WL')
+        dunn_william = Person(name_raw='Dunn, William L')
+        dunn_frank = Person(name_raw='Dunn, Frank')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            decisions_path = Path(temp_dir, 'decisions.json')
+            decisions = ManualMergeDecisions(decisions_path)
+            decisions.set(dunn_wl, dunn_william, True)
+            decisions.set(dunn_frank, dunn_wl, False)
+
+            loaded_decisions = ManualMergeDecisions(decisions_path)
+            self.assertEqual(len(loaded_decisions), 2)
+            self.assertTrue(loaded_decisions.get(dunn_william, dunn_wl))
+            self.assertFalse(loaded_decisions.get(dunn_wl, dunn_frank))
+            self.assertIsNone(loaded_decisions.get(dunn_william, dunn_frank))
+
+
+if __name__ == '__main__':
+    unittest.main()
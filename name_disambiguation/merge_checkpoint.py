@@ -0,0 +1,150 @@
+"""
+Checkpoints of PeopleDatabase.merge_duplicates: the people db and the last fully merged last
+name, so that an interrupted merge can be resumed (see PeopleDatabase.load_merge_checkpoint)
+"""
+
+import copyreg
+import itertools
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from name_disambiguation.atomic_file import atomic_write
+from name_disambiguation.person import Person
+
+# increase whenever the content of merge_duplicates checkpoints changes
+MERGE_CHECKPOINT_VERSION = 1
+
+
+def write_merge_checkpoint(people_db, last_name, file_path, person_states=None):
+    """
+    Stores a merge_duplicates checkpoint: the people db and the last fully merged last name.
+    Writes to a temporary file first, so that an interrupted write never replaces the previous
+    checkpoint with a partial file
+    :param people_db: PeopleDatabase
+    :param last_name: str
+    :param file_path: Path
+    :param person_states: dict of id(person) -> Person.__getstate__() taken earlier, which gets
+                          pickled instead of the current state of the person, or None
+    :return: None
+    """
+    checkpoint = {'version': MERGE_CHECKPOINT_VERSION, 'last_name': last_name,
+                  'people_db': people_db}
+    with atomic_write(file_path) as outfile:
+        pickler = pickle.Pickler(outfile)
+        if person_states is not None:
+            pickler.dispatch_table = copyreg.dispatch_table.copy()
+            pickler.dispatch_table[Person] = lambda person: (
+                copyreg.__newobj__, (Person,), person_states[id(person)])
+        pickler.dump(checkpoint)
+
+
+class MergeCheckpointWriter:
+    """
+    Writes the checkpoints of merge_duplicates in the background, so the merge can go on while
+    a checkpoint gets pickled. Where os.fork is available, a forked child process writes the
+    checkpoint from its copy of the parent's memory and pickling does not hold the GIL of the
+    merging process. Elsewhere, a thread pickles a copy-on-write snapshot (PeopleDatabase.copy)
+    of the db with the states its persons had when the snapshot was taken. Checkpoints that
+    come up while the previous one is still being written get skipped.
+
+    Attributes:
+        file_path (Path): location of the checkpoint
+        interval (float): minimum number of seconds between two checkpoints
+        number_of_checkpoints (int): number of checkpoints started so far
+    """
+    def __init__(self, file_path, interval=60, use_fork=hasattr(os, 'fork')):
+        """
+        :param file_path: Path of the checkpoint
+        :param interval: float, seconds between two checkpoints
+        :param use_fork: bool, write in a forked process instead of a thread
+        """
+        self.file_path = file_path
+        self.interval = interval
+        self.number_of_checkpoints = 0
+        self._last_checkpoint_time = time.time()
+        self._use_fork = use_fork
+        self._executor = None if use_fork else ThreadPoolExecutor(max_workers=1)
+        # pid of the writing child process or future of the writing thread
+        self._pending = None
+
+    def write(self, people_db, last_name, force=False):
+        """
+        Starts writing a checkpoint if the interval has passed and the previous checkpoint is
+        written. Raises the errors of the previous write.
+        :param people_db: PeopleDatabase, merged up to and including last_name
+        :param last_name: str
+        :param force: bool, if True, waits for the previous write and ignores the interval
+        :return: bool, True if a checkpoint got started
+        """
+        if not force and time.time() - self._last_checkpoint_time < self.interval:
+            return False
+        if not self.wait(block=force):
+            return False
+
+        if self._use_fork:
+            sys.stdout.flush()
+            pid = os.fork()
+            if pid == 0:
+                # the child exits without the cleanup and exit handlers of the parent
+                # pylint: disable=W0212
+                try:
+                    write_merge_checkpoint(people_db, last_name, self.file_path)
+                except BaseException:       # pylint: disable=W0703
+                    os._exit(1)
+                os._exit(0)
+            self._pending = pid
+        else:
+            snapshot = people_db.copy()
+            # the merge goes on unpacking the aliases and positions of persons that the snapshot
+            # shares (see Person.aliases) -> take the states of the persons before handing the
+            # snapshot to the thread
+            person_states = {}
+            alias_persons = snapshot._alias_to_person_dict.values()    # pylint: disable=W0212
+            for person in itertools.chain(snapshot.people, alias_persons):
+                if id(person) not in person_states:
+                    person_states[id(person)] = person.__getstate__()
+            self._pending = self._executor.submit(write_merge_checkpoint, snapshot, last_name,
+                                                  self.file_path, person_states)
+        self._last_checkpoint_time = time.time()
+        self.number_of_checkpoints += 1
+        return True
+
+    def wait(self, block=True):
+        """
+        Checks if the previous checkpoint is written and raises its errors
+        :param block: bool, if True, waits until it is written
+        :return: bool, True if no checkpoint is being written anymore
+        """
+        if self._pending is None:
+            return True
+        if self._use_fork:
+            pid, status = os.waitpid(self._pending, 0 if block else os.WNOHANG)
+            if pid == 0:
+                return False
+            self._pending = None
+            if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+                raise OSError(f'Writing the checkpoint {self.file_path} failed.')
+        else:
+            if not block and not self._pending.done():
+                return False
+            future, self._pending = self._pending, None
+            future.result()
+        return True
+
+    def close(self, raise_errors=True):
+        """
+        Waits until the last checkpoint is written
+        :param raise_errors: bool, if True, raises the errors of the last write
+        :return: None
+        """
+        try:
+            self.wait()
+        except Exception:       # pylint: disable=W0703
+            if raise_errors:
+                raise
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
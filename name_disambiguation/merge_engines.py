@@ -0,0 +1,815 @@
+"""
+The merge engines of the PeopleDatabase: merge_duplicates and the ways to merge the persons of
+a last name (one pair at a time, union-find, merge matrix), to merge last names in parallel,
+to merge spelling variants of last names and to merge new names into a merged db.
+"""
+
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from name_disambiguation.last_name_blocking import find_similar_last_names
+from name_disambiguation.merge_checkpoint import MergeCheckpointWriter
+from name_disambiguation.merge_log import MERGE_RULE_SIMILAR_LAST_NAME, MergeLog
+
+# blocks (persons with the same last name) of at least this size get checked with
+# get_merge_matrix instead of one pair at a time
+MERGE_MATRIX_MIN_BLOCK_SIZE = 8
+
+
+class MergeEnginesMixin:
+    """
+    Merging methods of PeopleDatabase. They find the persons to merge and leave the merging
+    itself to merge_two_persons and merge_persons.
+    """
+    def merge_duplicates(self, print_merge_results_for_name='Dunn', manual_merge=False, *,
+                         engine='sequential', workers=1, similar_last_names=False,
+                         checkpoint_path=None, checkpoint_interval=60, resume_from=None):
+        """
+        Tries to merge all duplicates and only retain authoritative names.
+        e.g. it will try to merge WL Dunn and William Dunn into Dunn, William L
+        You can use print_merg_results_for_name to print out the merge results for one name for
+        further inspection
+
+        if manual_merge = True, user will be prompted to decide for all last names if they should
+        be merged manually. useful for small networks for display purposes. The decisions get
+        stored and reused (see manually_merge_db), so later runs only ask about new pairs.
+
+        All options after manual_merge are keyword-only.
+        engine selects how the persons of a last name get merged:
+        'sequential' merges one pair at a time and scans the last name again after every merge
+        (merge_last_name). 'union_find' checks each pair once and merges every group of persons
+        in one step (merge_last_name_union_find), which is much faster for common last names.
+
+        Persons only get merged with persons of the same last name, so with workers > 1, the
+        last names get merged in a process pool (see merge_last_names_in_parallel). The merged
+        persons and aliases are the same for any number of workers.
+
+        if similar_last_names = True, persons with spelling variants of the same last name
+        (e.g. "Wakeham" and "Wakehan") get merged afterwards (see merge_similar_last_names).
+
+        With a checkpoint_path, the serial merge stores a checkpoint of the db and the last
+        fully merged last name every checkpoint_interval seconds and after the last one (see
+        MergeCheckpointWriter). merge_duplicates(resume_from=checkpoint_path) replaces the
+        persons of the db with the ones of the checkpoint and continues with the next last name,
+        which gives the same db as an uninterrupted merge.
+
+        :param print_merge_results_for_name: str
+        :param manual_merge: bool
+        :param engine: str, 'sequential' or 'union_find'
+        :param workers: int, number of worker processes
+        :param similar_last_names: bool
+        :param checkpoint_path: Path of the checkpoint file or None
+        :param checkpoint_interval: float, seconds between two checkpoints
+        :param resume_from: Path of a checkpoint to resume from or None
+        :return:
+        """
+        # pylint: disable=R0913
+        if engine not in ('sequential', 'union_find'):
+            raise ValueError("engine has to be 'sequential' or 'union_find'")
+        if workers > 1 and checkpoint_path is not None:
+            raise ValueError("checkpoints can only be written with workers=1")
+
+        last_names = sorted(self._last_name_to_people)
+        if resume_from is not None:
+            resumed_last_name = self.load_merge_checkpoint(resume_from)
+            last_names = [last_name for last_name in sorted(self._last_name_to_people)
+                          if last_name > resumed_last_name]
+            print(f'Resuming the merge after {resumed_last_name!r} with {len(self)} persons and '
+                  f'{len(last_names)} last names to go.')
+
+        checkpoint_writer = None
+        if checkpoint_path is not None:
+            checkpoint_writer = MergeCheckpointWriter(checkpoint_path, checkpoint_interval)
+
+        def merge_sorted_last_names():
+            for last_name in last_names:
+                last_name_people = self.merge_block(last_name, engine)
+                if checkpoint_writer is not None:
+                    checkpoint_writer.write(self, last_name,
+                                            force=last_name == last_names[-1])
+                yield last_name, last_name_people
+
+        if workers > 1:
+            merged_last_names = self.merge_last_names_in_parallel(engine, workers,
+                                                                  last_names=last_names)
+        else:
+            merged_last_names = merge_sorted_last_names()
+
+        try:
+            self.print_merge_results(merged_last_names, print_merge_results_for_name)
+        except BaseException:
+            # also wait on errors and Ctrl-C, so that the last checkpoint is complete, but keep
+            # the original error
+            if checkpoint_writer is not None:
+                checkpoint_writer.close(raise_errors=False)
+            raise
+        if checkpoint_writer is not None:
+            checkpoint_writer.close()
+
+        if similar_last_names:
+            self.merge_similar_last_names(engine=engine)
+
+        if manual_merge:
+            self.manually_merge_db()
+
+    @staticmethod
+    def print_merge_results(merged_last_names, print_merge_results_for_name):
+        """
+        Goes through the merged last names of merge_duplicates and prints the persons of every
+        last name with more than 5 persons after merging
+        :param merged_last_names: iterable of (last_name, list of persons after merging)
+        :param print_merge_results_for_name: str or None to not print anything
+        :return: None
+        """
+        for _, last_name_people in merged_last_names:
+            if (
+                    print_merge_results_for_name and
+                    len(last_name_people) > 5
+                    # last_name.lower().find(print_merge_results_for_name.lower()) > -1
+            ):
+                print("\nSUMMARY")
+                for name in last_name_people:
+                    print("\n", name.count, name, name.alias_items()[:100])
+                print("\n")
+
+    def merge_similar_last_names(self, max_distance=1, min_length=5, engine='sequential'):
+        """
+        Merges persons across last names that are probably spelling or OCR variants of each
+        other, which merge_duplicates misses because it only compares persons with the same last
+        name.
+        Candidate pairs of last names come from find_similar_last_names (same Soundex key and
+        at most max_distance edits apart). For every pair, the persons of the rarer last name
+        get merged into the first person of the more common last name that passes
+        check_if_persons_can_be_merged. The more common last name then gets merged again.
+
+        :param max_distance: int, maximum edit distance between two last names
+        :param min_length: int, minimum length of the last names to compare
+        :param engine: str, 'sequential' or 'union_find' (see merge_duplicates)
+        :return: dict with the number of last names, similar last name pairs, compared person
+                 pairs and merges, and the seconds spent finding and merging the candidates
+        """
+        start_time = time.time()
+        similar_last_names = find_similar_last_names(self._last_name_to_people, max_distance,
+                                                     min_length)
+        report = {'last_names': len(self._last_name_to_people),
+                  'similar_last_name_pairs': len(similar_last_names),
+                  'person_pairs': 0, 'merges': 0,
+                  'candidate_seconds': time.time() - start_time}
+
+        def by_count(person):
+            return -person.count, person.person_id
+
+        start_time = time.time()
+        for last_names in similar_last_names:
+            # a last name can be gone if all its persons got merged into a similar one
+            if not all(last_name in self._last_name_to_people for last_name in last_names):
+                continue
+
+            common_last_name, rare_last_name = sorted(
+                last_names,
+                key=lambda last_name: (-sum(person.count for person in
+                                            self._last_name_to_people[last_name]), last_name))
+            merged = False
+            for rare_person in sorted(self._last_name_to_people[rare_last_name], key=by_count):
+                for common_person in sorted(self._last_name_to_people[common_last_name],
+                                            key=by_count):
+                    report['person_pairs'] += 1
+                    if self.check_if_persons_can_be_merged(common_person, rare_person):
+                        self.merge_two_persons(common_person, rare_person,
+                                               rule=MERGE_RULE_SIMILAR_LAST_NAME)
+                        report['merges'] += 1
+                        merged = True
+                        break
+            if merged:
+                self.merge_block(common_last_name, engine)
+        report['merge_seconds'] = time.time() - start_time
+
+        print(f"Similar last names: {report['similar_last_name_pairs']} pairs out of "
+              f"{report['last_names']} last names found in {report['candidate_seconds']:.2f}s. "
+              f"{report['merges']} merges from {report['person_pairs']} person pairs in "
+              f"{report['merge_seconds']:.2f}s.")
+        return report
+
+    def merge_incremental(self, new_names):
+        """
+        Adds a new batch of raw names to an already merged people db and merges only the new
+        persons: every new person gets compared with the persons with the same last name and
+        with the other new persons, while last names without new persons stay untouched.
+        Pairs of old persons do not get compared again because they could not be merged
+        before, so the cost depends on the number of new names and the size of their last
+        names, not on the size of the db.
+        Like merge_duplicates, merging stops when no pair of persons can be merged anymore, but
+        the merge order (and so the result) can differ from merging everything from scratch.
+
+        :param new_names: dict of raw name -> count or iterable of raw names (count 1 each)
+        :return: dict with the lists of new persons (added and not merged) and merged persons
+                 (created by merges), the sorted list of aliases in _alias_to_person_dict that
+                 were added or now point to another person, and the number of changed last
+                 names
+        """
+        if not isinstance(new_names, dict):
+            new_names = Counter(new_names)
+
+        first_new_person_id = self.next_person_id
+        new_last_names = set()
+        for name_raw, count in new_names.items():
+            self.add_person_raw(name_raw, count)
+            person = self.get_person_from_alias(name_raw)
+            if person is not None and person.person_id >= first_new_person_id:
+                new_last_names.add(person.last)
+
+        def get_alias_entries():
+            alias_entries = {}
+            for last_name in new_last_names:
+                for person in self._last_name_to_people.get(last_name, ()):
+                    for alias in list(person.alias_keys()) + [person.full_name]:
+                        alias_person = self.get_person_from_alias(alias)
+                        if alias_person is not None:
+                            alias_entries[alias.lower()] = alias_person.person_id
+            return alias_entries
+
+        # the aliases of new persons are not in old_alias_entries -> they count as changed
+        old_alias_entries = get_alias_entries()
+
+        merged_person_ids = set()
+        for last_name in sorted(new_last_names):
+            merged_person_ids.update(self.merge_new_persons_of_last_name(last_name,
+                                                                         first_new_person_id))
+
+        new_alias_entries = get_alias_entries()
+        new_persons = []
+        merged_persons = []
+        for last_name in sorted(new_last_names):
+            for person in sorted(self._last_name_to_people.get(last_name, ()),
+                                 key=lambda x: x.person_id):
+                if person.person_id in merged_person_ids:
+                    merged_persons.append(person)
+                elif person.person_id >= first_new_person_id:
+                    new_persons.append(person)
+
+        return {
+            'new_persons': new_persons,
+            'merged_persons': merged_persons,
+            'changed_aliases': sorted(alias for alias, person_id in new_alias_entries.items()
+                                      if old_alias_entries.get(alias) != person_id),
+            'changed_last_names': len(new_last_names)
+        }
+
+    def merge_new_persons_of_last_name(self, last_name, first_new_person_id):
+        """
+        Merges the new persons (person_id >= first_new_person_id) with a given last name into
+        the other persons with that last name. Pairs of old persons do not get checked.
+        Every new person gets compared once with all other persons of the last name and is
+        merged with the first (most common) one that passes the checks of merge_last_name.
+        The resulting person is new and gets compared again. Used by merge_incremental.
+
+        :param last_name: str
+        :param first_new_person_id: int
+        :return: set of the person_ids of all persons created by merges
+        """
+        def by_count(person):
+            return -person.count, person.person_id
+
+        merged_person_ids = set()
+        new_persons = sorted((person for person in self._last_name_to_people[last_name]
+                              if person.person_id >= first_new_person_id), key=by_count)
+        while new_persons:
+            new_person = new_persons.pop(0)
+            if new_person not in self.people:
+                # already merged into another person
+                continue
+
+            # persons that share an alias with the new person, found through the postings
+            shared_alias_person_ids = {person_id for alias in new_person.alias_keys()
+                                       for person_id in self._alias_to_person_ids[alias]}
+            for person in sorted(self._last_name_to_people[last_name], key=by_count):
+                if person is not new_person and (
+                        person.person_id in shared_alias_person_ids or
+                        self.check_if_names_can_be_merged(person.first, person.middle,
+                                                          new_person.first, new_person.middle)
+                ):
+                    # the more common person comes first, like in merge_last_name
+                    person1, person2 = sorted([person, new_person], key=by_count)
+                    new_p = self.merge_two_persons(person1, person2)
+                    merged_person_ids.add(new_p.person_id)
+                    new_persons.insert(0, new_p)
+                    break
+        return merged_person_ids
+
+    def merge_block(self, last_name, engine='sequential'):
+        """
+        Merges all persons with a given last name with the selected engine
+        :param last_name: str
+        :param engine: str, 'sequential' or 'union_find'
+        :return: list of the persons with last_name after merging
+        """
+        if engine == 'union_find':
+            return self.merge_last_name_union_find(last_name)
+
+        while True:
+            # only the persons with this last name are needed for merging
+            last_names_dict = {last_name: list(self._last_name_to_people[last_name])}
+            if self.merge_last_name(last_names_dict, last_name):
+                return last_names_dict[last_name]
+
+    def merge_last_names_in_parallel(self, engine, workers, task_size=2000, last_names=None):
+        """
+        Merges all last names in a process pool and puts the merged persons back into the db.
+        Every task holds one or more last names with their persons and aliases. Large last
+        names get their own task and are submitted first, small ones get batched to about
+        task_size persons so the pool does not wait for one large last name at the end.
+
+        The results get applied in the same sorted last name order as the serial merge, and
+        merged persons get their new person_ids in that order (through the merge log records
+        of the workers), so the result and the person_ids are the same as in a serial merge.
+
+        :param engine: str, 'sequential' or 'union_find'
+        :param workers: int, number of worker processes
+        :param task_size: int, number of persons to batch into one task
+        :param last_names: list of the last names to merge (default: all)
+        :return: list of (last_name, list of persons after merging) sorted by last name
+        """
+        if last_names is None:
+            last_names = self._last_name_to_people
+        alias_entries = defaultdict(dict)
+        for alias, person in self._alias_to_person_dict.items():
+            alias_entries[person.last][alias] = person
+
+        first_new_person_id = self.next_person_id
+        results = {}
+        self.unshare_containers()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(merge_last_name_blocks, type(self), task, engine,
+                                       first_new_person_id)
+                       for task in self.get_parallel_merge_tasks(last_names, alias_entries,
+                                                                 task_size)]
+            for future in futures:
+                results.update(future.result())
+
+        merged_last_names = []
+        for last_name in sorted(last_names):
+            if last_name in results:
+                merged_last_names.append((last_name, self.apply_parallel_merge_result(
+                    last_name, results[last_name], alias_entries[last_name])))
+            else:
+                merged_last_names.append((last_name, list(self._last_name_to_people[last_name])))
+        return merged_last_names
+
+    def get_parallel_merge_tasks(self, last_names, alias_entries, task_size):
+        """
+        Splits the last names into the tasks of merge_last_names_in_parallel. Large last names
+        come first, last names with only one person have nothing to merge and get skipped.
+
+        :param last_names: iterable of the last names to merge
+        :param alias_entries: dict of last_name -> dict of alias -> person
+        :param task_size: int, number of persons to batch into one task
+        :return: list of tasks, every task is a list of (last_name, list of persons,
+                 dict of alias -> person)
+        """
+        blocks = sorted((last_name for last_name in last_names
+                         if len(self._last_name_to_people[last_name]) > 1),
+                        key=lambda last_name: (-len(self._last_name_to_people[last_name]),
+                                               last_name))
+        tasks = []
+        task = []
+        task_persons = 0
+        for last_name in blocks:
+            persons = sorted(self._last_name_to_people[last_name], key=lambda x: x.person_id)
+            task.append((last_name, persons, alias_entries[last_name]))
+            task_persons += len(persons)
+            if task_persons >= task_size:
+                tasks.append(task)
+                task = []
+                task_persons = 0
+        if task:
+            tasks.append(task)
+        return tasks
+
+    def apply_parallel_merge_result(self, last_name, result, old_alias_entries):
+        """
+        Puts the persons that a worker of merge_last_names_in_parallel created into the db and
+        removes the persons that they replace. Persons that did not get merged stay the same
+        objects.
+
+        :param last_name: str
+        :param result: (list of person_ids after merging, list of new persons, dict of
+                       alias -> new person, list of merge log records), see
+                       merge_last_name_blocks
+        :param old_alias_entries: dict of alias -> person with last_name before merging
+        :return: list of the persons with last_name after merging
+        """
+        person_ids, new_persons, new_alias_entries, records = result
+        # person_id -> index in the merged persons of the worker
+        remaining_ids = {person_id: idx for idx, person_id in enumerate(person_ids)}
+        old_persons = {person.person_id: person for person in self._last_name_to_people[last_name]}
+        for person_id, person in old_persons.items():
+            if person_id not in remaining_ids:
+                self.remove_person(person)
+        for alias, person in old_alias_entries.items():
+            if (person.person_id not in remaining_ids and
+                    self._alias_to_person_dict.get(alias) is person):
+                del self._alias_to_person_dict[alias]
+
+        worker_to_db_ids = self.log_worker_merges(records)
+        # same order as in the worker
+        last_name_people = [old_persons.get(person_id) for person_id in person_ids]
+        for person in new_persons:
+            last_name_people[remaining_ids[person.person_id]] = person
+            person.person_id = worker_to_db_ids[person.person_id]
+            self.add_person(person)
+        self._alias_to_person_dict.update(new_alias_entries)
+        return last_name_people
+
+    def log_worker_merges(self, records):
+        """
+        Persons created by a worker of merge_last_names_in_parallel (including the ones that
+        got merged again) get their person_ids from this db in the order the worker created
+        them, like in a serial merge. The merge log records of the worker get added to the merge
+        log of this db with these person_ids.
+
+        :param records: list of the merge log records of the worker
+        :return: dict of worker person_id -> person_id in this db
+        """
+        worker_to_db_ids = {}
+        for rule, input_ids, result_id, names in records:
+            worker_to_db_ids[result_id] = self.next_person_id
+            self.next_person_id += 1
+            if self.merge_log is not None:
+                self.merge_log.append(rule, tuple(worker_to_db_ids.get(person_id, person_id)
+                                                  for person_id in input_ids),
+                                      worker_to_db_ids[result_id], names)
+        return worker_to_db_ids
+
+    def merge_last_name(self, last_names_dict, last_name):
+        """
+        Iteratively tries to merge last names from the most common to the least common
+        Returns true if it is finished,
+        :param last_names_dict: dict mapping last_name strings to list of
+        :param last_name:
+        :return:
+        """
+
+        # if only one name -> already finished
+        if len(last_names_dict[last_name]) == 1:
+            return True
+
+        # most common first. Ties by person_id, so the order does not depend on how the persons
+        # are stored
+        last_names_dict[last_name].sort(key=lambda x: (-x.count, x.person_id))
+
+        persons = last_names_dict[last_name]
+        alias_groups = self.get_alias_groups(persons)
+        if len(persons) >= MERGE_MATRIX_MIN_BLOCK_SIZE:
+            # check all pairs at once and merge the first mergeable pair in the same order as the
+            # loop below
+            merge_matrix = self.get_merge_matrix(persons, alias_groups)
+            np.fill_diagonal(merge_matrix, False)
+            if merge_matrix.any():
+                person1_idx, person2_idx = divmod(int(merge_matrix.argmax()), len(persons))
+                self.merge_two_persons(persons[person1_idx], persons[person2_idx])
+                return False
+            return True
+
+        # indexes of the persons that share at least one alias with each person
+        persons_with_shared_aliases = [set() for _ in persons]
+        for indices in alias_groups:
+            for idx in indices:
+                persons_with_shared_aliases[idx].update(indices)
+
+        for person1_idx, person1 in enumerate(last_names_dict[last_name]):
+            for person2_idx, person2 in enumerate(last_names_dict[last_name]):
+
+                # p1/2_idx indicate the index of the person. If they are the same, we are dealing
+                # with the same person and should skip.
+                if person1_idx == person2_idx:
+                    continue
+
+                # If p1 and person2 share at least one alias, we can merge them. Otherwise check
+                # the first and middle names
+                if (
+                        person2_idx in persons_with_shared_aliases[person1_idx] or
+                        self.check_if_names_can_be_merged(person1.first, person1.middle,
+                                                          person2.first, person2.middle)
+                ):
+                    self.merge_two_persons(person1, person2)
+                    return False    # we're not finished -> return False
+
+        # if no merges could be made return True to indicate that merge process is finished
+        return True
+
+    def merge_last_name_union_find(self, last_name):
+        """
+        Merges all persons with a given last name in one pass.
+        Every group of persons is a set in a disjoint-set (union-find) structure, starting with
+        one set per person. Sets get joined when the first and middle names (and aliases) of the
+        merged sets pass the same checks as in merge_last_name, so "W" cannot join both
+        "William" and "Walter". Only pairs where at least one set changed in the last round get
+        checked again. In the end, every set with more than one person gets merged into a new
+        person in one step.
+
+        :param last_name: str
+        :return: list of the persons with last_name after merging
+        """
+        # same order as merge_last_name: most common persons first
+        persons = sorted(self._last_name_to_people[last_name],
+                         key=lambda x: (-x.count, x.person_id))
+        # first and middle name and aliases that the merged person of each set would have
+        # aliases are only relevant if another person shares them -> every set keeps the numbers
+        # of the alias groups of its persons instead of the aliases
+        alias_groups = self.get_alias_groups(persons)
+        sets = {
+            'parents': list(range(len(persons))),
+            'firsts': [person.first for person in persons],
+            'middles': [person.middle for person in persons],
+            'aliases': [set() for _ in persons],
+            # the merge matrix is only valid for sets that still consist of a single person
+            'single_person': [True] * len(persons),
+            'merge_matrix': None
+        }
+        for group_idx, indices in enumerate(alias_groups):
+            for idx in indices:
+                sets['aliases'][idx].add(group_idx)
+        if len(persons) >= MERGE_MATRIX_MIN_BLOCK_SIZE:
+            sets['merge_matrix'] = self.get_merge_matrix(persons, alias_groups)
+
+        parents = sets['parents']
+
+        def find(idx):
+            while parents[idx] != idx:
+                parents[idx] = parents[parents[idx]]
+                idx = parents[idx]
+            return idx
+
+        changed = set(range(len(persons)))
+        while changed:
+            changed = self.join_union_find_sets(sets, changed)
+
+        groups = defaultdict(list)
+        for idx, person in enumerate(persons):
+            groups[find(idx)].append(person)
+
+        last_name_people = []
+        for root in sorted(groups):
+            if len(groups[root]) == 1:
+                last_name_people.append(groups[root][0])
+            else:
+                last_name_people.append(self.merge_persons(groups[root], sets['firsts'][root],
+                                                           sets['middles'][root]))
+        return last_name_people
+
+    def join_union_find_sets(self, sets, changed):
+        """
+        One round of merge_last_name_union_find: checks every pair of sets where at least one
+        set changed in the last round and joins the pairs that can be merged.
+
+        :param sets: dict of the union-find state (see merge_last_name_union_find)
+        :param changed: set of the roots that changed in the last round
+        :return: set of the roots that changed in this round
+        """
+        parents = sets['parents']
+        roots = [idx for idx, parent in enumerate(parents) if parent == idx]
+        changed_in_this_round = set()
+        for root1_idx, root1 in enumerate(roots):
+            for root2 in roots[root1_idx + 1:]:
+                # sets can get merged into an earlier set during the round
+                if parents[root1] != root1:
+                    break
+                # the result for two unchanged sets is the same as in the last round
+                if parents[root2] != root2 or (root1 not in changed and root2 not in changed):
+                    continue
+                if self.check_if_sets_can_be_merged(sets, root1, root2):
+                    self.join_two_union_find_sets(sets, root1, root2)
+                    changed_in_this_round.add(root1)
+        return changed_in_this_round
+
+    def check_if_sets_can_be_merged(self, sets, root1, root2):
+        """
+        Checks the first and middle names and aliases of two union-find sets like
+        check_if_persons_can_be_merged. Uses the merge matrix while both sets consist of a single
+        person.
+
+        :param sets: dict of the union-find state (see merge_last_name_union_find)
+        :param root1: int
+        :param root2: int
+        :return: bool
+        """
+        if (sets['merge_matrix'] is not None and sets['single_person'][root1] and
+                sets['single_person'][root2]):
+            return bool(sets['merge_matrix'][root1, root2])
+        firsts, middles = sets['firsts'], sets['middles']
+        return bool(
+            sets['aliases'][root1].intersection(sets['aliases'][root2]) or
+            self.check_if_names_can_be_merged(firsts[root1], middles[root1],
+                                              firsts[root2], middles[root2])
+        )
+
+    @staticmethod
+    def join_two_union_find_sets(sets, root1, root2):
+        """
+        Joins the set of root2 into the set of root1.
+
+        :param sets: dict of the union-find state (see merge_last_name_union_find)
+        :param root1: int
+        :param root2: int
+        """
+        sets['parents'][root2] = root1
+        sets['single_person'][root1] = False
+        # choose the first and middle names like merge_two_persons
+        for names in [sets['firsts'], sets['middles']]:
+            if len(names[root2]) > len(names[root1]) or names[root1].find('/') > -1:
+                names[root1] = names[root2]
+        sets['aliases'][root1].update(sets['aliases'][root2])
+
+    @staticmethod
+    def check_if_persons_can_be_merged(person1, person2):
+        """
+        Checks if two persons with the same last name are the same person:
+        If they share at least one alias or if their first and middle names are compatible
+        (see check_if_names_can_be_merged)
+
+        :param person1: Person
+        :param person2: Person
+        :return: bool
+        """
+        # If p1 and person2 share at least one alias, we can merge them
+        # the primary use of this is to merge cases where the same author was added
+        # multiple times
+        if {alias for alias, _ in person1.alias_items()}.intersection(
+                alias for alias, _ in person2.alias_items()):
+            return True
+
+        return MergeEnginesMixin.check_if_names_can_be_merged(person1.first, person1.middle,
+                                                              person2.first, person2.middle)
+
+    @staticmethod
+    def get_merge_matrix(persons, alias_groups=None):
+        """
+        Runs check_if_persons_can_be_merged for all pairs of persons (with the same last name)
+        at once: first and middle names are encoded as numpy arrays of string ids, lengths and
+        initials, and every rule of check_if_names_can_be_merged becomes a boolean matrix.
+        Pairs that share an alias get set to True afterwards.
+        The diagonal holds the result of comparing each person with itself.
+
+        :param persons: list of Person objects
+        :param alias_groups: list of lists of indexes of persons that share an alias (see
+                             get_alias_groups). Found by comparing all aliases if None
+        :return: numpy array (len(persons) x len(persons)) of bool
+        """
+        names = MergeEnginesMixin.get_name_arrays(persons)
+
+        def pairs(key, operator):
+            return operator(names[key][:, None], names[key][None, :])
+
+        def both(condition):
+            return condition[:, None] & condition[None, :]
+
+        # one rule per matrix, in the order of check_if_names_can_be_merged
+        no_names = (names['first_lengths'] == 0) & (names['middle_lengths'] == 0)
+        no_names = no_names[:, None] | no_names[None, :]
+        same_names = pairs('firsts', np.equal) & pairs('middles', np.equal)
+        different_full_firsts = both(names['first_lengths'] > 2) & pairs('firsts', np.not_equal)
+        different_full_middles = (both(names['middle_lengths'] > 2) &
+                                  pairs('middles', np.not_equal))
+        different_first_initials = (both(names['first_lengths'] > 0) &
+                                    pairs('first_initials', np.not_equal))
+        same_initials = (both((names['first_lengths'] > 0) & (names['middle_lengths'] > 0)) &
+                         pairs('first_initials', np.equal) & pairs('middle_initials', np.equal))
+
+        merge_matrix = ~no_names & (same_names | (~different_full_firsts &
+                                                  ~different_full_middles &
+                                                  ~different_first_initials & same_initials))
+
+        if alias_groups is None:
+            alias_groups = MergeEnginesMixin.find_shared_alias_groups(persons)
+        for indices in alias_groups:
+            merge_matrix[np.ix_(indices, indices)] = True
+        # every person with at least one alias shares it with itself
+        has_aliases = np.array([len(person.alias_keys()) > 0 for person in persons], dtype=bool)
+        merge_matrix[np.diag_indices(len(persons))] |= has_aliases
+
+        return merge_matrix
+
+    @staticmethod
+    def get_name_arrays(persons):
+        """
+        Encodes the first and middle names of persons for get_merge_matrix
+        :param persons: list of Person objects
+        :return: dict of numpy arrays with one entry per person: string ids of the first and
+                 middle names ('firsts', 'middles'), their lengths ('first_lengths',
+                 'middle_lengths') and the code points of their initials, -1 for empty names
+                 ('first_initials', 'middle_initials')
+        """
+        string_ids = {}
+        return {
+            'firsts': np.array([string_ids.setdefault(person.first, len(string_ids))
+                                for person in persons]),
+            'middles': np.array([string_ids.setdefault(person.middle, len(string_ids))
+                                 for person in persons]),
+            'first_lengths': np.array([len(person.first) for person in persons]),
+            'middle_lengths': np.array([len(person.middle) for person in persons]),
+            'first_initials': np.array([ord(person.first[0]) if person.first else -1
+                                        for person in persons]),
+            'middle_initials': np.array([ord(person.middle[0]) if person.middle else -1
+                                         for person in persons])
+        }
+
+    @staticmethod
+    def find_shared_alias_groups(persons):
+        """
+        Finds the persons that share aliases by comparing all their aliases (for persons that
+        are not in a db, see get_alias_groups)
+        :param persons: list of Person objects
+        :return: list of lists of indexes into persons, one for every alias that at least two
+                 of the persons share
+        """
+        alias_to_indices = defaultdict(list)
+        for idx, person in enumerate(persons):
+            for alias, _ in person.alias_items():
+                alias_to_indices[alias].append(idx)
+        return [indices for indices in alias_to_indices.values() if len(indices) > 1]
+
+    @staticmethod
+    def check_if_names_can_be_merged(first1, middle1, first2, middle2):
+        """
+        Checks if two first and middle name combinations (of persons with the same last name)
+        can belong to the same person, e.g. "W L" and "William L" but not "William" and "Walter"
+
+        :param first1: str
+        :param middle1: str
+        :param first2: str
+        :param middle2: str
+        :return: bool
+        """
+        # pylint: disable=R0911
+
+        # if no first and middle name -> skip
+        if first1 == '' and middle1 == '':
+            return False
+        if first2 == '' and middle2 == '':
+            return False
+
+        # if first and middle names match -> merge
+        if first1 == first2 and middle1 == middle2:
+            return True
+
+        # if both have full first names and they don't match -> skip
+        if len(first1) > 2 and len(first2) > 2 and first1 != first2:
+            return False
+
+        # if both have full middle names and they don't match -> skip
+        if len(middle1) > 2 and len(middle2) > 2 and middle1 != middle2:
+            return False
+
+        # if initial of the first name is not the same -> skip
+        if first1 and first2 and first1[0] != first2[0]:
+            return False
+
+        # if both have at least first and middle initials -> merge if the initials match
+        if first1 and middle1 and first2 and middle2:
+            return first1[0] == first2[0] and middle1[0] == middle2[0]
+
+        # TODO: persons with only a first initial
+        return False
+
+
+def merge_last_name_blocks(people_db_class, blocks, engine, first_new_person_id):
+    """
+    Merges the persons of one or more last names in a separate people db (used by the workers
+    of PeopleDatabase.merge_last_names_in_parallel)
+    :param people_db_class: class of the merging people db (PeopleDatabase)
+    :param blocks: list of (last_name, list of persons, dict of alias -> person)
+    :param engine: str, 'sequential' or 'union_find'
+    :param first_new_person_id: int, person_id of the first person created by a merge. All
+                                persons with a lower person_id existed before.
+    :return: dict of last_name -> (list of the person_ids after merging, list of the persons
+             created by merges, dict of alias -> person for the aliases of these persons, list
+             of merge log records in the order of the merges). Only last names with at least
+             one merge are included, the persons that did not change do not get sent back.
+    """
+    block_db = people_db_class()
+    block_db.merge_log = MergeLog()
+    for _, persons, alias_entries in blocks:
+        for person in persons:
+            block_db.add_person(person)
+        block_db._alias_to_person_dict.update(alias_entries)         # pylint: disable=W0212
+    block_db.next_person_id = first_new_person_id
+
+    merged_persons = {}
+    for last_name, _, _ in blocks:
+        merged_persons[last_name] = block_db.merge_block(last_name, engine)
+
+    new_alias_entries = defaultdict(dict)
+    for alias, person in block_db._alias_to_person_dict.items():    # pylint: disable=W0212
+        if person.person_id >= first_new_person_id:
+            new_alias_entries[person.last][alias] = person
+    # merges within a block keep the last name
+    records = defaultdict(list)
+    for record in block_db.merge_log.records:
+        records[record[3][0]].append(record)
+    return {last_name: ([person.person_id for person in persons],
+                        [person for person in persons if person.person_id >= first_new_person_id],
+                        new_alias_entries[last_name], records[last_name])
+            for last_name, persons in merged_persons.items() if records[last_name]}
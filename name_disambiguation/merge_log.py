@@ -0,0 +1,220 @@
+"""
+Append-only log of the merges of a PeopleDatabase.
+Every merge that PeopleDatabase.merge_two_persons or merge_persons makes becomes a record of the
+rule that caused it, the person_ids that went in and the person_id and names of the person that
+came out. PeopleDatabase.rename_person logs a record with the renamed person as the only input
+and as the result. Records get buffered and written in binary batches, so logging does not slow
+down the merge loop. PeopleDatabase.replay_merge_log rebuilds a merged db from the unmerged db
+and the log without checking any merge rules.
+
+A merge log file starts with MERGE_LOG_PREFIX (magic and format version), followed by the
+records. Every record is MERGE_RECORD_HEADER (rule, result person_id, number of input
+person_ids), the input person_ids as int64 and the last, first and middle name and the
+affiliation of the result, each as a uint16 length and utf-8 bytes.
+"""
+
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+MERGE_LOG_MAGIC = b'MERGELOG'
+MERGE_LOG_VERSION = 1
+
+MERGE_LOG_PREFIX = struct.Struct('<8sI')
+MERGE_RECORD_HEADER = struct.Struct('<BqI')
+MERGE_RECORD_STRING_LENGTH = struct.Struct('<H')
+
+# the rules that can cause a merge
+MERGE_RULE_SHARED_ALIAS = 1         # the persons share an alias
+MERGE_RULE_NAME_CHECK = 2           # check_if_names_can_be_merged
+MERGE_RULE_UNION_FIND = 3           # a group of persons of merge_last_name_union_find
+MERGE_RULE_SIMILAR_LAST_NAME = 4    # merge_similar_last_names
+MERGE_RULE_MANUALLY_MERGED_NAMES = 5    # MANUALLY_MERGED_NAMES in config.py
+MERGE_RULE_MANUAL_INPUT = 6         # confirmed by hand in manually_merge_last_name
+
+MERGE_RULE_DESCRIPTIONS = {
+    MERGE_RULE_SHARED_ALIAS: 'shared alias',
+    MERGE_RULE_NAME_CHECK: 'names',
+    MERGE_RULE_UNION_FIND: 'union find',
+    MERGE_RULE_SIMILAR_LAST_NAME: 'similar last name',
+    MERGE_RULE_MANUALLY_MERGED_NAMES: 'manually merged names',
+    MERGE_RULE_MANUAL_INPUT: 'manual input',
+}
+
+
+def encode_merge_records(records):
+    """
+    Encodes merge records in the binary record format
+    :param records: list of (rule, input person_ids, result person_id,
+                    (last, first, middle, affiliation)) tuples
+    :return: bytes
+    """
+    chunks = []
+    for rule, input_ids, result_id, names in records:
+        chunks.append(MERGE_RECORD_HEADER.pack(rule, result_id, len(input_ids)))
+        chunks.append(struct.pack(f'<{len(input_ids)}q', *input_ids))
+        for name in names:
+            name_bytes = name.encode('utf-8')
+            chunks.append(MERGE_RECORD_STRING_LENGTH.pack(len(name_bytes)))
+            chunks.append(name_bytes)
+    return b''.join(chunks)
+
+
+def read_merge_log(file_path):
+    """
+    Reads all records of a merge log file, in the order they were logged
+    :param file_path: Path
+    :return: list of (rule, input person_ids, result person_id,
+             (last, first, middle, affiliation)) tuples
+    """
+    with open(str(file_path), 'rb') as infile:
+        data = infile.read()
+    if len(data) < MERGE_LOG_PREFIX.size:
+        raise ValueError(f'{file_path} is not a merge log of version {MERGE_LOG_VERSION}.')
+    magic, version = MERGE_LOG_PREFIX.unpack_from(data, 0)
+    if magic != MERGE_LOG_MAGIC or version != MERGE_LOG_VERSION:
+        raise ValueError(f'{file_path} is not a merge log of version {MERGE_LOG_VERSION}.')
+
+    records = []
+    offset = MERGE_LOG_PREFIX.size
+    while offset < len(data):
+        rule, result_id, number_of_inputs = MERGE_RECORD_HEADER.unpack_from(data, offset)
+        offset += MERGE_RECORD_HEADER.size
+        input_ids = struct.unpack_from(f'<{number_of_inputs}q', data, offset)
+        offset += 8 * number_of_inputs
+        names = []
+        for _ in range(4):
+            length, = MERGE_RECORD_STRING_LENGTH.unpack_from(data, offset)
+            offset += MERGE_RECORD_STRING_LENGTH.size
+            names.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        records.append((rule, input_ids, result_id, tuple(names)))
+    return records
+
+
+class MergeLog:
+    """
+    Buffered, append-only merge log. Set it as the merge_log of a PeopleDatabase to log all of
+    its merges.
+    Without a file_path, the log only collects the records in memory (used by the workers of
+    PeopleDatabase.merge_last_names_in_parallel).
+
+    Attributes:
+        file_path (Path): location of the log file or None
+        records (list): records that have not been written yet (all records without a
+                        file_path), see read_merge_log
+        number_of_records (int): number of records logged since the log was opened
+    """
+    def __init__(self, file_path=None, batch_size=10000):
+        """
+        Opens (or creates) a merge log. New records get appended to existing ones
+        :param file_path: Path of the log file or None
+        :param batch_size: int, number of records to collect before writing them
+        """
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.records = []
+        self.number_of_records = 0
+        self._file = None
+        if file_path is not None:
+            self._file = open(str(file_path), 'ab')     # pylint: disable=R1732
+            if self._file.tell() == 0:
+                self._file.write(MERGE_LOG_PREFIX.pack(MERGE_LOG_MAGIC, MERGE_LOG_VERSION))
+                self._file.flush()
+
+    def __len__(self):
+        return self.number_of_records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, rule, input_ids, result_id, names):
+        """
+        Logs a merge
+        :param rule: int, one of the MERGE_RULE constants
+        :param input_ids: tuple of int, person_ids of the merged persons
+        :param result_id: int, person_id of the new person
+        :param names: tuple of str, (last, first, middle, affiliation) of the new person.
+                      affiliation is only set for merges with an authoritative name
+        :return: None
+        """
+        self.records.append((rule, input_ids, result_id, names))
+        self.number_of_records += 1
+        if self._file is not None and len(self.records) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered records to the log file in one write
+        :return: None
+        """
+        if self._file is None or not self.records:
+            return
+        self._file.write(encode_merge_records(self.records))
+        self._file.flush()
+        self.records = []
+
+    def close(self):
+        """
+        Writes buffered records and closes the log file
+        :return: None
+        """
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class TestMergeLog(unittest.TestCase):
+    """
+    Tests for writing and reading merge logs
+    """
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()     # pylint: disable=R1732
+        self.addCleanup(temp_dir.cleanup)
+        self.log_path = Path(temp_dir.name, 'merges.log')
+
+    def test_round_trip(self):
+        """
+        Records have to be read back in order, across batches and reopened logs
+        """
+        records = [(MERGE_RULE_NAME_CHECK, (3, 1), 7, ('DUNN', 'WILLIAM', 'L', '')),
+                   (MERGE_RULE_UNION_FIND, (7, 2, 5), 8, ('DUNN', 'WILLIAM', 'L', '')),
+                   (MERGE_RULE_MANUALLY_MERGED_NAMES, (4, 6), 9,
+                    ('MÜLLER', 'JÜRGEN', '', 'British American Tobacco'))]
+        with MergeLog(self.log_path, batch_size=2) as merge_log:
+            for record in records[:2]:
+                merge_log.append(*record)
+            # the first batch is on disk, the second one gets written on close
+            self.assertEqual(read_merge_log(self.log_path), records[:2])
+        with MergeLog(self.log_path) as merge_log:
+            merge_log.append(*records[2])
+            self.assertEqual(len(merge_log), 1)
+        self.assertEqual(read_merge_log(self.log_path), records)
+
+    def test_in_memory(self):
+        """
+        Without a file, the records stay in memory
+        """
+        merge_log = MergeLog()
+        merge_log.append(MERGE_RULE_SHARED_ALIAS, (1, 2), 3, ('RISI', 'STEPHAN', '', ''))
+        merge_log.close()
+        self.assertEqual(merge_log.records,
+                         [(MERGE_RULE_SHARED_ALIAS, (1, 2), 3, ('RISI', 'STEPHAN', '', ''))])
+
+    def test_invalid_file(self):
+        """
+        Files that are not merge logs raise a ValueError
+        """
+        with open(str(self.log_path), 'wb') as outfile:
+            outfile.write(b'not a merge log')
+        with self.assertRaises(ValueError):
+            read_merge_log(self.log_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
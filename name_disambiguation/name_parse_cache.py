@@ -0,0 +1,223 @@
+"""
+The in-memory cache of Person.parse_raw_name results (NAME_PARSE_CACHE), optionally backed by
+a PersistentParseStore on disk (see persistent_name_parse_cache)
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from name_disambiguation.config import NAME_PARSE_CACHE_SIZE
+from name_disambiguation.parse_store import PARSE_STORE_PATH, PersistentParseStore
+
+# increase whenever a change to parse_raw_name changes its results. This invalidates all parse
+# results stored on disk by PersistentParseStore
+PARSER_VERSION = 1
+
+
+class NameParseCache:
+    """
+    Bounded least recently used cache for the results of Person.parse_raw_name, keyed on
+    (name_raw, extract_orgs).
+    Keeps track of hits, misses, and evictions so the size can be tuned for the full dataset.
+    Optionally backed by a PersistentParseStore, which is checked on misses and receives all
+    new results (see attach_store and persistent_name_parse_cache).
+
+    Attributes:
+        max_size (int): maximum number of stored parse results. 0 disables the cache
+        hits (int): number of lookups that found a cached result
+        misses (int): number of lookups that did not
+        evictions (int): number of results dropped because the cache was full
+        store (PersistentParseStore): on-disk store shared across runs (None if not used)
+    """
+    def __init__(self, max_size=NAME_PARSE_CACHE_SIZE):
+        """
+        Returns an empty cache
+        :param max_size: int
+        """
+        self.max_size = max_size
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store = None
+        self._store_users = 0
+
+    def __len__(self):
+        """
+        :return: int (number of cached parse results)
+        """
+        return len(self._results)
+
+    def __repr__(self):
+        """
+        :return: str with size and hit/miss/eviction counts
+        """
+        return f'<NameParseCache {len(self)}/{self.max_size}, hits: {self.hits}, misses: ' \
+               f'{self.misses}, evictions: {self.evictions}, hit rate: {self.hit_rate:.3f}>'
+
+    @property
+    def hit_rate(self):
+        """
+        :return: float (share of lookups that were hits, 0 if there were none)
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, name_raw, extract_orgs):
+        """
+        Returns the cached (first, middle, last, positions) result for a raw name or None
+        :param name_raw: str
+        :param extract_orgs: bool
+        :return: tuple or None
+        """
+        key = (name_raw, extract_orgs)
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+        self.misses += 1
+
+        if self.store is not None:
+            result = self.store.get(name_raw, extract_orgs)
+            if result is not None:
+                self._add(key, result)
+            return result
+        return None
+
+    def set(self, name_raw, extract_orgs, result):
+        """
+        Stores a parse result and evicts the least recently used results if the cache is full
+        :param name_raw: str
+        :param extract_orgs: bool
+        :param result: tuple (first, middle, last, positions Counter parsed with count=1)
+        :return: None
+        """
+        if self.store is not None:
+            self.store.set(name_raw, extract_orgs, result)
+        self._add((name_raw, extract_orgs), result)
+
+    def set_many(self, results, extract_orgs):
+        """
+        Stores the parse results of a batch (see Person.parse_many). All of them go to the
+        store, but only the first max_size get into the in-memory cache, so that a large batch
+        does not evict everything else only to evict most of its own results again.
+        None results (names that could not be parsed) do not get stored.
+        :param results: dict of name_raw -> tuple or None
+        :param extract_orgs: bool
+        :return: None
+        """
+        added = 0
+        for name_raw, result in results.items():
+            if result is None:
+                continue
+            if self.store is not None:
+                self.store.set(name_raw, extract_orgs, result)
+            if added < self.max_size:
+                self._add((name_raw, extract_orgs), result)
+                added += 1
+
+    def _add(self, key, result):
+        """
+        Adds a result to the in-memory cache only
+        :param key: tuple (name_raw, extract_orgs)
+        :param result: tuple
+        :return: None
+        """
+        if self.max_size <= 0:
+            return
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, max_size):
+        """
+        Changes the maximum size, evicting the least recently used results if necessary
+        :param max_size: int
+        :return: None
+        """
+        self.max_size = max_size
+        while self._results and len(self._results) > max(max_size, 0):
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+    def attach_store(self, file_path=PARSE_STORE_PATH):
+        """
+        Opens a PersistentParseStore and uses it to back the cache.
+        Nested calls share the store that is already open; it only gets closed once every
+        attach_store has been matched by a detach_store.
+
+        :param file_path: Path of the sqlite file
+        :return: None
+        """
+        if self.store is None:
+            self.store = PersistentParseStore(PARSER_VERSION, file_path)
+        self._store_users += 1
+
+    def detach_store(self):
+        """
+        Counterpart to attach_store. Writes and closes the store once it is no longer used.
+        :return: None
+        """
+        if self.store is None:
+            return
+        self._store_users -= 1
+        if self._store_users <= 0:
+            self.store.close()
+            self.store = None
+            self._store_users = 0
+
+    def clear(self):
+        """
+        Removes all cached results and resets the counters
+        :return: None
+        """
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """
+        :return: dict with size, max_size, hits, misses, evictions and hit_rate (plus hits and
+        misses of the persistent store if one is attached)
+        """
+        stats = {'size': len(self), 'max_size': self.max_size, 'hits': self.hits,
+                 'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hit_rate}
+        if self.store is not None:
+            stats['store_hits'] = self.store.hits
+            stats['store_misses'] = self.store.misses
+        return stats
+
+
+NAME_PARSE_CACHE = NameParseCache()
+
+
+def init_name_parse_worker():
+    """
+    Initializes a worker process of Person.parse_many.
+    A forked worker inherits the parent's NAME_PARSE_CACHE, including the connection of its
+    persistent store, which must not be shared -> workers only use the in-memory cache.
+    :return: None
+    """
+    NAME_PARSE_CACHE.store = None
+    NAME_PARSE_CACHE._store_users = 0       # pylint: disable=W0212
+
+@contextmanager
+def persistent_name_parse_cache(file_path=PARSE_STORE_PATH):
+    """
+    Backs NAME_PARSE_CACHE with a PersistentParseStore while the with block runs, so parse
+    results get reused across pipeline runs.
+    e.g.
+        with persistent_name_parse_cache():
+            people_db.add_person_raw('DUNN,WL')
+
+    :param file_path: Path of the sqlite file
+    :return: PersistentParseStore
+    """
+    NAME_PARSE_CACHE.attach_store(file_path)
+    try:
+        yield NAME_PARSE_CACHE.store
+    finally:
+        NAME_PARSE_CACHE.detach_store()
@@ -15,25 +15,24 @@ import pandas as pd
 from name_disambiguation.people_db import PeopleDatabase
 
 
-def merge_names_from_json_file(json_name_file, people_db_pickle_file):
+def merge_names_from_json_file(json_name_file, people_db_pickle_file, workers=1):
     """
     Creates a people db from reading json file (dict of raw names and counts) and merges people
     in it. Stores people db in a pickle file
     :param json_name_file: Path to json file
     :param people_db_pickle_file: Path for output pickle file of the created PeopleDB
+    :param workers: int, number of processes used to parse the raw names
     :return:
     """
 
-    with open(json_name_file, 'r') as infile:
+    with open(json_name_file, 'r', encoding='utf-8') as infile:
         name_dict = json.load(infile)
 
     initial_time = time.time()
 
-    # add everyone to a PeopleDatabase
+    # add everyone who appears at least 3 times to a PeopleDatabase
     people_db = PeopleDatabase()
-    for name in name_dict:
-        if name_dict[name] >= 3:
-            people_db.add_person_raw(name_raw=name, count=name_dict[name])
+    people_db.add_people_bulk(name_dict, min_count=3, workers=workers)
 
     print("Length: ", len(people_db))
 
@@ -62,8 +61,8 @@ def get_au_and_rc_by_document(path, return_type='both') -> list:
     """
 
     if return_type not in ['authors', 'recipients', 'both']:
-        raise ValueError(f'get_au_and_rc_by_document can only be called with return_type "both",'
-                         f'"authors," or "recipients".')
+        raise ValueError('get_au_and_rc_by_document can only be called with return_type "both",'
+                         '"authors," or "recipients".')
 
     df = pd.read_csv(path).fillna('')  # pylint: disable=C0103
 
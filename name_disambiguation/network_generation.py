@@ -11,6 +11,7 @@ from pathlib import Path
 import pandas as pd
 from IPython import embed
 
+from name_disambiguation.name_parse_cache import NAME_PARSE_CACHE, persistent_name_parse_cache
 from name_disambiguation.name_preprocessing import parse_column_person
 from name_disambiguation.people_db import PeopleDatabase
 from name_disambiguation.person import Person
@@ -18,18 +19,24 @@ from name_disambiguation.person import Person
 DOCS_CSV_PATH = Path('..', 'data', 'documents', 'docs_1970s_all.csv')
 NETWORK_PATH = Path('..', 'data', 'network_generation', 'network_1970s.pickle')
 PEOPLE_DB_PATH = Path('..', 'data', 'network_generation', '1970s_from_csv.pickle')
+# raw names that match this look like organizations (see check_if_name_looks_like_an_organization)
+ORGANIZATION_REGEX = '^[a-zA-Z]+ [a-zA-Z]+ [a-zA-Z ]+$'
+# Person.check_if_this_person_looks_valid: first, middle, and last name can only contain letters
+LETTERS_ONLY_REGEX = '^[a-zA-Z]+$'
+
 NAMES_TO_SKIP = {
     'American Brands Inc',
     'Hardy Shook',
     'Shook Hardy',
 }
 
-def create_db_of_1970s_docs_from_csv():             # pylint: disable=C0103
+def create_db_of_1970s_docs_from_csv(workers=1):             # pylint: disable=C0103
     """
     We have this strange 1970s db from November 2019 but I don't know how it was created.
     This script simply uses the docs_1970s_all.csv to create a people_db using the info found in
     those documents.
 
+    :param workers: int, number of processes used to parse the raw names
     :return:
     """
 
@@ -47,23 +54,34 @@ def create_db_of_1970s_docs_from_csv():             # pylint: disable=C0103
         'error': Counter(),         # threw an error
     }
 
-    for idx, doc in df.iterrows():  # iterate over all documentsf
-        if idx % 1000 == 0:
-            print(idx)
+    # keep parse results on disk, so reruns don't have to parse the same names again
+    with persistent_name_parse_cache():
+        # parse and classify all raw person names up front (in parallel if workers > 1). The
+        # Persons created below then get their parse results from the cache
+        name_labels = classify_names(get_names_of_person_columns(df),
+                                     people_db.raw_org_to_clean_org_dict, workers=workers)
+        name_labels = dict(zip(name_labels.index, name_labels))
+
+        for idx, doc in df.iterrows():  # iterate over all documentsf
+            if idx % 1000 == 0:
+                print(idx)
+
+            doc_authors, doc_author_orgs = parse_authors_or_recipients_of_doc(
+                'authors', doc, counters, people_db, name_labels)
+            doc_recipients, doc_recipient_orgs = parse_authors_or_recipients_of_doc(
+                'recipients', doc, counters, people_db, name_labels)
 
-        doc_authors, doc_author_orgs = parse_authors_or_recipients_of_doc('authors', doc,
-                                                                          counters, people_db)
-        doc_recipients, doc_recipient_orgs = parse_authors_or_recipients_of_doc('recipients', doc,
-                                                                                counters, people_db)
+            doc_author_orgs += parse_au_or_rc_organizations_of_doc('authors', doc, counters,
+                                                                   people_db)
+            doc_recipient_orgs += parse_au_or_rc_organizations_of_doc('recipients', doc, counters,
+                                                                      people_db)
 
-        doc_author_orgs += parse_au_or_rc_organizations_of_doc('authors', doc, counters, people_db)
-        doc_recipient_orgs += parse_au_or_rc_organizations_of_doc('recipients', doc, counters,
-                                                                  people_db)
+            for person in doc_authors:
+                people_db.add_person_raw(name_raw=person, position=Counter(doc_author_orgs))
+            for person in doc_recipients:
+                people_db.add_person_raw(name_raw=person, position=Counter(doc_recipient_orgs))
 
-        for person in doc_authors:
-            people_db.add_person_raw(name_raw=person, position=Counter(doc_author_orgs))
-        for person in doc_recipients:
-            people_db.add_person_raw(name_raw=person, position=Counter(doc_recipient_orgs))
+        print("Name parse cache:", NAME_PARSE_CACHE.stats())
 
     len_before_merge = len(people_db)
     people_db.merge_duplicates()
@@ -87,10 +105,10 @@ def get_network_of_1970s_nodes_and_edges():             # pylint: disable=C0103,
 
         people_db = PeopleDatabase()
         try:
-            people_db.load_from_disk(PEOPLE_DB_PATH)
+            people_db.load_from_disk(PEOPLE_DB_PATH, store_post_load_state=True)
         except FileNotFoundError:
             create_db_of_1970s_docs_from_csv()
-            people_db.load_from_disk(PEOPLE_DB_PATH)
+            people_db.load_from_disk(PEOPLE_DB_PATH, store_post_load_state=True)
 
 
         df = pd.read_csv(DOCS_CSV_PATH).fillna('')      # pylint: disable=C0103
@@ -106,55 +124,60 @@ def get_network_of_1970s_nodes_and_edges():             # pylint: disable=C0103,
             'error': Counter(),         # threw an error
         }
 
+        with persistent_name_parse_cache():
+            name_labels = classify_names(get_names_of_person_columns(df),
+                                         people_db.raw_org_to_clean_org_dict)
+            name_labels = dict(zip(name_labels.index, name_labels))
+
+            for idx, doc in df.iterrows():  # iterate over all documentsf
+                if idx % 1000 == 0:
+                    print(idx)
+
+                doc_authors, _ = parse_authors_or_recipients_of_doc('authors', doc, counters,
+                                                                    people_db, name_labels)
+                doc_recipients, _ = parse_authors_or_recipients_of_doc('recipients', doc, counters,
+                                                                       people_db, name_labels)
+
+                d_authors = []
+                for author in doc_authors:
+                    author_person = people_db.get_person_from_alias(author)
+                    if author_person:
+                        d_authors.append(author_person)
+                    else:
+                        print("could not find", author)
+                doc_authors = d_authors
 
-        for idx, doc in df.iterrows():  # iterate over all documentsf
-            if idx % 1000 == 0:
-                print(idx)
+                d_recipients = []
+                for recipient in doc_recipients:
+                    recipient_person = people_db.get_person_from_alias(recipient)
+                    if recipient_person:
+                        d_recipients.append(recipient_person)
+                    else:
+                        print("Could not find", recipient)
+                doc_recipients = d_recipients
+
+                for author in doc_authors:
+                    author.docs_authored.append(doc)
+                    if author in nodes:
+                        nodes[author]['count_authored'] += 1
+                    else:
+                        embed()
+                        nodes[author] = {'person': author, 'docs_authored': {}, 'count_received': 0}
 
-            doc_authors, _ = parse_authors_or_recipients_of_doc('authors', doc, counters, people_db)
-            doc_recipients, _ = parse_authors_or_recipients_of_doc('recipients', doc,
-                                                                   counters, people_db)
-
-            d_authors = []
-            for author in doc_authors:
-                author_person = people_db.get_person_from_alias(author)
-                if author_person:
-                    d_authors.append(author_person)
-                else:
-                    print("could not find", author)
-            doc_authors = d_authors
-
-            d_recipients = []
-            for recipient in doc_recipients:
-                recipient_person = people_db.get_person_from_alias(recipient)
-                if recipient_person:
-                    d_recipients.append(recipient_person)
-                else:
-                    print("Could not find", recipient)
-            doc_recipients = d_recipients
-
-            for author in doc_authors:
-                author.docs_authored.append(doc)
-                if author in nodes:
-                    nodes[author]['count_authored'] += 1
-                else:
-                    embed()
-                    nodes[author] = {'person': author, 'docs_authored': {}, 'count_received': 0}
-
-            for recipient in doc_recipients:
-                if recipient in nodes:
-                    nodes[recipient]['count_received'] += 1
-                else:
-                    nodes[recipient] = {'person': recipient, 'count_authored': 0,
-                                        'count_received': 1}
-
-            for author in doc_authors:
                 for recipient in doc_recipients:
-                    edge = tuple(sorted([author, recipient]))
-                    if edge in edges:
-                        edges[edge]['count'] += 1
+                    if recipient in nodes:
+                        nodes[recipient]['count_received'] += 1
                     else:
-                        edges[edge] = {'edge': edge, 'count': 1}
+                        nodes[recipient] = {'person': recipient, 'count_authored': 0,
+                                            'count_received': 1}
+
+                for author in doc_authors:
+                    for recipient in doc_recipients:
+                        edge = tuple(sorted([author, recipient]))
+                        if edge in edges:
+                            edges[edge]['count'] += 1
+                        else:
+                            edges[edge] = {'edge': edge, 'count': 1}
 
         with open(NETWORK_PATH, 'wb') as out:
             network = {'nodes': nodes, 'edges': edges}
@@ -180,19 +203,49 @@ def store_network_for_visualization(nodes, edges, center_names, network_name, fi
         'center_names': {name:True for name in center_names}    # dict bc set can't be jsoned.
     }
     out_path = Path('..', 'backend', 'data', file_name)
-    with open(out_path, 'w') as out:
+    with open(out_path, 'w', encoding='utf-8') as out:
         json.dump(network, out, sort_keys=True, indent=4)
 
 
+def create_network_people_db(people_db, nodes_temp, max_number_of_nodes=100,
+                             manual_merge=False):
+    """
+    Creates a separate people db of the most common persons of a network and merges them.
+    The persons get cloned, so that their network counts do not change the loaded people db.
+    Persons created by merges get person_ids that no person of the loaded people db has, so
+    they cannot be confused with the persons in nodes_temp or the center people of the network.
+    :param people_db: PeopleDatabase, the loaded people db
+    :param nodes_temp: Counter of persons of people_db -> number of documents in the network
+    :param max_number_of_nodes: int
+    :param manual_merge: bool
+    :return: PeopleDatabase
+    """
+    new_people_db = PeopleDatabase()
+    new_people_db.next_person_id = people_db.next_person_id
+    for node, node_count in nodes_temp.most_common(max_number_of_nodes):
+        print("\n", node_count, "\n", node)
+        # clone the person so that the network count does not change the loaded people db
+        node = node.clone()
+        node.count = node_count
+        new_people_db.add_person(node)
+    new_people_db.generate_alias_to_person_dict()
+    new_people_db.merge_duplicates(manual_merge=manual_merge)
+    return new_people_db
+
+
 def generate_people_network(names, network_name, max_number_of_nodes=100,   # pylint: disable=R0914
-                            include_2nd_degree_connections=False):
+                            include_2nd_degree_connections=False, manual_merge=True):
 
     """
     Generate the network of one or multiple people. The resulting json is stored in
     backend/data
+    With manual_merge, the persons of the network get merged by hand (see
+    PeopleDatabase.manually_merge_db). Stored decisions get applied without asking, so
+    rebuilding a network runs unattended once all pairs are decided.
     :param names: list
     :param network_name: str
     :param max_number_of_nodes: int
+    :param manual_merge: bool
     :return:
     """
     if include_2nd_degree_connections:
@@ -200,7 +253,7 @@ def generate_people_network(names, network_name, max_number_of_nodes=100,   # py
 
     # Load people db
     people_db = PeopleDatabase()
-    people_db.load_from_disk(Path(PEOPLE_DB_PATH))
+    people_db.load_from_disk(Path(PEOPLE_DB_PATH), store_post_load_state=True)
 
 
     # initialize the center group of people
@@ -227,7 +280,7 @@ def generate_people_network(names, network_name, max_number_of_nodes=100,   # py
     center_person_doc_counter = Counter()
 
     # first identify all the primary edges including at least one person from center_people
-    for idx, edge in enumerate(edges.values()):
+    for edge in edges.values():
 
         person1 = people_db.get_person_from_alias(edge['edge'][0].aliases.most_common(1)[0][0])
         person2 = people_db.get_person_from_alias(edge['edge'][1].aliases.most_common(1)[0][0])
@@ -259,17 +312,13 @@ def generate_people_network(names, network_name, max_number_of_nodes=100,   # py
         raise ValueError("Found 0 documents for at least one person. embed here and investigate!")
 
     # store all people in the network to be displayed in their own network
-    new_people_db = PeopleDatabase()
-    for node, node_count in nodes_temp.most_common(max_number_of_nodes):
-        print("\n", node_count, "\n", node)
-        node.count = node_count
-        new_people_db.people.add(node)
-    new_people_db.generate_alias_to_person_dict()
-    new_people_db.merge_duplicates(manual_merge=True)
+    new_people_db = create_network_people_db(people_db, nodes_temp, max_number_of_nodes,
+                                             manual_merge)
 
+    most_likely_positions = new_people_db.get_most_likely_positions()
     for node in sorted(new_people_db.people, key=lambda x: x.count)[::-1]:
         nodes_out.append({'name': node.full_name, 'docs': nodes_temp[node], 'words': 0,
-                          'affiliation': node.most_likely_position})
+                          'affiliation': most_likely_positions[node]})
 
     edges_out = []
     for edge in edges.values():
@@ -309,7 +358,7 @@ def search_possible_matches(name, people_db=None):
 
     if not people_db:
         people_db = PeopleDatabase()
-        people_db.load_from_disk(Path(PEOPLE_DB_PATH))
+        people_db.load_from_disk(Path(PEOPLE_DB_PATH), store_post_load_state=True)
 
     possible_matches = Counter()
 
@@ -322,7 +371,8 @@ def search_possible_matches(name, people_db=None):
     return possible_matches
 
 
-def parse_authors_or_recipients_of_doc(side, doc, counters, people_db):     # pylint: disable=C0103
+def parse_authors_or_recipients_of_doc(side, doc, counters, people_db,  # pylint: disable=C0103
+                                       name_labels=None):
     """
 
     Parse one csv row and get persons back
@@ -331,6 +381,8 @@ def parse_authors_or_recipients_of_doc(side, doc, counters, people_db):     # py
     :param doc:
     :param counters:
     :param people_db:
+    :param name_labels: dict of raw name -> label from classify_names. Names in the dict do not
+    have to be parsed again
     :return:
     """
 
@@ -353,6 +405,15 @@ def parse_authors_or_recipients_of_doc(side, doc, counters, people_db):     # py
             if len(name) < 4:
                 continue
 
+            if name_labels and name in name_labels:
+                label = name_labels[name]
+                if label == 'valid':
+                    doc_people.append(name)
+                elif label == 'organization_from_person':
+                    doc_organizations.append(name)
+                counters[label][name] += 1
+                continue
+
             person = Person(name_raw=name)
             if person.check_if_this_person_looks_valid():
                 doc_people.append(name)
@@ -430,10 +491,101 @@ def check_if_name_looks_like_an_organization(name):     # pylint: disable=C0103
     :param name:
     :return:
     """
-    if re.match('^[a-zA-Z]+ [a-zA-Z]+ [a-zA-Z ]+$', name):
+    if re.match(ORGANIZATION_REGEX, name):
         return True
     return False
 
+
+def get_names_of_person_columns(df):       # pylint: disable=C0103
+    """
+    Returns all raw names of the person columns (au, au_person, rc, rc_person) of a documents
+    dataframe
+    :param df: pandas DataFrame
+    :return: pandas Series of str
+    """
+    names = []
+    for column in ['au', 'au_person', 'rc', 'rc_person']:
+        for column_value in df[column]:
+            names += parse_column_person(column_value)
+    return pd.Series(names, dtype=object)
+
+
+def classify_names(names, raw_org_to_clean_org_dict, workers=1):
+    """
+    Classifies raw names from person columns like parse_authors_or_recipients_of_doc does, but
+    for many names at once. Every distinct name gets parsed once (see Person.parse_many) and the
+    checks of Person.check_if_this_person_looks_valid and
+    check_if_name_looks_like_an_organization run as vectorized string operations, so no Persons
+    get created.
+
+    Labels:
+        'known_organization': the name is in raw_org_to_clean_org_dict
+        'too_short': less than 4 characters
+        'valid': valid person
+        'organization_from_person': looks like an organization
+        'invalid': neither
+        'error': could not be parsed
+
+    :param names: pandas Series or list of str
+    :param raw_org_to_clean_org_dict: dict
+    :param workers: int, number of processes used to parse the names
+    :return: pandas Series of labels (str) with the names as index
+    """
+    unique_names = pd.Series(pd.unique(pd.Series(names, dtype=object)), dtype=object)
+    labels = pd.Series('invalid', index=unique_names.index, dtype=object)
+
+    known_organization = unique_names.isin(set(raw_org_to_clean_org_dict))
+    too_short = ~known_organization & (unique_names.str.len() < 4)
+    to_parse = ~(known_organization | too_short)
+
+    parse_results = Person.parse_many(unique_names[to_parse], workers=workers)
+    error = pd.Series([result is None for result in parse_results],
+                      index=unique_names.index[to_parse], dtype=bool)
+    # Person stores first, middle, and last names in upper case
+    parsed_names = pd.DataFrame([result[:3] if result else ('', '', '')
+                                 for result in parse_results],
+                                columns=['first', 'middle', 'last'],
+                                index=unique_names.index[to_parse], dtype=object)
+    valid_person = get_valid_person_mask(parsed_names) & ~error
+    looks_like_organization = unique_names[to_parse].str.match(ORGANIZATION_REGEX)
+
+    set_labels_by_precedence(labels, [('organization_from_person', looks_like_organization),
+                                      ('valid', valid_person), ('error', error),
+                                      ('too_short', too_short),
+                                      ('known_organization', known_organization)])
+    labels.index = unique_names
+    return labels
+
+
+def set_labels_by_precedence(labels, label_masks):
+    """
+    Sets the labels of classify_names where the masks are True. Names can match several masks,
+    later masks take precedence (e.g. a known organization that is too short is a
+    known_organization)
+    :param labels: pandas Series of labels (str), changed in place
+    :param label_masks: list of (label, pandas Series of bool) with indexes from labels
+    :return: None
+    """
+    for label, mask in label_masks:
+        labels[mask.index[mask]] = label
+
+
+def get_valid_person_mask(parsed_names):
+    """
+    Vectorized version of Person.check_if_this_person_looks_valid: first, last and (if there
+    is one) middle name may only contain letters
+    :param parsed_names: pandas DataFrame with the columns first, middle and last
+    :return: pandas Series of bool
+    """
+    first = parsed_names['first'].str.upper()
+    middle = parsed_names['middle'].str.upper()
+    last = parsed_names['last'].str.upper()
+    return (
+        last.str.match(LETTERS_ONLY_REGEX) &
+        first.str.match(LETTERS_ONLY_REGEX) &
+        ((middle.str.len() == 0) | middle.str.match(LETTERS_ONLY_REGEX))
+    )
+
 # TODO: get the top_n_edges function to work again after updating the other functions in this file.
 # def generate_network_of_top_n_edges(n_edges=100):
 #     """
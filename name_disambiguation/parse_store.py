@@ -0,0 +1,138 @@
+"""
+Persistent store for parsed raw names, shared across pipeline runs.
+Backs the in-memory NameParseCache of name_parse_cache.py so that warm reruns of the pipeline do
+not have to parse the same raw names again.
+"""
+
+import hashlib
+import json
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+from name_disambiguation.config import DATA_PATH
+
+PARSE_STORE_PATH = Path(DATA_PATH, 'name_disambiguation', 'name_parse_cache.sqlite3')
+ORG_NAMES_PATH = Path(DATA_PATH, 'name_disambiguation', 'clean_org_names_to_raw_org_names.json')
+
+
+def get_file_fingerprint(file_path):
+    """
+    Returns the sha1 hash of a file's contents
+    :param file_path: Path
+    :return: str
+    """
+    with open(file_path, 'rb') as infile:
+        return hashlib.sha1(infile.read()).hexdigest()
+
+
+class PersistentParseStore:
+    """
+    SQLite store that maps (raw name, extract_orgs) to the parsed first, middle, last names and
+    positions (parsed with count=1).
+    The store remembers the parser version and the fingerprint of the org names json it was
+    created with. If either changes, all stored results get dropped when the store is opened.
+
+    Attributes:
+        file_path (Path): location of the sqlite file
+        fingerprint (str): parser version + hash of the org names json
+        hits (int): number of lookups that found a stored result
+        misses (int): number of lookups that did not
+    """
+    def __init__(self, parser_version, file_path=PARSE_STORE_PATH,
+                 org_names_path=ORG_NAMES_PATH, batch_size=10000):
+        """
+        Opens (or creates) the store and drops all results if the fingerprint changed
+        :param parser_version: str or int, version of the parser that created the results
+        :param file_path: Path of the sqlite file
+        :param org_names_path: Path of clean_org_names_to_raw_org_names.json
+        :param batch_size: int, number of new results to collect before writing them
+        """
+        self.file_path = file_path
+        self.fingerprint = f'{parser_version}:{get_file_fingerprint(org_names_path)}'
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+
+        self._connection = sqlite3.connect(str(file_path))
+        self._connection.execute('CREATE TABLE IF NOT EXISTS meta '
+                                 '(key TEXT PRIMARY KEY, value TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS parsed_names '
+                                 '(name_raw TEXT, extract_orgs INTEGER, first TEXT, middle TEXT, '
+                                 'last TEXT, positions TEXT, PRIMARY KEY (name_raw, extract_orgs))')
+
+        stored_fingerprint = self._connection.execute(
+            "SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if not stored_fingerprint or stored_fingerprint[0] != self.fingerprint:
+            self._connection.execute('DELETE FROM parsed_names')
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)",
+                                     (self.fingerprint,))
+        self._connection.commit()
+
+    def __len__(self):
+        """
+        :return: int (number of stored results, including ones not yet written)
+        """
+        self.flush()
+        return self._connection.execute('SELECT COUNT(*) FROM parsed_names').fetchone()[0]
+
+    def get(self, name_raw, extract_orgs):
+        """
+        Returns the stored (first, middle, last, positions) result for a raw name or None
+        :param name_raw: str
+        :param extract_orgs: bool
+        :return: tuple or None
+        """
+        key = (name_raw, bool(extract_orgs))
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key]
+
+        row = self._connection.execute(
+            'SELECT first, middle, last, positions FROM parsed_names '
+            'WHERE name_raw = ? AND extract_orgs = ?', (name_raw, int(extract_orgs))).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        first, middle, last, positions = row
+        return first, middle, last, Counter(dict(json.loads(positions)))
+
+    def set(self, name_raw, extract_orgs, result):
+        """
+        Adds a parse result. Results get written in batches of batch_size
+        :param name_raw: str
+        :param extract_orgs: bool
+        :param result: tuple (first, middle, last, positions Counter parsed with count=1)
+        :return: None
+        """
+        self._pending[(name_raw, bool(extract_orgs))] = result
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all pending results to disk
+        :return: None
+        """
+        if not self._pending:
+            return
+        rows = []
+        for (name_raw, extract_orgs), (first, middle, last, positions) in self._pending.items():
+            # store positions as a list of pairs to keep their order
+            rows.append((name_raw, int(extract_orgs), first, middle, last,
+                         json.dumps(list(positions.items()))))
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO parsed_names VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self._connection.commit()
+        self._pending = {}
+
+    def close(self):
+        """
+        Writes pending results and closes the database connection
+        :return: None
+        """
+        self.flush()
+        self._connection.close()
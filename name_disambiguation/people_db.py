@@ -2,37 +2,123 @@
 The People Database provides a class to add and merge persons
 """
 
-import copy
 import csv
-import itertools
+import hashlib
+import json
+import os
 import pickle
-import unittest
+import time
 from collections import Counter, defaultdict
 from pathlib import Path
 
-from nameparser.config import CONSTANTS  # pylint: disable=C0411
-
-from name_disambiguation.clean_org_names import RAW_ORG_TO_CLEAN_ORG_DICT
+from name_disambiguation.atomic_file import atomic_write
+from name_disambiguation.clean_org_names import ORG_DICTIONARY
 from name_disambiguation.config import COMPANY_ABBREVIATIONS_TO_SKIP, MANUALLY_MERGED_NAMES
+from name_disambiguation.copy_on_write import CopyOnWriteMixin
+from name_disambiguation.manual_merge_decisions import ManualMergeMixin
+from name_disambiguation.merge_checkpoint import MERGE_CHECKPOINT_VERSION
+from name_disambiguation.merge_engines import MergeEnginesMixin
+from name_disambiguation.merge_log import MERGE_RULE_MANUALLY_MERGED_NAMES, \
+    MERGE_RULE_NAME_CHECK, MERGE_RULE_SHARED_ALIAS, MERGE_RULE_UNION_FIND, read_merge_log
 from name_disambiguation.person import Person
 
-CONSTANTS.titles.remove(*CONSTANTS.titles)
+
+def get_post_load_fingerprint():
+    """
+    Returns a fingerprint of the config lists that load_from_disk applies to a loaded db
+    (COMPANY_ABBREVIATIONS_TO_SKIP and MANUALLY_MERGED_NAMES)
+    :return: str
+    """
+    config_lists = json.dumps([sorted(COMPANY_ABBREVIATIONS_TO_SKIP), MANUALLY_MERGED_NAMES],
+                              sort_keys=True)
+    return hashlib.sha1(config_lists.encode('utf-8')).hexdigest()
+
+
+def get_post_load_state_path(file_path):
+    """
+    Returns the path of the post-load state file that PeopleDatabase.load_from_disk stores for a
+    people db pickle, e.g. people_db.postload.pickle for people_db.pickle
+    :param file_path: Path of the people db pickle
+    :return: Path
+    """
+    file_path = Path(file_path)
+    return file_path.with_name(f'{file_path.stem}.postload.pickle')
 
 
-class PeopleDatabase:
+def get_post_load_source_tag(file_path):
+    """
+    Returns the size and modification time of a people db pickle. A post-load state only
+    belongs to the pickle if the pickle still has the same tag.
+    :param file_path: Path of the people db pickle
+    :return: list of int
+    """
+    file_stat = os.stat(str(file_path))
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def store_pickle_atomically(obj, file_path):
+    """
+    Pickles obj to file_path. Writes to a temporary file next to file_path first, so that
+    processes loading the file never see a partial file.
+    :param obj: object to pickle
+    :param file_path: Path
+    :return: None
+    """
+    with atomic_write(file_path) as outfile:
+        pickle.dump(obj, outfile)
+
+
+class PeopleDatabase(CopyOnWriteMixin, MergeEnginesMixin, ManualMergeMixin):
     """
     A PeopleDatabase object represents the collection of person objects
-    and contains functions that merge person objects
+    and contains functions that merge person objects (merge_duplicates and the other merge
+    engines are in merge_engines.py, copy-on-write copies in copy_on_write.py and manual
+    merging in manual_merge_decisions.py)
     Attributes:
         people (set): collection of all person objects in the database
+        next_person_id (int): person_id that the next added person will get
+        _last_name_to_people (dict): maps last names to the set of persons with that last name.
+                                     Kept up to date by add_person and remove_person, so that
+                                     merging only has to look at persons with the same last name
+        _alias_to_person_ids (dict): maps every alias (as in Person.aliases) to the person_ids of
+                                     all persons with that alias. Kept up to date like
+                                     _last_name_to_people. Unlike _alias_to_person_dict, which
+                                     maps lower case aliases to one person for lookups, it is
+                                     used to find the persons that share an alias when merging
+        post_load_fingerprint (str): get_post_load_fingerprint() of the config lists that
+                                     load_from_disk applied to the db. None for dbs that have
+                                     not been loaded or have changed since
+        merge_log (MergeLog): if set, every merge of merge_two_persons and merge_persons gets
+                              logged there (see replay_merge_log). Not pickled
+        _shares_containers (bool): True if people, the indexes, _alias_to_person_dict and
+                                   raw_org_to_clean_org_dict may be shared with a copy of the db
+                                   (see copy). They get copied before the first change
+        _shared_person_id_limit (int): persons with a lower person_id may be shared with a copy
+                                       of the db and get cloned before they change.
+                                       0 if the db has never been copied
+        _owned_person_ids (set): person_ids below _shared_person_id_limit of persons that have
+                                 been cloned since the last copy
+        _owned_index_keys (dict): last names and aliases whose sets in _last_name_to_people and
+                                  _alias_to_person_ids have been copied since the last copy.
+                                  None if the db has never been copied, and None for an index
+                                  once all of its sets have been copied
     """
     def __init__(self):
         """
         Intiailizes an empty PeopleDatabase
         """
         self.people = set()
+        self.next_person_id = 0
         self._alias_to_person_dict = {}
-        self.raw_org_to_clean_org_dict = RAW_ORG_TO_CLEAN_ORG_DICT.copy()
+        self._last_name_to_people = defaultdict(set)
+        self._alias_to_person_ids = defaultdict(set)
+        self.raw_org_to_clean_org_dict = ORG_DICTIONARY.raw_to_clean.copy()
+        self.post_load_fingerprint = None
+        self.merge_log = None
+        self._shares_containers = False
+        self._shared_person_id_limit = 0
+        self._owned_person_ids = set()
+        self._owned_index_keys = None
 
     def add_person_raw(self, name_raw: str, count=1, position=None):
         """
@@ -53,40 +139,184 @@ class PeopleDatabase:
                 positions = Counter()
 
             new_p = Person(name_raw=name_raw, count=count, positions=positions)
-
-            # if the raw name is already in the people_db, merge the entries
-            existing_p = self.get_person_from_alias(name_raw)
-            if existing_p:
-                # remove person temporarily as the hash value will change with the updates
-                # making it impossible to remove later
-                self.people.remove(existing_p)
-                existing_p.positions += new_p.positions
-                existing_p.aliases += new_p.aliases
-                existing_p.count += new_p.count
-
-                self.add_alias_to_alias_to_person_dict(name_raw, existing_p)
-                if not self.get_person_from_alias(existing_p.full_name):
-                    self.add_alias_to_alias_to_person_dict(existing_p.full_name, existing_p)
-                self.people.add(existing_p)
-
-                # add any new organizations to the raw_org_to_clean_dict
-                for pos in existing_p.positions:
-                    if not pos in self.raw_org_to_clean_org_dict:
-                        self.raw_org_to_clean_org_dict[pos] = pos
-
-            else:
-                self.people.add(new_p)
-                self.add_alias_to_alias_to_person_dict(name_raw, new_p)
-                if not self.get_person_from_alias(new_p.full_name):
-                    self.add_alias_to_alias_to_person_dict(new_p.full_name, new_p)
-                # add any new organizations to the raw_org_to_clean_dict
-                for pos in new_p.positions:
-                    if not pos in self.raw_org_to_clean_org_dict:
-                        self.raw_org_to_clean_org_dict[pos] = pos
+            self.add_or_merge_person(name_raw, new_p)
 
         except IndexError:
             print(f"Could not parse name_raw {name_raw} to Person.")
 
+    def add_or_merge_person(self, name_raw: str, new_p: Person):
+        """
+        Adds a person created from name_raw to the database or, if name_raw is already the alias
+        of a person, merges it into that person. Used by add_person_raw and add_people_bulk
+        :param name_raw: str
+        :param new_p: Person
+        :return: None
+        """
+        self.unshare_containers()
+        # if the raw name is already in the people_db, merge the entries
+        existing_p = self.get_person_from_alias(name_raw)
+        if existing_p:
+            self.post_load_fingerprint = None
+            existing_p = self.own_person(existing_p)
+            existing_p.positions += new_p.positions
+            existing_p.aliases += new_p.aliases
+            existing_p.count += new_p.count
+            existing_p.compact()
+            for alias, _ in new_p.alias_items():
+                self.get_index_set('_alias_to_person_ids', alias).add(existing_p.person_id)
+
+            self.add_alias_to_alias_to_person_dict(name_raw, existing_p)
+            if not self.get_person_from_alias(existing_p.full_name):
+                self.add_alias_to_alias_to_person_dict(existing_p.full_name, existing_p)
+
+            # add any new organizations to the raw_org_to_clean_dict
+            for pos, _ in existing_p.position_items():
+                if not pos in self.raw_org_to_clean_org_dict:
+                    self.raw_org_to_clean_org_dict[pos] = pos
+
+        else:
+            self.add_person(new_p)
+            self.add_alias_to_alias_to_person_dict(name_raw, new_p)
+            if not self.get_person_from_alias(new_p.full_name):
+                self.add_alias_to_alias_to_person_dict(new_p.full_name, new_p)
+            # add any new organizations to the raw_org_to_clean_dict
+            for pos, _ in new_p.position_items():
+                if not pos in self.raw_org_to_clean_org_dict:
+                    self.raw_org_to_clean_org_dict[pos] = pos
+
+    def add_people_bulk(self, names, min_count=1, workers=1):
+        """
+        Adds many raw names at once. Gives the same db as calling add_person_raw(name_raw, count)
+        for every raw name that appears at least min_count times, but
+        - repeated raw names get added once with their total count
+        - all names get parsed up front with Person.parse_many (in parallel with workers > 1)
+        - persons get created from the parse results (see Person.from_parse_result) without
+          going through NAME_PARSE_CACHE
+
+        :param names: dict or Counter of raw names and counts, or an iterable of raw names
+        :param min_count: int, raw names that appear fewer times get skipped
+        :param workers: int, number of processes used to parse the raw names
+        :return: None
+        """
+        if isinstance(names, dict):
+            name_counts = names
+        else:
+            name_counts = Counter(names)
+        names_raw = [name_raw for name_raw, count in name_counts.items() if count >= min_count]
+
+        parse_results = Person.parse_many(names_raw, workers=workers)
+        self.unshare_containers()
+        alias_to_person = self._alias_to_person_dict
+        for name_raw, parse_result in zip(names_raw, parse_results):
+            count = name_counts[name_raw]
+            if parse_result is None:
+                # add_person_raw raises or prints the parsing error
+                self.add_person_raw(name_raw, count)
+                continue
+
+            new_p = Person.from_parse_result(name_raw, parse_result, count)
+            if name_raw.lower() in alias_to_person:
+                self.add_or_merge_person(name_raw, new_p)
+                continue
+
+            self.add_person(new_p)
+            alias_to_person[name_raw.lower()] = new_p
+            full_name = new_p.full_name.lower()
+            if full_name not in alias_to_person:
+                alias_to_person[full_name] = new_p
+            for position, _ in new_p.position_items():
+                if position not in self.raw_org_to_clean_org_dict:
+                    self.raw_org_to_clean_org_dict[position] = position
+
+    def add_person(self, person: Person):
+        """
+        Adds a Person object to the database. Persons without a person_id get the next free id,
+        persons that already have one (e.g. from another database) keep it.
+        Does not update the _alias_to_person_dict
+        :param person: Person
+        :return: None
+        """
+        self.post_load_fingerprint = None
+        self.unshare_containers()
+        if person.person_id is None:
+            person.person_id = self.next_person_id
+        self.next_person_id = max(self.next_person_id, person.person_id + 1)
+        self.people.add(person)
+        self.get_index_set('_last_name_to_people', person.last).add(person)
+        for alias in person.alias_keys():
+            self.get_index_set('_alias_to_person_ids', alias).add(person.person_id)
+
+    def remove_person(self, person: Person):
+        """
+        Removes a Person object from the database (but not its aliases from the
+        _alias_to_person_dict).
+        Persons whose last name or aliases change have to be removed before and added again
+        after the change to keep the _last_name_to_people and _alias_to_person_ids indexes up to
+        date
+        :param person: Person
+        :return: None
+        """
+        self.post_load_fingerprint = None
+        self.unshare_containers()
+        self.people.remove(person)
+        last_name_people = self.get_index_set('_last_name_to_people', person.last)
+        last_name_people.discard(person)
+        if not last_name_people:
+            self.delete_index_key('_last_name_to_people', person.last)
+        for alias in person.alias_keys():
+            alias_person_ids = self.get_index_set('_alias_to_person_ids', alias)
+            alias_person_ids.discard(person.person_id)
+            if not alias_person_ids:
+                self.delete_index_key('_alias_to_person_ids', alias)
+
+    def check_index_consistency(self):
+        """
+        Compares the _last_name_to_people and _alias_to_person_ids indexes with indexes built
+        from scratch from self.people (used in tests)
+        :return: list of str (descriptions of inconsistencies, empty if the indexes are correct)
+        """
+        last_name_to_people = defaultdict(set)
+        alias_to_person_ids = defaultdict(set)
+        for person in self.people:
+            last_name_to_people[person.last].add(person)
+            for alias, _ in person.alias_items():
+                alias_to_person_ids[alias].add(person.person_id)
+
+        errors = []
+        for name, index, expected_index in [
+                ('_last_name_to_people', self._last_name_to_people, last_name_to_people),
+                ('_alias_to_person_ids', self._alias_to_person_ids, alias_to_person_ids)
+        ]:
+            for key in sorted(set(index) | set(expected_index)):
+                if index.get(key, set()) != expected_index.get(key, set()):
+                    errors.append(f'{name}[{key!r}]: {index.get(key)} instead of '
+                                  f'{expected_index.get(key)}')
+        return errors
+
+    def get_alias_groups(self, persons):
+        """
+        Finds the persons that share aliases by walking the _alias_to_person_ids postings of
+        their aliases
+        :param persons: list of Person objects in the db
+        :return: list of lists of indexes into persons, one for every alias that at least two
+                 of the persons share
+        """
+        person_id_to_idx = {person.person_id: idx for idx, person in enumerate(persons)}
+        visited_aliases = set()
+        alias_groups = []
+        for person in persons:
+            for alias in person.alias_keys():
+                if alias in visited_aliases:
+                    continue
+                visited_aliases.add(alias)
+                alias_person_ids = self._alias_to_person_ids[alias]
+                if len(alias_person_ids) > 1:
+                    indices = sorted(person_id_to_idx[person_id] for person_id in alias_person_ids
+                                     if person_id in person_id_to_idx)
+                    if len(indices) > 1:
+                        alias_groups.append(indices)
+        return alias_groups
+
     def __len__(self):
         """
         Returns the number of people in the database
@@ -96,17 +326,22 @@ class PeopleDatabase:
 
     def __eq__(self, other):
         """
-        Compares two PeopleDatabase objects
+        Compares two PeopleDatabase objects by the content (names, positions, aliases) of their
+        persons
         :param other: another PeopleDatabase object
         :return: bool (if the people sets are the same)
         """
-        hash1 = []
-        hash2 = []
-        for person in sorted(list(self.people)):
-            hash1.append(hash(person))
-        for person in sorted(list(other.people)):
-            hash2.append(hash(person))
-        return sorted(hash1) == sorted(hash2)
+        return (Counter(person.content_key() for person in self.people) ==
+                Counter(person.content_key() for person in other.people))
+
+    def __getstate__(self):
+        """
+        Returns the state for pickling without the merge_log, which holds an open file
+        :return: dict
+        """
+        state = self.__dict__.copy()
+        state['merge_log'] = None
+        return state
 
     def __repr__(self):
         """
@@ -116,15 +351,6 @@ class PeopleDatabase:
         """
         return f"<PeopleDatabase with {len(self.people)} people:\n {self.people}>"
 
-    def copy(self):
-        """
-        Copies a people_db object
-        :return: a copied people_db object
-        """
-        people_db_copy = PeopleDatabase()
-        people_db_copy.people = copy.deepcopy(self.people)
-        return people_db_copy
-
     @property
     def counter(self):
         """
@@ -137,6 +363,22 @@ class PeopleDatabase:
         return person_counter
 
 
+    def get_most_likely_positions(self):
+        """
+        Calculates the most likely position (affiliation) of every person in the database in one
+        pass. Persons with the same positions share the calculation.
+        :return: dict of Person -> str
+        """
+        # position items -> most likely position
+        shared_positions = {}
+        most_likely_positions = {}
+        for person in self.people:
+            position_items = tuple(person.position_items())
+            if position_items not in shared_positions:
+                shared_positions[position_items] = person.most_likely_position
+            most_likely_positions[person] = shared_positions[position_items]
+        return most_likely_positions
+
     def generate_alias_to_person_dict(self):
         """
         Generates a the _alias_to_person_dict that corresponds aliases to person objects
@@ -144,10 +386,12 @@ class PeopleDatabase:
         """
 
         for person in self.people:
-            for alias in person.aliases.keys():
+            aliases = person.alias_keys()
+            for alias in aliases:
                 self.add_alias_to_alias_to_person_dict(alias, person)
-                if not self.get_person_from_alias(person.full_name):
-                    self.add_alias_to_alias_to_person_dict(person.full_name, person)
+            # the full name only maps to the person if no other person has it as an alias
+            if aliases and not self.get_person_from_alias(person.full_name):
+                self.add_alias_to_alias_to_person_dict(person.full_name, person)
 
         # alias_to_person = {}
         # for person in self.people:
@@ -157,53 +401,139 @@ class PeopleDatabase:
 
     def store_to_disk(self, file_path: Path):
         """
-        Stores a people db to disk as a pickle file
+        Stores a people db to disk as a pickle file. Writes to a temporary file first, so that
+        processes loading the db never see a partial file.
         :param file_path: Path for storing pickle file
         :return:
         """
+        store_pickle_atomically(self, file_path)
 
-        with open(str(file_path), 'wb') as outfile:
-            pickle.dump(self, outfile)
-
-    def load_from_disk(self, file_path: Path):
+    def load_from_disk(self, file_path: Path, store_post_load_state=False):
         """
-        Load a people db from a pickle file
+        Load a people db from a pickle file.
+        After unpickling, company accounts get removed, the _alias_to_person_dict gets generated
+        and the manual merges from config.py get applied. The result of these steps can be
+        stored in a separate post-load state file next to the pickle (see
+        get_post_load_state_path), tagged with the get_post_load_fingerprint() of the config
+        lists and the size and modification time of the pickle. If neither has changed since,
+        the post-load state gets loaded instead of the pickle. The pickle itself never gets
+        changed, so changing the config lists always reruns the steps on the original persons.
+        A db that was stored after these steps remembers its post_load_fingerprint and gets
+        used as is if the config lists have not changed.
+        Prints how long each phase took.
+
         :param file_path: Path of pickle file
+        :param store_post_load_state: if True and the post-load steps had to run, stores the
+                                      post-load state so that the next load can skip them
         :return:
         """
-
+        phase_times = {}
+        start_time = time.time()
+        fingerprint = get_post_load_fingerprint()
+        source_tag = get_post_load_source_tag(file_path)
+        self.raw_org_to_clean_org_dict = ORG_DICTIONARY.raw_to_clean
+        post_load_state_path = get_post_load_state_path(file_path)
+        if post_load_state_path.exists():
+            with open(str(post_load_state_path), 'rb') as infile:
+                post_load_state = PeopleDatabaseUnpickler(infile).load()
+            if (post_load_state['fingerprint'] == fingerprint and
+                    post_load_state['source'] == source_tag):
+                self.set_post_load_state(post_load_state['people_db'])
+                print(f'Loaded {len(self)} persons from {post_load_state_path}: unpickle '
+                      f'{time.time() - start_time:.2f}s.')
+                return
 
         with open(str(file_path), 'rb') as infile:
-            loaded_db = pickle.load(infile)
-
-            self.people = set()
-            self._alias_to_person_dict = {}
-            self.raw_org_to_clean_org_dict = RAW_ORG_TO_CLEAN_ORG_DICT
-            for person in loaded_db.people:
+            loaded_db = PeopleDatabaseUnpickler(infile).load()
+        phase_times['unpickle'] = time.time() - start_time
 
-                # our main person db has some company accounts in there -> delete
-                add_person = True
-                for alias in person.aliases.keys():
-                    if (
-                            alias.lower().replace(' ', '') in COMPANY_ABBREVIATIONS_TO_SKIP or
-                            person.full_name.lower().replace(' ', '') in
-                            COMPANY_ABBREVIATIONS_TO_SKIP
-                    ):
-                        add_person = False
-                        break
+        if getattr(loaded_db, 'post_load_fingerprint', None) == fingerprint:
+            self.set_post_load_state(loaded_db)
+            print(f'Loaded {len(self)} persons from {file_path} with stored post-load state: '
+                  f'unpickle {phase_times["unpickle"]:.2f}s.')
+            return
 
-                # for position in person.positions:
-                #     if position not in self.raw_org_to_clean_org_dict:
-                #         self.raw_org_to_clean_org_dict[position] = position
-
-                if add_person:
-                    self.people.add(person)
-
-
-            self.generate_alias_to_person_dict()
-            self.add_manually_merged_names()
-            self.generate_alias_to_person_dict()
+        start_time = time.time()
+        self.people = set()
+        # pickles from before persons had ids have no next_person_id
+        self.next_person_id = getattr(loaded_db, 'next_person_id', 0)
+        self._alias_to_person_dict = {}
+        self._last_name_to_people = defaultdict(set)
+        self._alias_to_person_ids = defaultdict(set)
+        for person in loaded_db.people:
+            # our main person db has some company accounts in there -> delete
+            aliases = person.alias_keys()
+            if aliases and (
+                    person.full_name.lower().replace(' ', '') in COMPANY_ABBREVIATIONS_TO_SKIP or
+                    any(alias.lower().replace(' ', '') in COMPANY_ABBREVIATIONS_TO_SKIP
+                        for alias in aliases)
+            ):
+                continue
+            self.add_person(person)
+        phase_times['filter companies'] = time.time() - start_time
+
+        start_time = time.time()
+        self.generate_alias_to_person_dict()
+        phase_times['alias index'] = time.time() - start_time
+
+        start_time = time.time()
+        self.add_manually_merged_names()
+        self.generate_alias_to_person_dict()
+        phase_times['manual merges'] = time.time() - start_time
+        self.post_load_fingerprint = fingerprint
+
+        if store_post_load_state:
+            start_time = time.time()
+            store_pickle_atomically({'fingerprint': fingerprint, 'source': source_tag,
+                                     'people_db': self}, post_load_state_path)
+            phase_times['store'] = time.time() - start_time
+
+        print(f'Loaded {len(self)} persons from {file_path}: ' +
+              ', '.join(f'{phase} {phase_time:.2f}s' for phase, phase_time in phase_times.items())
+              + '.')
+
+    def set_post_load_state(self, loaded_db):
+        """
+        Uses the persons, indexes and alias lookups of a loaded db that has already gone
+        through the post-load steps of load_from_disk
+        :param loaded_db: PeopleDatabase
+        :return: None
+        """
+        self.people = loaded_db.people
+        self.next_person_id = loaded_db.next_person_id
+        self._alias_to_person_dict = loaded_db._alias_to_person_dict   # pylint: disable=W0212
+        self._last_name_to_people = loaded_db._last_name_to_people     # pylint: disable=W0212
+        self._alias_to_person_ids = loaded_db._alias_to_person_ids     # pylint: disable=W0212
+        self.post_load_fingerprint = loaded_db.post_load_fingerprint
 
+    def load_merge_checkpoint(self, file_path: Path):
+        """
+        Replaces the persons, indexes and alias lookups of the db with the ones of a checkpoint
+        written by merge_duplicates (see MergeCheckpointWriter)
+        :param file_path: Path of the checkpoint
+        :return: str, the last fully merged last name
+        """
+        with open(str(file_path), 'rb') as infile:
+            checkpoint = PeopleDatabaseUnpickler(infile).load()
+        if not isinstance(checkpoint, dict) or \
+                checkpoint.get('version') != MERGE_CHECKPOINT_VERSION:
+            raise ValueError(f'{file_path} is not a merge checkpoint of version '
+                             f'{MERGE_CHECKPOINT_VERSION}.')
+
+        loaded_db = checkpoint['people_db']
+        self.people = loaded_db.people
+        self.next_person_id = loaded_db.next_person_id
+        self._alias_to_person_dict = loaded_db._alias_to_person_dict       # pylint: disable=W0212
+        self._last_name_to_people = loaded_db._last_name_to_people         # pylint: disable=W0212
+        self._alias_to_person_ids = loaded_db._alias_to_person_ids         # pylint: disable=W0212
+        self.raw_org_to_clean_org_dict = loaded_db.raw_org_to_clean_org_dict
+        self.post_load_fingerprint = None
+        # nothing of the loaded db is shared with another db
+        self._shares_containers = False
+        self._shared_person_id_limit = 0
+        self._owned_person_ids = set()
+        self._owned_index_keys = None
+        return checkpoint['last_name']
 
     def add_alias_to_alias_to_person_dict(self, alias: str, person: Person): # pylint: disable=C0103
         """
@@ -216,6 +546,7 @@ class PeopleDatabase:
         :param person: Person
         :return:
         """
+        self.unshare_containers()
         self._alias_to_person_dict[alias.lower()] = person
 
     def remove_alias_to_alias_to_person_dict(self, alias: str):     # pylint: disable=C0103
@@ -225,7 +556,7 @@ class PeopleDatabase:
         :param alias: str
         :return:
         """
-
+        self.unshare_containers()
         del self._alias_to_person_dict[alias.lower()]
 
     def get_person_from_alias(self, alias: str):
@@ -263,20 +594,11 @@ class PeopleDatabase:
 
                 if person1 and person2:
                     if person1 != person2:
-                        self.merge_two_persons(person1, person2, person['authoritative_name'])
+                        self.merge_two_persons(person1, person2, person['authoritative_name'],
+                                               rule=MERGE_RULE_MANUALLY_MERGED_NAMES)
                     else:
-                        # temporarily remove person1 because we're messing with the hash key
-                        # and couldn't remove it later
-                        self.people.remove(person1)
-                        person1.first = person['authoritative_name']['first']
-                        person1.middle = person['authoritative_name']['middle']
-                        person1.last = person['authoritative_name']['last']
-                        if 'affiliation' in person['authoritative_name']:
-                            person1.positions[person['authoritative_name']['affiliation']] = 9999
-                        for alias in person1.aliases:
-                            self.add_alias_to_alias_to_person_dict(alias, person1)
-                        self.add_alias_to_alias_to_person_dict(person1.full_name, person1)
-                        self.people.add(person1)
+                        self.rename_person(person1, person['authoritative_name'],
+                                           rule=MERGE_RULE_MANUALLY_MERGED_NAMES)
 
                 else:
                     # print(f'Could not find {alias1} or {alias2} in people db')
@@ -295,9 +617,9 @@ class PeopleDatabase:
         """
         positions_counter = Counter()
         for person in self.people:
-            for position_name in person.positions:
+            for position_name, _ in person.position_items():
                 positions_counter[position_name] += 1
-        with open(out_file, mode='w') as csv_file:
+        with open(out_file, mode='w', encoding='utf-8') as csv_file:
             fieldnames = ['Raw Name', 'Count', 'Authoritative Name']
             writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
             writer.writeheader()
@@ -308,208 +630,14 @@ class PeopleDatabase:
                 writer.writerow({'Raw Name': organization, 'Count': positions_counter[
                     organization], 'Authoritative Name': authoritative_name})
 
-    def merge_duplicates(self, print_merge_results_for_name='Dunn', manual_merge=False):
-        """
-        Tries to merge all duplicates and only retain authoritative names.
-        e.g. it will try to merge WL Dunn and William Dunn into Dunn, William L
-        You can use print_merg_results_for_name to print out the merge results for one name for
-        further inspection
-
-        if manual_merge = True, user will be prompted to decide for all last names if they should
-        be merged manually. useful for small networks for display purposes.
-
-        :param print_merge_results_for_name: str
-        :param manual_merge: bool
-        :return:
-        """
-
-        last_names = set()
-        for person in self.people:
-            last_names.add(person.last)
-
-        for last_name in sorted(last_names):
-            while True:
-                last_names_dict = defaultdict(list)
-                for person in self.people:
-                    last_names_dict[person.last].append(person)
-
-                finished = self.merge_last_name(last_names_dict, last_name)
-                if finished:
-                    if (
-                            print_merge_results_for_name and
-                            len(last_names_dict[last_name]) > 5
-                            # last_name.lower().find(print_merge_results_for_name.lower()) > -1
-                    ):
-                        print("\nSUMMARY")
-                        for name in last_names_dict[last_name]:
-                            print("\n", name.count, name, name.aliases.most_common(100))
-                        print("\n")
-                    break
-
-        if manual_merge:
-            self.manually_merge_db()
-
-    def manually_merge_db(self):
-        """
-        Manually merge the names in the database.
-        Allows user to merge, for example, "Kornegay, Horace A." with "Kornegay H.", which the
-        automated merger does not do.
-        Relies on user input -> use only for small people databases.
-
-        :return:
-        """
-
-        last_names = set()
-        for person in self.people:
-            last = person.last.upper().replace('*', '')
-            last_names.add(last)
-
-        for last_name in sorted(last_names):
-            self.manually_merge_last_name(last_name)
-
-    def manually_merge_last_name(self, last_name):
-        """
-        manually merges everyone in the database with a given last name.
-
-        :param last_name: str
-        :return:
-        """
-
-        while True:
-            candidates = []
-            for person in self.people:
-                if person.last.upper().replace('*', '') == last_name:
-                    candidates.append(person)
-
-            if len(candidates) == 1:
-                return
-
-            breaking = True
-            for combination in itertools.combinations(candidates, 2):
-
-                person1, person2 = combination
-                if person1.first and person2.first and person1.first[0] != person2.first[0]:
-                    print('skipping because of different first names', person1.full_name,
-                          person2.full_name)
-                    continue
-
-                print(f'\n\nMerge candidate: {person1.full_name} <-> {person2.full_name}')
-                print("\n", person1)
-                print("\n", person2)
-
-                selection = input("Should these 2 people get merged? (y/n):   ")
-                # selection = 'y'
-                if selection == 'y':
-                    new_p = self.merge_two_persons(person1, person2)
-                    print("new", new_p)
-                    breaking = False
-                    break
-
-                if selection == 'n':    # pylint: disable=R1703
-                    breaking = True
-                else:
-                    breaking = False
-
-            if breaking:
-                break
-
-
-
-
-    def merge_last_name(self, last_names_dict, last_name):
-        """
-        Iteratively tries to merge last names from the most common to the least common
-        Returns true if it is finished,
-        :param last_names_dict: dict mapping last_name strings to list of
-        :param last_name:
-        :return:
-        """
-
-        # if only one name -> already finished
-        if len(last_names_dict[last_name]) == 1:
-            return True
-
-        last_names_dict[last_name].sort(key=lambda x: x.count, reverse=True)
-
-        for person1_idx, person1 in enumerate(last_names_dict[last_name]):
-            for person2_idx, person2 in enumerate(last_names_dict[last_name]):
-
-                # p1/2_idx indicate the index of the person. If they are the same, we are dealing
-                # with the same person and should skip.
-                if person1_idx == person2_idx:                               # pylint: disable=R1724
-                    continue
-
-                # If p1 and person2 share at least one alias, we can merge them
-                # the primary use of this is to merge cases where the same author was added
-                # multiple times
-                elif len(set(person1.aliases).intersection(set(person2.aliases))) > 0:
-                    self.merge_two_persons(person1, person2)
-                    return False
-
-
-                # if no first and middle name -> continue
-                elif person1.first == '' and person1.middle == '':
-                    continue
-                elif person2.first == '' and person2.middle == '':
-                    continue
-
-                # if first and middle names match -> merge
-                elif person1.first == person2.first and person1.middle == person2.middle:
-                    self.merge_two_persons(person1, person2)
-                    return False
-
-                # if both have full first names and they don't match -> skip
-                elif (
-                        len(person1.first) > 2 and len(person2.first) > 2 and
-                        person1.first != person2.first
-                ):
-                    continue
-
-                # if both have full middle names and they don't match -> skip
-                elif (
-                        len(person1.middle) > 2 and len(person2.middle) > 2 and
-                        person1.middle != person2.middle
-                ):
-                    continue
-
-                # if initial of the first name is not the same -> skip
-                elif person1.first and person2.first and person1.first[0] != person2.first[0]:
-                    continue
-
-                # if both have at least first and middle initials
-                elif person1.first and person1.middle and person2.first and person2.middle:
-                    if (
-                            person1.first[0] != person2.first[0] or
-                            person1.middle[0] != person2.middle[0]
-                    ):
-                        continue
-
-                    # if first and middle initials match -> merge
-                    if (
-                            person1.first[0] == person2.first[0] and
-                            person1.middle[0] == person2.middle[0]
-                    ):
-                        self.merge_two_persons(person1, person2)
-                        return False    # we're not finished -> return False
-
-                elif len(person1.first) == 1 and not person1.middle:
-                    # TODO
-                    continue
-                elif len(person2.first) == 1 and not person2.middle:
-                    # TODO
-                    continue
-                else:
-                    continue
-
-        # if no merges could be made return True to indicate that merge process is finished
-        return True
-
-    def merge_two_persons(self, person1, person2, authoritative_name=None):
+    def merge_two_persons(self, person1, person2, authoritative_name=None, rule=None):
         """
         Create a new person by merging data of person1 and person2, and replace person1 and
         person2 in the people db with the new person
         :param person1: a person object
         :param person2: another person object to be merged
+        :param rule: int, MERGE_RULE constant of merge_log.py that caused the merge, for the
+                     merge_log. If None, MERGE_RULE_SHARED_ALIAS or MERGE_RULE_NAME_CHECK
         :return:
         """
         # print("\n\nmerging\n", person1, "\n", person2)
@@ -550,65 +678,161 @@ class PeopleDatabase:
 
         new_p.aliases = person1.aliases + person2.aliases
         new_p.count = person1.count + person2.count
+        new_p.compact()
 
-        for alias in new_p.aliases:
+        for alias, _ in new_p.alias_items():
             self.add_alias_to_alias_to_person_dict(alias, new_p)
         self.add_alias_to_alias_to_person_dict(new_p.full_name, new_p)
 
-        self.people.remove(person1)
-        self.people.remove(person2)
-        self.people.add(new_p)
+        self.remove_person(person1)
+        self.remove_person(person2)
+        self.add_person(new_p)
+
+        if self.merge_log is not None:
+            if rule is None:
+                shares_alias = set(person1.alias_keys()).intersection(person2.alias_keys())
+                rule = MERGE_RULE_SHARED_ALIAS if shares_alias else MERGE_RULE_NAME_CHECK
+            affiliation = (authoritative_name or {}).get('affiliation', '')
+            self.merge_log.append(rule, (person1.person_id, person2.person_id), new_p.person_id,
+                                  (new_p.last, new_p.first, new_p.middle, affiliation))
 
         return new_p
 
+    def rename_person(self, person, authoritative_name, rule=MERGE_RULE_MANUALLY_MERGED_NAMES):
+        """
+        Changes the names (and optionally the affiliation) of a person in place, e.g. when all
+        aliases of a MANUALLY_MERGED_NAMES entry already belong to the same person. The person
+        keeps its person_id. Gets logged like a merge of the person into itself, so that
+        replay_merge_log renames the person as well.
+        :param person: Person in the db
+        :param authoritative_name: dict with last, first, middle and optionally affiliation
+        :param rule: int, MERGE_RULE constant of merge_log.py that caused the rename
+        :return: the renamed Person (a clone if the person was shared with a copy of the db)
+        """
+        person = self.own_person(person)
+        # the last name can change -> remove and add again to update the index
+        self.remove_person(person)
+        person.first = authoritative_name['first']
+        person.middle = authoritative_name['middle']
+        person.last = authoritative_name['last']
+        if 'affiliation' in authoritative_name:
+            person.positions[authoritative_name['affiliation']] = 9999
+        person.compact()
+        self.add_person(person)
+        for alias, _ in person.alias_items():
+            self.add_alias_to_alias_to_person_dict(alias, person)
+        self.add_alias_to_alias_to_person_dict(person.full_name, person)
+
+        if self.merge_log is not None:
+            self.merge_log.append(rule, (person.person_id,), person.person_id,
+                                  (person.last, person.first, person.middle,
+                                   authoritative_name.get('affiliation', '')))
+        return person
+
+    def merge_persons(self, persons, first, middle,     # pylint: disable=R0913
+                      authoritative_name=None, rule=MERGE_RULE_UNION_FIND):
+        """
+        Creates a new person from a list of persons (like repeatedly calling merge_two_persons)
+        and replaces them in the people db with the new person
+        :param persons: list of Person objects with the same last name, most common first
+        :param first: str, first name of the new person
+        :param middle: str, middle name of the new person
+        :param authoritative_name: dict with last, first, middle and optionally affiliation of
+                                   the new person (like in merge_two_persons). Overrides first
+                                   and middle
+        :param rule: int, MERGE_RULE constant of merge_log.py that caused the merge
+        :return: the new Person
+        """
+        new_p = persons[0].copy()
+        new_p.first = first
+        new_p.middle = middle
+        if authoritative_name:
+            new_p.last = authoritative_name['last']
+            new_p.first = authoritative_name['first']
+            new_p.middle = authoritative_name['middle']
 
-class TestPeopleDB(unittest.TestCase):
-    """
-    Test cases for the people db
-    """
-    def setUp(self):
-        self.people_db = PeopleDatabase()
-        for initial_name in ['Dunn, WL', 'Garcia, Raquel', 'Risi, Stephan', 'Dunn, WL',
-                             'Dunn, William L', 'Garcia, Raquel']:
-            self.people_db.add_person_raw(initial_name, 1)
+        positions = Counter()
+        aliases = Counter()
+        self.unshare_containers()
+        for person in persons:
+            self._alias_to_person_dict.pop(person.full_name.lower(), None)
+            positions += person.positions
+            aliases += person.aliases
+            self.remove_person(person)
 
-    def test_pickle(self):
-        """
-        Test if pickling works
-        """
-        self.people_db.store_to_disk(Path('..', 'data', 'name_disambiguation',
-                                          'test_peopledb.pickle'))
-        loaded_db = PeopleDatabase()
-        loaded_db.load_from_disk(Path('..', 'data', 'name_disambiguation',
-                                      'test_peopledb.pickle'))
-        self.assertEqual(self.people_db, loaded_db)
+        new_p.positions = positions
+        if authoritative_name and 'affiliation' in authoritative_name:
+            new_p.positions[authoritative_name['affiliation']] = 9999
+        new_p.aliases = aliases
+        new_p.count = sum(person.count for person in persons)
+        new_p.compact()
 
-    def test_merge1(self):
-        """
-        Test people_db merge 1
-        """
+        for alias, _ in new_p.alias_items():
+            self.add_alias_to_alias_to_person_dict(alias, new_p)
+        self.add_alias_to_alias_to_person_dict(new_p.full_name, new_p)
+        self.add_person(new_p)
 
-        self.people_db.merge_duplicates()
-        self.assertEqual(len(self.people_db), 3)
+        if self.merge_log is not None:
+            affiliation = (authoritative_name or {}).get('affiliation', '')
+            self.merge_log.append(rule, tuple(person.person_id for person in persons),
+                                  new_p.person_id,
+                                  (new_p.last, new_p.first, new_p.middle, affiliation))
 
-        alias_set = len(set(self.people_db._alias_to_person_dict.values())) # pylint: disable=W0212
-        self.assertEqual(len(self.people_db), alias_set)
+        return new_p
 
-    def test_merge2(self):
+    def replay_merge_log(self, merge_log):
         """
-        Test people_db merge 2
-        """
-
-        people_db_test = PeopleDatabase()
-        for name in ['DUNN,W', 'DUNN,WL', 'DUNN,WL JR', 'DUNN, W. L.', 'Dunn, FW,'
-                     'Dunn, William L', 'Dunn,WL', 'DUNN,WL Jr', 'DUNN, WL', 'Dunn, Frank',
-                     'Dunn, Frank W']:
-            people_db_test.add_person_raw(name, 1)
-        people_db_test.merge_duplicates()
-        self.assertEqual(len(people_db_test), 4)
-        alias_set = len(set(self.people_db._alias_to_person_dict.values()))  # pylint: disable=W0212
-        self.assertEqual(len(people_db_test), alias_set)
+        Applies the merges of a merge log (see merge_log.py) to this db, which has to hold the
+        persons that the log starts from (e.g. a db created from the same raw names before
+        merging). No merge rules get checked: every record merges its input persons into a new
+        person with the logged person_id and names, like merge_persons. Records whose only input
+        is the result person rename that person (see rename_person). Replaying a log is a
+        single linear pass and gives the same persons, ids and _alias_to_person_dict as the
+        merges that created the log.
 
+        :param merge_log: Path of a merge log file or list of records (see read_merge_log)
+        :return: int, number of replayed merges
+        """
+        if isinstance(merge_log, (str, Path)):
+            merge_log = read_merge_log(merge_log)
 
-if __name__ == '__main__':
-    unittest.main()
+        id_to_person = {person.person_id: person for person in self.people}
+        next_person_id = self.next_person_id
+        for rule, input_ids, result_id, (last, first, middle, affiliation) in merge_log:
+            try:
+                persons = [id_to_person.pop(person_id) for person_id in input_ids]
+            except KeyError as error:
+                raise ValueError(f'Cannot replay the merge into person {result_id}: person '
+                                 f'{error.args[0]} is not in the db.') from None
+            if result_id in id_to_person:
+                raise ValueError(f'Cannot replay the merge into person {result_id}: the '
+                                 f'person_id is already taken.')
+            authoritative_name = {'last': last, 'first': first, 'middle': middle}
+            if affiliation:
+                authoritative_name['affiliation'] = affiliation
+            if tuple(input_ids) == (result_id,):
+                id_to_person[result_id] = self.rename_person(persons[0], authoritative_name,
+                                                             rule)
+                continue
+            # add_person gives the new person the next_person_id
+            self.next_person_id = result_id
+            new_p = self.merge_persons(persons, first, middle, authoritative_name, rule)
+            id_to_person[result_id] = new_p
+            next_person_id = max(next_person_id, self.next_person_id)
+        self.next_person_id = next_person_id
+        return len(merge_log)
+
+
+class PeopleDatabaseUnpickler(pickle.Unpickler):
+    """
+    Unpickler for people db pickles. Some of the stored pickles (e.g. d_names_db.pickle) were
+    created by running people_db.py as a script, so they reference __main__.PeopleDatabase and
+    __main__.Person, which plain pickle.load can only find if the loading script is people_db.py.
+    """
+    def find_class(self, module, name):
+        if module in ['__main__', 'people_db', 'person']:
+            if name == 'PeopleDatabase':
+                return PeopleDatabase
+            if name == 'Person':
+                return Person
+        return super().find_class(module, name)
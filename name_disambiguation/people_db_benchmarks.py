@@ -0,0 +1,701 @@
+"""
+Benchmarks for building, merging and storing the people db. Like the benchmarks of
+benchmarks.py, each benchmark compares a faster implementation against the previous one on the
+raw names in tobacco_names_raw_test.json and checks that both produce identical results.
+
+Run from the name_disambiguation folder with: python people_db_benchmarks.py
+"""
+
+import contextlib
+import copy
+import io
+import itertools
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from name_disambiguation.benchmarks import get_allocated_bytes, load_test_names
+from name_disambiguation.last_name_blocking import find_similar_last_names, \
+    levenshtein_distance, soundex
+from name_disambiguation.merge_log import MergeLog
+from name_disambiguation.name_parse_cache import NAME_PARSE_CACHE
+from name_disambiguation.people_db import PeopleDatabase
+from name_disambiguation.people_shards import SHARD_PREFIX_LENGTH, ShardedPeopleDatabase, \
+    write_sharded_people_db
+from name_disambiguation.people_store import PeopleStore, write_people_store
+from name_disambiguation.person import Person
+
+
+def merge_duplicates_with_full_scan(people_db):
+    """
+    The merge loop that PeopleDatabase.merge_duplicates used before the last name index: groups
+    all persons of the database by last name again after every merge.
+    Kept as the reference implementation for benchmark_last_name_index
+    :param people_db: PeopleDatabase
+    :return: None
+    """
+    last_names = set()
+    for person in people_db.people:
+        last_names.add(person.last)
+
+    for last_name in sorted(last_names):
+        while True:
+            last_names_dict = defaultdict(list)
+            for person in people_db.people:
+                last_names_dict[person.last].append(person)
+            if people_db.merge_last_name(last_names_dict, last_name):
+                break
+
+
+def create_test_people_db(names):
+    """
+    Creates a PeopleDatabase from a dict of raw names and counts
+    :param names: dict
+    :return: PeopleDatabase
+    """
+    people_db = PeopleDatabase()
+    # add_person_raw prints every name that it cannot parse
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, count in names.items():
+            people_db.add_person_raw(name, count)
+    return people_db
+
+
+def create_merged_test_people_db(names):
+    """
+    Creates a PeopleDatabase from a dict of raw names and counts and merges it with the
+    union-find engine (used by the benchmarks of stored dbs)
+    :param names: dict
+    :return: PeopleDatabase
+    """
+    people_db = create_test_people_db(names)
+    with contextlib.redirect_stdout(io.StringIO()):
+        people_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find')
+    people_db.generate_alias_to_person_dict()
+    NAME_PARSE_CACHE.clear()
+    return people_db
+
+
+def time_pickle_lookups(pickle_path, aliases):
+    """
+    Loads a pickled people db and looks up aliases in it
+    :param pickle_path: Path
+    :param aliases: list of str
+    :return: list of Person or None for every alias, seconds for loading and looking up
+    """
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        loaded_db = PeopleDatabase()
+        loaded_db.load_from_disk(pickle_path)
+    results = [loaded_db.get_person_from_alias(alias) for alias in aliases]
+    return results, time.time() - start_time
+
+
+def check_lookup_results(aliases, pickle_results, results, same_person, db_name):
+    """
+    Raises a ValueError if looking up an alias in another kind of db gives a different person
+    than looking it up in the pickled db
+    :param aliases: list of str
+    :param pickle_results: list of Person or None, see time_pickle_lookups
+    :param results: list of Person or None of the other db
+    :param same_person: function (pickle person, person of the other db) -> bool
+    :param db_name: str, name of the other kind of db for the error message
+    :return: None
+    """
+    for alias, pickle_person, person in zip(aliases, pickle_results, results):
+        if (pickle_person is None) != (person is None) or (
+                pickle_person and not same_person(pickle_person, person)):
+            raise ValueError(f'The {db_name} returns a different person for {alias}.')
+
+
+def benchmark_last_name_index(number_of_names=10000):
+    """
+    Compares PeopleDatabase.merge_duplicates (only looks at the persons of the merged last name
+    through the last name index) against regrouping all persons after every merge.
+    Raises a ValueError if the merged databases differ.
+
+    :param number_of_names: int, number of names from tobacco_names_raw_test.json to merge (the
+    full scan takes minutes for all names)
+    :return: dict with the time in seconds each implementation took
+    """
+    names = dict(itertools.islice(load_test_names().items(), number_of_names))
+    Person.parse_many(list(names))
+
+    full_scan_db = create_test_people_db(names)
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        merge_duplicates_with_full_scan(full_scan_db)
+    full_scan_time = time.time() - start_time
+
+    indexed_db = create_test_people_db(names)
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        indexed_db.merge_duplicates()
+    indexed_time = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    if sorted(map(repr, full_scan_db.people)) != sorted(map(repr, indexed_db.people)):
+        raise ValueError('merge_duplicates produced a different database than the full scan')
+
+    print(f'Merging {len(names)} names into {len(indexed_db)} persons. full scan: '
+          f'{full_scan_time:.2f}s. last name index: {indexed_time:.2f}s. speedup: '
+          f'{full_scan_time / indexed_time:.1f}x')
+    return {'full_scan': full_scan_time, 'indexed': indexed_time}
+
+
+def benchmark_merge_engines(number_of_names=10000):
+    """
+    Compares the 'sequential' and the 'union_find' engine of PeopleDatabase.merge_duplicates.
+    Raises a ValueError if the merged databases differ.
+
+    :param number_of_names: int, number of names from tobacco_names_raw_test.json to merge
+    :return: dict with the time in seconds each engine took
+    """
+    names = dict(itertools.islice(load_test_names().items(), number_of_names))
+    Person.parse_many(list(names))
+
+    times = {}
+    people_dbs = {}
+    for engine in ['sequential', 'union_find']:
+        people_dbs[engine] = create_test_people_db(names)
+        start_time = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            people_dbs[engine].merge_duplicates(print_merge_results_for_name=None, engine=engine)
+        times[engine] = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    if people_dbs['sequential'] != people_dbs['union_find']:
+        raise ValueError('The union_find engine produced a different database')
+
+    print(f'Merging {len(names)} names into {len(people_dbs["union_find"])} persons. '
+          f'sequential: {times["sequential"]:.2f}s. union_find: {times["union_find"]:.2f}s. '
+          f'speedup: {times["sequential"] / times["union_find"]:.1f}x')
+    return times
+
+
+def benchmark_merge_matrix(number_of_blocks=20):
+    """
+    Compares PeopleDatabase.get_merge_matrix against running check_if_persons_can_be_merged
+    for every pair on the largest last names in tobacco_names_raw_test.json.
+    Raises a ValueError if the two disagree on any pair.
+
+    :param number_of_blocks: int, number of last names (largest first) to check
+    :return: dict with the time in seconds each implementation took
+    """
+    people_db = create_test_people_db(load_test_names())
+    blocks = sorted(people_db._last_name_to_people.values(),         # pylint: disable=W0212
+                    key=len, reverse=True)[:number_of_blocks]
+    blocks = [sorted(block, key=lambda x: x.person_id) for block in blocks]
+
+    start_time = time.time()
+    pair_results = [[[PeopleDatabase.check_if_persons_can_be_merged(person1, person2)
+                      for person2 in block] for person1 in block] for block in blocks]
+    pair_time = time.time() - start_time
+
+    start_time = time.time()
+    matrices = [PeopleDatabase.get_merge_matrix(block) for block in blocks]
+    matrix_time = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    for block, pair_result, matrix in zip(blocks, pair_results, matrices):
+        if matrix.tolist() != pair_result:
+            raise ValueError(f'get_merge_matrix differs from the pair checks for {block[0].last}')
+
+    print(f'Merge checks for the {len(blocks)} largest last names ({sum(map(len, blocks))} '
+          f'persons). pairs: {pair_time:.2f}s. matrix: {matrix_time:.2f}s. speedup: '
+          f'{pair_time / matrix_time:.1f}x')
+    return {'pairs': pair_time, 'matrix': matrix_time}
+
+
+def benchmark_alias_index(number_of_blocks=10):
+    """
+    Compares finding the pairs of persons that share an alias with the _alias_to_person_ids
+    postings (PeopleDatabase.get_alias_groups) against intersecting the aliases of every pair,
+    on the largest last names in tobacco_names_raw_test.json.
+    Raises a ValueError if the two find different pairs.
+
+    :param number_of_blocks: int, number of last names (largest first) to check
+    :return: dict with the time in seconds each implementation took
+    """
+    people_db = create_test_people_db(load_test_names())
+    blocks = sorted(people_db._last_name_to_people.values(),         # pylint: disable=W0212
+                    key=len, reverse=True)[:number_of_blocks]
+    # add_person_raw never creates two persons with the same alias -> add a copy of every
+    # person (like persons from two merged databases)
+    for block in blocks:
+        for person in list(block):
+            people_db.add_person(person.copy())
+    blocks = [sorted(block, key=lambda x: x.person_id) for block in blocks]
+
+    start_time = time.time()
+    intersection_pairs = []
+    for block in blocks:
+        pairs = set()
+        for person1_idx, person1 in enumerate(block):
+            for person2_idx, person2 in enumerate(block[person1_idx + 1:], person1_idx + 1):
+                if {alias for alias, _ in person1.alias_items()}.intersection(
+                        alias for alias, _ in person2.alias_items()):
+                    pairs.add((person1_idx, person2_idx))
+        intersection_pairs.append(pairs)
+    intersection_time = time.time() - start_time
+
+    start_time = time.time()
+    posting_pairs = [{pair for indices in people_db.get_alias_groups(block)
+                      for pair in itertools.combinations(indices, 2)} for block in blocks]
+    posting_time = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    if intersection_pairs != posting_pairs:
+        raise ValueError('The alias index found different pairs than the alias intersections')
+
+    print(f'Shared aliases in the {len(blocks)} largest last names '
+          f'({sum(map(len, blocks))} persons, {sum(map(len, posting_pairs))} pairs). '
+          f'intersections: {intersection_time:.2f}s. postings: {posting_time:.3f}s. speedup: '
+          f'{intersection_time / posting_time:.1f}x')
+    return {'intersections': intersection_time, 'postings': posting_time}
+
+
+def benchmark_similar_last_names(number_of_last_names_to_check=3000):
+    """
+    Merges all names in tobacco_names_raw_test.json, then runs the similar last name stage
+    (PeopleDatabase.merge_similar_last_names) and prints its report.
+    Also compares find_similar_last_names against comparing all pairs of the first
+    number_of_last_names_to_check last names and raises a ValueError if they differ.
+
+    :param number_of_last_names_to_check: int
+    :return: dict (report of merge_similar_last_names plus the time of both candidate searches)
+    """
+    people_db = create_test_people_db(load_test_names())
+    with contextlib.redirect_stdout(io.StringIO()):
+        people_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find')
+    report = people_db.merge_similar_last_names(engine='union_find')
+    NAME_PARSE_CACHE.clear()
+
+    last_name_to_people = people_db._last_name_to_people               # pylint: disable=W0212
+    last_names = sorted(last_name for last_name in last_name_to_people
+                        if len(last_name) >= 5)[:number_of_last_names_to_check]
+    start_time = time.time()
+    all_pairs = sorted((last_name1, last_name2)
+                       for last_name1, last_name2 in itertools.combinations(last_names, 2)
+                       if soundex(last_name1) and soundex(last_name1) == soundex(last_name2) and
+                       levenshtein_distance(last_name1, last_name2) <= 1)
+    report['all_pairs_seconds'] = time.time() - start_time
+
+    start_time = time.time()
+    similar_last_names = find_similar_last_names(last_names)
+    report['bk_tree_seconds'] = time.time() - start_time
+    if similar_last_names != all_pairs:
+        raise ValueError('find_similar_last_names differs from comparing all pairs')
+
+    print(f'Similar last names among {len(last_names)} last names. all pairs: '
+          f'{report["all_pairs_seconds"]:.2f}s. soundex + BK-tree: '
+          f'{report["bk_tree_seconds"]:.2f}s.')
+    return report
+
+
+def benchmark_merge_incremental(number_of_new_names=5000):
+    """
+    Merges all but the last number_of_new_names names of tobacco_names_raw_test.json, then
+    compares adding the remaining names with PeopleDatabase.merge_incremental against
+    rebuilding and merging the db with all names (with the faster union_find engine).
+
+    :param number_of_new_names: int
+    :return: dict with the time in seconds of both ways and the report counts
+    """
+    names = load_test_names()
+    Person.parse_many(list(names))
+    old_names = dict(itertools.islice(names.items(), len(names) - number_of_new_names))
+    new_names = dict(itertools.islice(names.items(), len(names) - number_of_new_names, None))
+
+    people_db = create_test_people_db(old_names)
+    with contextlib.redirect_stdout(io.StringIO()):
+        people_db.merge_duplicates(print_merge_results_for_name=None)
+        start_time = time.time()
+        report = people_db.merge_incremental(new_names)
+        incremental_time = time.time() - start_time
+
+        start_time = time.time()
+        rebuilt_db = create_test_people_db(names)
+        rebuilt_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find')
+        rebuild_time = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    results = {'incremental': incremental_time, 'rebuild': rebuild_time}
+    for key in ['new_persons', 'merged_persons', 'changed_aliases']:
+        results[key] = len(report[key])
+    print(f'Adding {len(new_names)} names to a db of {len(old_names)} merged names. '
+          f'merge_incremental: {incremental_time:.2f}s ({results["new_persons"]} new persons, '
+          f'{results["merged_persons"]} merged persons, {results["changed_aliases"]} changed '
+          f'aliases in {report["changed_last_names"]} last names, {len(people_db)} persons). '
+          f'rebuild: {rebuild_time:.2f}s ({len(rebuilt_db)} persons).')
+    return results
+
+
+def benchmark_people_store(number_of_lookups=1000):
+    """
+    Stores the merged db of tobacco_names_raw_test.json as a pickle and as a people store, then
+    compares loading the pickle and looking up aliases against opening the memory-mapped store
+    and looking up the same aliases there. Raises a ValueError if a lookup differs.
+
+    :param number_of_lookups: int
+    :return: dict with the time in seconds of both ways and the file sizes in bytes
+    """
+    names = load_test_names()
+    people_db = create_merged_test_people_db(names)
+    aliases = list(names)[::max(1, len(names) // number_of_lookups)][:number_of_lookups]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pickle_path = Path(temp_dir, 'people_db.pickle')
+        store_path = Path(temp_dir, 'people_db.peoplestore')
+        people_db.store_to_disk(pickle_path)
+        write_people_store(people_db, store_path)
+
+        pickle_results, pickle_time = time_pickle_lookups(pickle_path, aliases)
+
+        start_time = time.time()
+        with PeopleStore(store_path) as store:
+            store_results = [store.get_person_from_alias(alias) for alias in aliases]
+        store_time = time.time() - start_time
+
+        results = {'pickle': pickle_time, 'people_store': store_time,
+                   'pickle_size': pickle_path.stat().st_size,
+                   'people_store_size': store_path.stat().st_size}
+
+    check_lookup_results(aliases, pickle_results, store_results,
+                         lambda pickle_person, person: pickle_person.has_same_content(person),
+                         'people store')
+    print(f'Loading a db of {len(people_db)} persons and looking up {len(aliases)} aliases. '
+          f'pickle: {pickle_time:.3f}s ({results["pickle_size"] / 1e6:.1f} MB), '
+          f'people store: {store_time:.3f}s ({results["people_store_size"] / 1e6:.1f} MB).')
+    return results
+
+
+def get_clustered_aliases(people_db, number_of_aliases):
+    """
+    Returns the aliases of the persons of a few last names, like the persons of a network
+    :param people_db: PeopleDatabase
+    :param number_of_aliases: int
+    :return: list of str
+    """
+    last_names = sorted(last_name for last_name, persons
+                        in people_db._last_name_to_people.items()   # pylint: disable=W0212
+                        if len(persons) >= 5)
+    clustered_aliases = []
+    for last_name in last_names[::max(1, len(last_names) // 10)]:
+        for person in people_db._last_name_to_people[last_name]:   # pylint: disable=W0212
+            clustered_aliases += person.alias_keys()[:3]
+    return clustered_aliases[:number_of_aliases]
+
+
+def compare_sharded_lookups(pickle_path, shards_path, aliases):
+    """
+    Looks up aliases in a pickled people db and in a sharded people db of the same persons.
+    Raises a ValueError if a lookup differs.
+    :param pickle_path: Path
+    :param shards_path: Path
+    :param aliases: list of str
+    :return: dict with the time in seconds of both ways and the number of loaded shards
+    """
+    pickle_results, pickle_time = time_pickle_lookups(pickle_path, aliases)
+
+    start_time = time.time()
+    sharded_db = ShardedPeopleDatabase(shards_path)
+    sharded_results = [sharded_db.get_person_from_alias(alias) for alias in aliases]
+    sharded_time = time.time() - start_time
+
+    check_lookup_results(aliases, pickle_results, sharded_results,
+                         lambda pickle_person, person: pickle_person.person_id == person.person_id,
+                         'sharded people db')
+    return {'pickle': pickle_time, 'sharded': sharded_time,
+            'shards_loaded': sharded_db.shards_loaded}
+
+
+def benchmark_sharded_people_db(number_of_lookups=300, prefix_length=SHARD_PREFIX_LENGTH):
+    """
+    Stores the merged db of tobacco_names_raw_test.json as a pickle (with its post-load state)
+    and as a sharded people db, then compares loading the pickle and looking up aliases against
+    opening the sharded db and looking up the same aliases there. The lookups are the aliases
+    of a few last names (like the persons of one network) and aliases spread over the whole db.
+    Raises a ValueError if a lookup differs.
+
+    :param number_of_lookups: int
+    :param prefix_length: int, see people_shards.get_shard_key
+    :return: dict with the time in seconds of both ways for both kinds of lookups
+    """
+    names = load_test_names()
+    people_db = create_merged_test_people_db(names)
+
+    lookups = {
+        'clustered': get_clustered_aliases(people_db, number_of_lookups),
+        'spread': list(names)[::max(1, len(names) // number_of_lookups)][:number_of_lookups]
+    }
+
+    times = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pickle_path = Path(temp_dir, 'people_db.pickle')
+        shards_path = Path(temp_dir, 'people_db.shards')
+        with contextlib.redirect_stdout(io.StringIO()):
+            people_db.post_load_fingerprint = None
+            people_db.store_to_disk(pickle_path)
+            PeopleDatabase().load_from_disk(pickle_path, store_post_load_state=True)
+        router = write_sharded_people_db(people_db, shards_path, prefix_length)
+
+        for lookup_name, aliases in lookups.items():
+            for key, value in compare_sharded_lookups(pickle_path, shards_path, aliases).items():
+                times[f'{key}_{lookup_name}'] = value
+
+    print(f'Loading a db of {len(people_db)} persons in {len(router["shards"])} shards '
+          f'({len(router["alias_exceptions"])} aliases in the router) and looking up '
+          f'{number_of_lookups} aliases. ' +
+          ' '.join(f'{lookup_name.capitalize()} aliases: pickle '
+                   f'{times[f"pickle_{lookup_name}"]:.3f}s, sharded '
+                   f'{times[f"sharded_{lookup_name}"]:.3f}s '
+                   f'({times[f"shards_loaded_{lookup_name}"]} shards loaded).'
+                   for lookup_name in lookups))
+    return times
+
+
+def benchmark_post_load_state():
+    """
+    Compares loading the merged db of tobacco_names_raw_test.json with all post-load steps
+    (company filter, alias index, manual merges) against loading the stored post-load state.
+    Raises a ValueError if both loads give different dbs.
+
+    :return: dict with the time in seconds of both loads
+    """
+    people_db = create_test_people_db(load_test_names())
+    with contextlib.redirect_stdout(io.StringIO()):
+        people_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find')
+    NAME_PARSE_CACHE.clear()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pickle_path = Path(temp_dir, 'people_db.pickle')
+        people_db.store_to_disk(pickle_path)
+
+        start_time = time.time()
+        first_load_db = PeopleDatabase()
+        first_load_db.load_from_disk(pickle_path, store_post_load_state=True)
+        first_load_time = time.time() - start_time
+
+        start_time = time.time()
+        stored_state_db = PeopleDatabase()
+        stored_state_db.load_from_disk(pickle_path)
+        stored_state_time = time.time() - start_time
+
+    def get_alias_to_person_ids(loaded_db):
+        alias_to_person = loaded_db._alias_to_person_dict   # pylint: disable=W0212
+        return {alias: person.person_id for alias, person in alias_to_person.items()}
+
+    if (first_load_db != stored_state_db or
+            get_alias_to_person_ids(first_load_db) != get_alias_to_person_ids(stored_state_db)):
+        raise ValueError('Loading the stored post-load state gives a different db.')
+    print(f'Loading a db of {len(people_db)} persons. With post-load steps (and storing them): '
+          f'{first_load_time:.2f}s. With stored post-load state: {stored_state_time:.2f}s.')
+    return {'post_load_steps': first_load_time, 'stored_post_load_state': stored_state_time}
+
+
+def benchmark_add_people_bulk(min_count=1):
+    """
+    Compares PeopleDatabase.add_people_bulk against parsing all names with Person.parse_many and
+    adding them one by one with add_person_raw (as merge_names_from_json_file did). Both start
+    with all names in NAME_PARSE_CACHE, so this measures building the db.
+    Raises a ValueError if the dbs differ.
+
+    :param min_count: int
+    :return: dict with the names per second of both ways
+    """
+    names = load_test_names()
+    Person.parse_many(list(names))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.time()
+        loop_db = PeopleDatabase()
+        Person.parse_many([name for name in names if names[name] >= min_count])
+        for name in names:
+            if names[name] >= min_count:
+                loop_db.add_person_raw(name, names[name])
+        loop_time = time.time() - start_time
+        loop_persons = sorted((person.person_id, person.full_name, person.alias_items(),
+                               person.position_items()) for person in loop_db.people)
+        del loop_db
+
+        start_time = time.time()
+        bulk_db = PeopleDatabase()
+        bulk_db.add_people_bulk(names, min_count=min_count)
+        bulk_time = time.time() - start_time
+    NAME_PARSE_CACHE.clear()
+
+    if loop_persons != sorted((person.person_id, person.full_name, person.alias_items(),
+                               person.position_items()) for person in bulk_db.people):
+        raise ValueError('add_people_bulk and add_person_raw give different dbs.')
+    number_of_names = sum(1 for count in names.values() if count >= min_count)
+    results = {'add_person_raw': number_of_names / loop_time,
+               'add_people_bulk': number_of_names / bulk_time}
+    print(f'Adding {number_of_names} names ({len(bulk_db)} persons). '
+          f'add_person_raw: {loop_time:.2f}s ({results["add_person_raw"]:.0f} names/s), '
+          f'add_people_bulk: {bulk_time:.2f}s ({results["add_people_bulk"]:.0f} names/s).')
+    return results
+
+
+def copy_people_db_deep(people_db):
+    """
+    The copy that PeopleDatabase.copy replaced: deep copies every person and rebuilds the last
+    name and alias indexes (but not the _alias_to_person_dict).
+    Kept as the reference implementation for benchmark_copy
+
+    :param people_db: PeopleDatabase
+    :return: PeopleDatabase
+    """
+    people_db_copy = PeopleDatabase()
+    for person in copy.deepcopy(people_db.people):
+        people_db_copy.add_person(person)
+    people_db_copy.next_person_id = people_db.next_person_id
+    return people_db_copy
+
+
+def benchmark_copy():
+    """
+    Compares the copy-on-write PeopleDatabase.copy against deep copying the persons, by time and
+    allocated memory, on the merged db of tobacco_names_raw_test.json.
+    Raises a ValueError if the copies differ from the db.
+
+    :return: dict with the seconds and bytes of both copies
+    """
+    people_db = create_test_people_db(load_test_names())
+    with contextlib.redirect_stdout(io.StringIO()):
+        people_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find')
+    NAME_PARSE_CACHE.clear()
+
+    # tracemalloc slows down allocations -> time and memory get measured separately
+    start_time = time.time()
+    copy_people_db_deep(people_db)
+    deep_time = time.time() - start_time
+    start_time = time.time()
+    people_db.copy()
+    snapshot_time = time.time() - start_time
+    deep_copy, deep_size = get_allocated_bytes(lambda: copy_people_db_deep(people_db))
+    snapshot, snapshot_size = get_allocated_bytes(people_db.copy)
+
+    if deep_copy != people_db or snapshot != people_db:
+        raise ValueError('The copies differ from the people db.')
+
+    # the first change of the copy copies its containers
+    person = max(snapshot.people, key=lambda x: x.count)
+    start_time = time.time()
+    snapshot.add_person_raw(person.alias_items()[0][0])
+    first_change_time = time.time() - start_time
+    if people_db.get_person_from_alias(person.alias_items()[0][0]).count != person.count:
+        raise ValueError('Changing the copy changed the people db.')
+
+    results = {'deepcopy_seconds': deep_time, 'copy_on_write_seconds': snapshot_time,
+               'deepcopy_bytes': deep_size, 'copy_on_write_bytes': snapshot_size,
+               'first_change_seconds': first_change_time}
+    print(f'Copying a db of {len(people_db)} persons. deepcopy: {deep_time * 1000:.1f}ms '
+          f'({deep_size / 1e6:.1f} MB), copy on write: {snapshot_time * 1000:.3f}ms '
+          f'({snapshot_size / 1e3:.1f} kB), first change of the copy: '
+          f'{first_change_time * 1000:.1f}ms.')
+    return results
+
+
+def benchmark_merge_log():
+    """
+    Measures the overhead of logging all merges of merge_duplicates to a merge log and compares
+    merging tobacco_names_raw_test.json with the union_find engine against replaying the log.
+    Raises a ValueError if the replayed db differs from the merged one.
+
+    :return: dict with the seconds of merging without and with the log and of the replay
+    """
+    raw_db = create_test_people_db(load_test_names())
+    NAME_PARSE_CACHE.clear()
+
+    times = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_path = Path(temp_dir, 'merges.log')
+        for logged in [False, True]:
+            merged_db = raw_db.copy()
+            with MergeLog(log_path if logged else None) as merge_log:
+                if logged:
+                    merged_db.merge_log = merge_log
+                start_time = time.time()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    merged_db.merge_duplicates(print_merge_results_for_name=None,
+                                               engine='union_find')
+                merge_log.flush()
+                times['with_log' if logged else 'without_log'] = time.time() - start_time
+        log_size = log_path.stat().st_size
+
+        start_time = time.time()
+        number_of_merges = raw_db.replay_merge_log(log_path)
+        times['replay'] = time.time() - start_time
+
+    if (raw_db != merged_db or
+            sorted(person.person_id for person in raw_db.people) !=
+            sorted(person.person_id for person in merged_db.people)):
+        raise ValueError('Replaying the merge log gives a different db.')
+    print(f'Merging {len(load_test_names())} names ({number_of_merges} merges, log of '
+          f'{log_size / 1e6:.1f} MB). Without log: {times["without_log"]:.2f}s, with log: '
+          f'{times["with_log"]:.2f}s, replay: {times["replay"]:.2f}s.')
+    return times
+
+
+def benchmark_merge_checkpoint(checkpoint_interval=2):
+    """
+    Measures the overhead of writing merge_duplicates checkpoints every checkpoint_interval
+    seconds while merging tobacco_names_raw_test.json with the union_find engine, and resumes
+    from the last checkpoint. Raises a ValueError if the resumed db differs from the merged one.
+
+    :param checkpoint_interval: float, seconds between two checkpoints
+    :return: dict with the seconds of merging without and with checkpoints and of resuming
+    """
+    raw_db = create_test_people_db(load_test_names())
+    NAME_PARSE_CACHE.clear()
+
+    times = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        checkpoint_path = Path(temp_dir, 'merge.checkpoint')
+        merged_db = raw_db.copy()
+        start_time = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            merged_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find')
+        times['without_checkpoints'] = time.time() - start_time
+
+        checkpointed_db = raw_db.copy()
+        start_time = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            checkpointed_db.merge_duplicates(print_merge_results_for_name=None,
+                                             engine='union_find', checkpoint_path=checkpoint_path,
+                                             checkpoint_interval=checkpoint_interval)
+        times['with_checkpoints'] = time.time() - start_time
+        checkpoint_size = checkpoint_path.stat().st_size
+
+        start_time = time.time()
+        resumed_db = PeopleDatabase()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resumed_db.merge_duplicates(print_merge_results_for_name=None, engine='union_find',
+                                        resume_from=checkpoint_path)
+        times['resume'] = time.time() - start_time
+
+    if checkpointed_db != merged_db or resumed_db != merged_db:
+        raise ValueError('Merging with checkpoints gives a different db.')
+    print(f'Merging {len(raw_db)} persons into {len(merged_db)}. Without checkpoints: '
+          f'{times["without_checkpoints"]:.2f}s, with a checkpoint every {checkpoint_interval}s '
+          f'({checkpoint_size / 1e6:.1f} MB): {times["with_checkpoints"]:.2f}s. Resuming from '
+          f'the last checkpoint: {times["resume"]:.2f}s.')
+    return times
+
+
+if __name__ == '__main__':
+    benchmark_last_name_index()
+    benchmark_merge_engines()
+    benchmark_merge_matrix()
+    benchmark_alias_index()
+    benchmark_similar_last_names()
+    benchmark_merge_incremental()
+    benchmark_people_store()
+    benchmark_sharded_people_db()
+    benchmark_post_load_state()
+    benchmark_add_people_bulk()
+    benchmark_copy()
+    benchmark_merge_log()
+    benchmark_merge_checkpoint()
@@ -0,0 +1,483 @@
+"""
+Sharded on-disk layout for a PeopleDatabase.
+The web backend and the network generation usually need a few hundred persons, but
+PeopleDatabase.load_from_disk unpickles all of them. A sharded people db instead partitions the
+persons by the first letters of their normalized last name (see get_shard_key) into separate
+people db pickles. Every shard has its own _alias_to_person_dict, so an alias can be looked up
+after loading only one shard.
+
+The shard of an alias can mostly be read off the alias itself: the last name is the part before
+the comma ("DUNN, WL") or the last word ("William L. Dunn"). A small router (router.json) lists
+the shard files and the few aliases for which this guess is wrong, e.g. aliases of manually
+merged names or full names of persons with multi-word last names.
+ShardedPeopleDatabase loads shards on demand and keeps a bounded number of them in memory.
+
+Persons only get merged with persons of the same last name, which are always in the same
+shard, so ShardedPeopleDatabase.merge_duplicates merges one shard at a time. Merges across last
+names are limited to one shard: spelling variants that land in different shards (e.g.
+"Ahrensfeld" and "Arensfeld", see PeopleDatabase.merge_similar_last_names) do not get merged, so
+merging with similar_last_names=True can give fewer merges than merging the unsharded db.
+"""
+
+import json
+import tempfile
+import unittest
+from collections import OrderedDict
+from pathlib import Path
+
+from name_disambiguation.atomic_file import atomic_write
+from name_disambiguation.clean_org_names import ORG_DICTIONARY
+from name_disambiguation.people_db import PeopleDatabase, PeopleDatabaseUnpickler
+
+SHARDED_PEOPLE_DB_VERSION = 1
+SHARDED_PEOPLE_DB_ROUTER = 'router.json'
+
+# number of letters of the normalized last name that select the shard
+SHARD_PREFIX_LENGTH = 3
+
+
+def get_shard_key(last_name, prefix_length=SHARD_PREFIX_LENGTH):
+    """
+    Returns the shard of a last name: its first prefix_length letters and digits in upper case.
+    Last names without letters or digits go into the shard '_'
+
+    >>> get_shard_key('Dunn'), get_shard_key('van Dyke*'), get_shard_key("O'Neil", 2)
+    ('DUN', 'VAN', 'ON')
+
+    :param last_name: str
+    :param prefix_length: int
+    :return: str
+    """
+    normalized = ''.join(char for char in last_name.upper() if char.isalnum())
+    return normalized[:prefix_length] or '_'
+
+
+def get_alias_shard_key(alias, prefix_length=SHARD_PREFIX_LENGTH):
+    """
+    Returns the shard that an alias most likely belongs to, guessing its last name from the
+    alias: the part before the first comma ("DUNN, WL"). Without a comma, the first word if the
+    alias ends with initials ("DUNN WL"), otherwise the last word ("William L. Dunn").
+
+    >>> [get_alias_shard_key(alias) for alias in ['DUNN, WL', 'dunn wl', 'william l. dunn']]
+    ['DUN', 'DUN', 'DUN']
+
+    :param alias: str
+    :param prefix_length: int
+    :return: str
+    """
+    if ',' in alias:
+        last_name = alias.split(',', 1)[0]
+    else:
+        words = alias.split()
+        if not words:
+            last_name = ''
+        elif len(words) > 1 and len(get_shard_key(words[-1], 3)) <= 2:
+            last_name = words[0]
+        else:
+            last_name = words[-1]
+    return get_shard_key(last_name, prefix_length)
+
+
+def store_shard_file(shard_db, file_path):
+    """
+    Stores one shard as a people db pickle (see PeopleDatabase.store_to_disk) without its
+    raw_org_to_clean_org_dict, which would otherwise make up most of every shard file
+    :param shard_db: PeopleDatabase
+    :param file_path: Path
+    :return: None
+    """
+    raw_org_to_clean_org_dict = shard_db.raw_org_to_clean_org_dict
+    shard_db.raw_org_to_clean_org_dict = {}
+    try:
+        shard_db.store_to_disk(file_path)
+    finally:
+        shard_db.raw_org_to_clean_org_dict = raw_org_to_clean_org_dict
+
+
+def load_shard_file(file_path):
+    """
+    Loads one shard stored with store_shard_file. Like load_from_disk, the shard uses the
+    raw_org_to_clean_org_dict of ORG_DICTIONARY (a copy of it, like every PeopleDatabase).
+    Unlike load_from_disk, no other post-load steps run, they were applied before the db got
+    sharded.
+    :param file_path: Path
+    :return: PeopleDatabase
+    """
+    with open(str(file_path), 'rb') as infile:
+        shard_db = PeopleDatabaseUnpickler(infile).load()
+    shard_db.raw_org_to_clean_org_dict = ORG_DICTIONARY.raw_to_clean.copy()
+    return shard_db
+
+
+def write_router(router, directory):
+    """
+    Writes the router of a sharded people db (through a temporary file, so that readers never
+    see half a router)
+    :param router: dict, see write_sharded_people_db
+    :param directory: Path
+    :return: None
+    """
+    with atomic_write(Path(directory, SHARDED_PEOPLE_DB_ROUTER), 'w',
+                      encoding='utf-8') as outfile:
+        json.dump(router, outfile, sort_keys=True)
+
+
+def write_sharded_people_db(people_db, directory, prefix_length=SHARD_PREFIX_LENGTH):
+    """
+    Stores a people db as a sharded people db in directory (which gets created if necessary).
+    Every shard file is a people db with the persons of one shard key. Its
+    _alias_to_person_dict gets generated from its own persons and then takes over the entries
+    of people_db that point to them, so lookups give the same persons as people_db.
+    The router (router.json) holds:
+    - version, prefix_length and next_person_id
+    - shards: shard key -> {'file': file name, 'persons': number of persons}
+    - alias_exceptions: lower case alias -> shard key for all aliases of people_db that are not
+      in the shard that get_alias_shard_key guesses
+
+    :param people_db: PeopleDatabase
+    :param directory: Path
+    :param prefix_length: int, see get_shard_key
+    :return: dict, the router
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    shard_dbs = {}
+    for person in people_db.people:
+        shard_key = get_shard_key(person.last, prefix_length)
+        if shard_key not in shard_dbs:
+            shard_dbs[shard_key] = PeopleDatabase()
+        shard_dbs[shard_key].add_person(person)
+    for shard_db in shard_dbs.values():
+        shard_db.generate_alias_to_person_dict()
+
+    person_id_to_shard_key = {person.person_id: get_shard_key(person.last, prefix_length)
+                              for person in people_db.people}
+    alias_exceptions = {}
+    for alias, person in people_db._alias_to_person_dict.items():     # pylint: disable=W0212
+        shard_key = person_id_to_shard_key.get(person.person_id)
+        if shard_key is None:
+            continue
+        shard_dbs[shard_key]._alias_to_person_dict[alias] = person    # pylint: disable=W0212
+        if get_alias_shard_key(alias, prefix_length) != shard_key:
+            alias_exceptions[alias] = shard_key
+
+    router = {'version': SHARDED_PEOPLE_DB_VERSION, 'prefix_length': prefix_length,
+              'next_person_id': people_db.next_person_id, 'shards': {},
+              'alias_exceptions': alias_exceptions}
+    for shard_number, shard_key in enumerate(sorted(shard_dbs)):
+        shard_db = shard_dbs[shard_key]
+        shard_db.next_person_id = people_db.next_person_id
+        shard_db.post_load_fingerprint = people_db.post_load_fingerprint
+        file_name = f'shard_{shard_number:05d}.pickle'
+        store_shard_file(shard_db, Path(directory, file_name))
+        router['shards'][shard_key] = {'file': file_name, 'persons': len(shard_db)}
+
+    write_router(router, directory)
+
+    # shard files of an earlier, larger sharding of the same directory are not used anymore
+    shard_files = {shard['file'] for shard in router['shards'].values()}
+    for file_path in directory.glob('shard_*.pickle'):
+        if file_path.name not in shard_files:
+            file_path.unlink()
+    return router
+
+
+class ShardedPeopleDatabase:
+    """
+    A people db stored with write_sharded_people_db. Shards get loaded when they are needed and
+    the max_cached_shards most recently used shards stay in memory.
+    Persons returned by get_person_from_alias belong to the cached shard dbs. Changes to them
+    only get stored by merge_duplicates.
+
+    Attributes:
+        directory (Path): directory of the router and the shard files
+        prefix_length (int): see get_shard_key
+        next_person_id (int): person_id that the next merged person will get
+        max_cached_shards (int): maximum number of shards kept in memory
+        shards_loaded (int): number of shard files loaded since the db was opened
+    """
+    def __init__(self, directory, max_cached_shards=16):
+        """
+        Opens a sharded people db. Only reads the router
+        :param directory: Path
+        :param max_cached_shards: int
+        """
+        self.directory = Path(directory)
+        with open(str(Path(directory, SHARDED_PEOPLE_DB_ROUTER)), 'r', encoding='utf-8') as infile:
+            self._router = json.load(infile)
+        if self._router.get('version') != SHARDED_PEOPLE_DB_VERSION:
+            raise ValueError(f'{directory} is not a sharded people db of version '
+                             f'{SHARDED_PEOPLE_DB_VERSION}.')
+        self.prefix_length = self._router['prefix_length']
+        self.next_person_id = self._router['next_person_id']
+        self.max_cached_shards = max_cached_shards
+        self.shards_loaded = 0
+        self._shard_cache = OrderedDict()
+
+    def __len__(self):
+        """
+        Returns the number of persons in all shards
+        :return: int
+        """
+        return sum(shard['persons'] for shard in self._router['shards'].values())
+
+    @property
+    def shard_keys(self):
+        """
+        Sorted list of the keys of all shards
+        :return: list of str
+        """
+        return sorted(self._router['shards'])
+
+    def get_shard(self, shard_key):
+        """
+        Returns the people db of a shard, loading it if it is not cached
+        :param shard_key: str
+        :return: PeopleDatabase or None if there is no such shard
+        """
+        if shard_key in self._shard_cache:
+            self._shard_cache.move_to_end(shard_key)
+            return self._shard_cache[shard_key]
+        if shard_key not in self._router['shards']:
+            return None
+
+        shard_db = load_shard_file(Path(self.directory,
+                                        self._router['shards'][shard_key]['file']))
+        self.shards_loaded += 1
+        self._shard_cache[shard_key] = shard_db
+        while len(self._shard_cache) > self.max_cached_shards:
+            self._shard_cache.popitem(last=False)
+        return shard_db
+
+    def get_shard_key_of_alias(self, alias):
+        """
+        Returns the shard whose alias index holds an alias
+        :param alias: str
+        :return: str
+        """
+        alias = alias.lower()
+        if alias in self._router['alias_exceptions']:
+            return self._router['alias_exceptions'][alias]
+        return get_alias_shard_key(alias, self.prefix_length)
+
+    def get_person_from_alias(self, alias):
+        """
+        Same as PeopleDatabase.get_person_from_alias, only loading the shard of the alias
+        :param alias: str
+        :return: Person or None
+        """
+        shard_db = self.get_shard(self.get_shard_key_of_alias(alias))
+        if shard_db is None:
+            return None
+        return shard_db.get_person_from_alias(alias)
+
+    def to_people_db(self):
+        """
+        Loads all shards into one PeopleDatabase (without caching them)
+        :return: PeopleDatabase
+        """
+        people_db = PeopleDatabase()
+        for shard_key in self.shard_keys:
+            shard_db = self._shard_cache.get(shard_key) or load_shard_file(
+                Path(self.directory, self._router['shards'][shard_key]['file']))
+            for person in shard_db.people:
+                people_db.add_person(person)
+            people_db._alias_to_person_dict.update(   # pylint: disable=W0212
+                (alias, person) for alias, person
+                in shard_db._alias_to_person_dict.items()     # pylint: disable=W0212
+                if self.get_shard_key_of_alias(alias) == shard_key)
+        people_db.next_person_id = self.next_person_id
+        return people_db
+
+    def merge_duplicates(self, **merge_kwargs):
+        """
+        Runs PeopleDatabase.merge_duplicates on one shard after the other and stores every
+        merged shard, so only one shard has to be in memory at a time. The merged persons get
+        person_ids that are unique across all shards.
+        Merging with similar_last_names=True only merges spelling variants that are in the same
+        shard. Variants whose last names start differently (e.g. "Ahrensfeld" and "Arensfeld")
+        end up in different shards and stay apart, unlike in the unsharded db.
+        Aliases keep their shard in the router. Full names of new persons that are not in the
+        shard get_alias_shard_key guesses get added to the alias exceptions.
+
+        :param merge_kwargs: keyword arguments of PeopleDatabase.merge_duplicates
+        :return: None
+        """
+        merge_kwargs.setdefault('print_merge_results_for_name', None)
+        alias_exceptions = self._router['alias_exceptions']
+        for shard_key in self.shard_keys:
+            shard_db = self.get_shard(shard_key)
+            aliases_before_merge = set(shard_db._alias_to_person_dict)    # pylint: disable=W0212
+            shard_db.next_person_id = self.next_person_id
+            shard_db.merge_duplicates(**merge_kwargs)
+            self.next_person_id = shard_db.next_person_id
+
+            shard_aliases = shard_db._alias_to_person_dict                # pylint: disable=W0212
+            for alias in shard_aliases.keys() - aliases_before_merge:
+                if (alias not in alias_exceptions and
+                        get_alias_shard_key(alias, self.prefix_length) != shard_key):
+                    alias_exceptions[alias] = shard_key
+            for alias in [alias for alias, alias_shard_key in alias_exceptions.items()
+                          if alias_shard_key == shard_key and alias not in shard_aliases]:
+                del alias_exceptions[alias]
+
+            shard_info = self._router['shards'][shard_key]
+            store_shard_file(shard_db, Path(self.directory, shard_info['file']))
+            shard_info['persons'] = len(shard_db)
+            self._router['next_person_id'] = self.next_person_id
+            # stored after every shard, so an interrupted merge never hands out a person_id
+            # twice
+            write_router(self._router, self.directory)
+
+
+def convert_pickle_to_sharded_people_db(pickle_path, directory=None,
+                                        prefix_length=SHARD_PREFIX_LENGTH):
+    """
+    Converts a people db pickle (e.g. d_names_db.pickle) into a sharded people db. Like
+    convert_pickle_to_people_store, the shards hold the db as PeopleDatabase.load_from_disk
+    returns it.
+
+    :param pickle_path: Path
+    :param directory: Path, defaults to pickle_path with the suffix .shards
+    :param prefix_length: int, see get_shard_key
+    :return: Path of the sharded people db
+    """
+    pickle_path = Path(pickle_path)
+    if directory is None:
+        directory = pickle_path.with_suffix('.shards')
+    people_db = PeopleDatabase()
+    people_db.load_from_disk(pickle_path)
+    write_sharded_people_db(people_db, directory, prefix_length)
+    return Path(directory)
+
+
+class TestShardedPeopleDatabase(unittest.TestCase):
+    """
+    Tests for writing, loading and merging sharded people dbs
+    """
+    def setUp(self):
+        self.people_db = PeopleDatabase()
+        for name_raw, position in [('Dunn, WL', 'Philip Morris'), ('Garcia, Raquel', None),
+                                   ('Risi, Stephan', None), ('Dunn, WL', 'RJ Reynolds'),
+                                   ('Dunn, William L', None), ('Müller, Jürgen', 'BAT'),
+                                   ('Dunhill, Anne', None), ('Teague, CE', None),
+                                   ('Van Dyke, John', None)]:
+            self.people_db.add_person_raw(name_raw, 1, position=position)
+        self.people_db.generate_alias_to_person_dict()
+        temp_dir = tempfile.TemporaryDirectory()     # pylint: disable=R1732
+        self.addCleanup(temp_dir.cleanup)
+        self.shards_path = Path(temp_dir.name, 'test.shards')
+
+    def test_lazy_lookup(self):
+        """
+        Looking up an alias has to return the same person as the people db and only load the
+        shard of the alias
+        """
+        router = write_sharded_people_db(self.people_db, self.shards_path)
+        self.assertEqual(sorted(router['shards']), ['DUN', 'DYK', 'GAR', 'MÜL', 'RIS', 'TEA'])
+        # nameparser reads "Van Dyke, John" as John Dyke with the first name Van -> the alias
+        # looks like it belongs to VAN
+        self.assertEqual(router['alias_exceptions'], {'van dyke, john': 'DYK'})
+
+        sharded_db = ShardedPeopleDatabase(self.shards_path, max_cached_shards=2)
+        self.assertEqual(len(sharded_db), len(self.people_db))
+        for alias in ['Dunn, WL', 'DUNN, WL', 'William L. Dunn', 'dunhill, anne']:
+            expected = self.people_db.get_person_from_alias(alias)
+            person = sharded_db.get_person_from_alias(alias)
+            self.assertEqual(person.person_id, expected.person_id)
+            self.assertTrue(person.has_same_content(expected))
+        self.assertEqual(sharded_db.shards_loaded, 1)
+
+        self.assertEqual(sharded_db.get_person_from_alias('Van Dyke, John').person_id,
+                         self.people_db.get_person_from_alias('Van Dyke, John').person_id)
+        self.assertIsNone(sharded_db.get_person_from_alias('Smith, John'))
+        self.assertIsNone(sharded_db.get_person_from_alias('Dunn, Frank'))
+        self.assertEqual(sharded_db.shards_loaded, 2)
+
+        # the cache holds DYK and DUN -> GAR pushes out DYK, which has to be loaded again
+        sharded_db.get_person_from_alias('Garcia, Raquel')
+        sharded_db.get_person_from_alias('Van Dyke, John')
+        self.assertEqual(sharded_db.shards_loaded, 4)
+
+    def test_round_trip(self):
+        """
+        Loading all shards has to give back the same persons, ids and alias lookups
+        """
+        write_sharded_people_db(self.people_db, self.shards_path)
+        loaded_db = ShardedPeopleDatabase(self.shards_path).to_people_db()
+        self.assertEqual(loaded_db, self.people_db)
+        self.assertEqual(loaded_db.next_person_id, self.people_db.next_person_id)
+        self.assertEqual(loaded_db.check_index_consistency(), [])
+        for alias, person in self.people_db._alias_to_person_dict.items():  # pylint: disable=W0212
+            self.assertEqual(loaded_db.get_person_from_alias(alias).person_id, person.person_id)
+
+    def test_merge_duplicates(self):
+        """
+        Merging shard by shard has to give the same persons as merging the whole db, with
+        person_ids that are unique across shards
+        """
+        write_sharded_people_db(self.people_db, self.shards_path)
+        sharded_db = ShardedPeopleDatabase(self.shards_path, max_cached_shards=1)
+        sharded_db.merge_duplicates()
+
+        merged_db = self.people_db.copy()
+        merged_db.merge_duplicates(print_merge_results_for_name=None)
+        reopened_db = ShardedPeopleDatabase(self.shards_path)
+        loaded_db = reopened_db.to_people_db()
+        self.assertEqual(loaded_db, merged_db)
+        self.assertEqual(len({person.person_id for person in loaded_db.people}), len(loaded_db))
+        self.assertEqual(reopened_db.next_person_id, merged_db.next_person_id)
+        self.assertEqual(len(reopened_db), len(merged_db))
+        for alias in ['Dunn, WL', 'William L. Dunn', 'Van Dyke, John']:
+            self.assertTrue(reopened_db.get_person_from_alias(alias).has_same_content(
+                merged_db.get_person_from_alias(alias)))
+
+    def test_cross_shard_variants(self):
+        """
+        Spelling variants in different shards do not get merged, unlike in the unsharded db
+        """
+        for name_raw in ['Ahrensfeld, Thomas F', 'Arensfeld, TF', 'Wakeham, Thomas W',
+                         'WAKEHAN, TW']:
+            self.people_db.add_person_raw(name_raw, 1)
+        write_sharded_people_db(self.people_db, self.shards_path)
+        sharded_db = ShardedPeopleDatabase(self.shards_path)
+        sharded_db.merge_duplicates(similar_last_names=True)
+
+        merged_db = self.people_db.copy()
+        merged_db.merge_duplicates(print_merge_results_for_name=None, similar_last_names=True)
+        loaded_db = ShardedPeopleDatabase(self.shards_path).to_people_db()
+        # Wakeham and Wakehan share a shard, Ahrensfeld and Arensfeld do not
+        self.assertIs(loaded_db.get_person_from_alias('WAKEHAN, TW'),
+                      loaded_db.get_person_from_alias('Wakeham, Thomas W'))
+        self.assertIsNot(loaded_db.get_person_from_alias('Arensfeld, TF'),
+                         loaded_db.get_person_from_alias('Ahrensfeld, Thomas F'))
+        self.assertEqual(len(loaded_db), len(merged_db) + 1)
+
+    def test_invalid_directory(self):
+        """
+        Routers of another version raise a ValueError
+        """
+        write_sharded_people_db(self.people_db, self.shards_path)
+        write_router({'version': 0}, self.shards_path)
+        with self.assertRaises(ValueError):
+            ShardedPeopleDatabase(self.shards_path)
+
+    def test_convert_pickle(self):
+        """
+        Converting d_names_db.pickle has to give the db that load_from_disk returns
+        """
+        pickle_path = Path('..', 'data', 'name_disambiguation', 'd_names_db.pickle')
+        people_db = PeopleDatabase()
+        people_db.load_from_disk(pickle_path)
+        convert_pickle_to_sharded_people_db(pickle_path, self.shards_path)
+        self.assertEqual(ShardedPeopleDatabase(self.shards_path).to_people_db(), people_db)
+
+        write_sharded_people_db(people_db, self.shards_path)
+        sharded_db = ShardedPeopleDatabase(self.shards_path)
+        for alias, person in people_db._alias_to_person_dict.items():  # pylint: disable=W0212
+            self.assertEqual(sharded_db.get_person_from_alias(alias).person_id, person.person_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
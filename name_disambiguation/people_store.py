@@ -0,0 +1,419 @@
+"""
+Columnar on-disk format for a PeopleDatabase.
+Unpickling a large people db takes seconds because every Person, Counter and string has to be
+rebuilt, even if a process only needs to look up a few aliases. A people store instead keeps
+the database as flat numpy arrays in one file:
+- a string table (utf-8 bytes plus offsets) that all other columns point into
+- one row per person with person_id, last, first and middle name and count
+- aliases and positions of all persons in CSR layout: row i owns the entries
+  offsets[i]:offsets[i + 1] of the strings and counts arrays
+- an open addressing hash table for the lower case alias lookups of
+  PeopleDatabase.get_person_from_alias
+PeopleStore memory-maps the file, so opening it only reads the header, and persons get created
+when they get looked up.
+The store only holds names, counts, aliases and positions: docs_authored and docs_received of
+the persons do not get stored, so persons loaded from a store do not have these attributes (like
+persons created without documents).
+"""
+
+import json
+import mmap
+import struct
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from name_disambiguation.atomic_file import atomic_write
+from name_disambiguation.clean_org_names import ORG_DICTIONARY
+from name_disambiguation.people_db import PeopleDatabase
+from name_disambiguation.person import Person
+
+PEOPLE_STORE_MAGIC = b'PEOPLEDB'
+PEOPLE_STORE_VERSION = 1
+
+# magic, format version and length of the json header
+PEOPLE_STORE_PREFIX = struct.Struct('<8sII')
+
+# arrays start at multiples of this many bytes
+PEOPLE_STORE_ALIGNMENT = 64
+
+PEOPLE_STORE_COLUMNS = [
+    ('string_offsets', '<i8'), ('string_bytes', 'u1'),
+    ('person_ids', '<i8'), ('lasts', '<i4'), ('firsts', '<i4'), ('middles', '<i4'),
+    ('counts', '<i8'),
+    ('alias_offsets', '<i8'), ('alias_strings', '<i4'), ('alias_counts', '<i8'),
+    ('position_offsets', '<i8'), ('position_strings', '<i4'), ('position_counts', '<i8'),
+    ('alias_index_keys', '<i4'), ('alias_index_rows', '<i4'),
+]
+
+
+def align(offset):
+    """
+    Rounds offset up to the next multiple of PEOPLE_STORE_ALIGNMENT
+    :param offset: int
+    :return: int
+    """
+    return -(-offset // PEOPLE_STORE_ALIGNMENT) * PEOPLE_STORE_ALIGNMENT
+
+
+def get_alias_hash(alias_bytes):
+    """
+    Returns the hash of a utf-8 encoded lower case alias in the alias index. Python's own str
+    hash changes between processes, so the index uses crc32.
+    :param alias_bytes: bytes
+    :return: int
+    """
+    return zlib.crc32(alias_bytes)
+
+
+def build_alias_index(alias_entries, get_string_id):
+    """
+    Builds the alias index of a people store: an open addressing hash table with linear
+    probing that is at most half full. Every slot holds the string id of a lower case alias and
+    the row of its person, empty slots hold -1.
+
+    :param alias_entries: list of (alias, row)
+    :param get_string_id: function that returns the string id of a string
+    :return: (numpy array of string ids, numpy array of rows)
+    """
+    index_size = 1
+    while index_size < 2 * len(alias_entries):
+        index_size *= 2
+    index_keys = np.full(index_size, -1, dtype='<i4')
+    index_rows = np.full(index_size, -1, dtype='<i4')
+    for alias, row in alias_entries:
+        slot = get_alias_hash(alias.encode('utf-8')) & (index_size - 1)
+        while index_keys[slot] != -1:
+            slot = (slot + 1) & (index_size - 1)
+        index_keys[slot] = get_string_id(alias)
+        index_rows[slot] = row
+    return index_keys, index_rows
+
+
+def get_people_store_columns(people_db):
+    """
+    Returns the columns of PEOPLE_STORE_COLUMNS for a people db. Rows are sorted by person_id.
+
+    :param people_db: PeopleDatabase
+    :return: dict of column name -> list or numpy array
+    """
+    string_to_id = {}
+
+    def get_string_id(string):
+        if string not in string_to_id:
+            string_to_id[string] = len(string_to_id)
+        return string_to_id[string]
+
+    persons = sorted(people_db.people, key=lambda person: person.person_id)
+    person_to_row = {person: row for row, person in enumerate(persons)}
+
+    columns = {name: [] for name, _ in PEOPLE_STORE_COLUMNS}
+    columns['alias_offsets'].append(0)
+    columns['position_offsets'].append(0)
+    for person in persons:
+        columns['person_ids'].append(person.person_id)
+        columns['lasts'].append(get_string_id(person.last))
+        columns['firsts'].append(get_string_id(person.first))
+        columns['middles'].append(get_string_id(person.middle))
+        columns['counts'].append(person.count)
+        for alias, count in person.alias_items():
+            columns['alias_strings'].append(get_string_id(alias))
+            columns['alias_counts'].append(count)
+        columns['alias_offsets'].append(len(columns['alias_strings']))
+        for position, count in person.position_items():
+            columns['position_strings'].append(get_string_id(position))
+            columns['position_counts'].append(count)
+        columns['position_offsets'].append(len(columns['position_strings']))
+
+    alias_to_person = people_db._alias_to_person_dict   # pylint: disable=W0212
+    columns['alias_index_keys'], columns['alias_index_rows'] = build_alias_index(
+        [(alias, person_to_row[person]) for alias, person in alias_to_person.items()
+         if person in person_to_row],
+        get_string_id)
+
+    encoded_strings = [string.encode('utf-8') for string in string_to_id]
+    columns['string_offsets'] = np.cumsum([0] + [len(string) for string in encoded_strings])
+    columns['string_bytes'] = np.frombuffer(b''.join(encoded_strings), dtype='u1')
+    return columns
+
+
+def write_people_store(people_db, file_path):
+    """
+    Stores a people db in the people store format. The file gets written to a temporary file
+    next to file_path first and then moved into place, so readers never see half a file.
+    docs_authored and docs_received of the persons do not get stored.
+
+    :param people_db: PeopleDatabase
+    :param file_path: Path
+    :return: None
+    """
+    columns = get_people_store_columns(people_db)
+    arrays = []
+    header = {'next_person_id': people_db.next_person_id, 'arrays': {}}
+    offset = 0
+    for name, dtype in PEOPLE_STORE_COLUMNS:
+        array = np.ascontiguousarray(columns[name], dtype=dtype)
+        header['arrays'][name] = {'dtype': dtype, 'length': len(array), 'offset': offset}
+        arrays.append(array)
+        offset += align(array.nbytes)
+    header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+    data_start = align(PEOPLE_STORE_PREFIX.size + len(header_bytes))
+
+    with atomic_write(file_path) as outfile:
+        outfile.write(PEOPLE_STORE_PREFIX.pack(PEOPLE_STORE_MAGIC, PEOPLE_STORE_VERSION,
+                                               len(header_bytes)))
+        outfile.write(header_bytes)
+        for array in arrays:
+            outfile.write(b'\0' * (data_start - outfile.tell()))
+            outfile.write(array.tobytes())
+            data_start += align(array.nbytes)
+
+
+class PeopleStore:
+    """
+    Read-only, memory-mapped view of a people store file.
+    Attributes:
+        next_person_id (int): next_person_id of the stored people db
+    """
+    def __init__(self, file_path):
+        """
+        Opens a people store. Only reads the header; the arrays are numpy views of the
+        memory-mapped file.
+        :param file_path: Path
+        """
+        with open(str(file_path), 'rb') as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_length = PEOPLE_STORE_PREFIX.unpack_from(self._mmap, 0)
+        if magic != PEOPLE_STORE_MAGIC or version != PEOPLE_STORE_VERSION:
+            self._mmap.close()
+            raise ValueError(f'{file_path} is not a people store of version '
+                             f'{PEOPLE_STORE_VERSION}.')
+        header = json.loads(self._mmap[PEOPLE_STORE_PREFIX.size:
+                                       PEOPLE_STORE_PREFIX.size + header_length].decode('utf-8'))
+        self.next_person_id = header['next_person_id']
+
+        data_start = align(PEOPLE_STORE_PREFIX.size + header_length)
+        self._arrays = {}
+        for name, array_info in header['arrays'].items():
+            self._arrays[name] = np.frombuffer(self._mmap, dtype=array_info['dtype'],
+                                               count=array_info['length'],
+                                               offset=data_start + array_info['offset'])
+        self._string_bytes_start = data_start + header['arrays']['string_bytes']['offset']
+
+    def __len__(self):
+        return len(self._arrays['person_ids'])
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.get_person(row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Closes the memory map. Arrays returned by the store must not be used afterwards.
+        :return: None
+        """
+        self._arrays = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # numpy views of the map are still referenced somewhere (e.g. by a traceback), the
+            # map gets closed when they get garbage collected
+            pass
+
+    def get_string(self, string_id):
+        """
+        Returns a string from the string table
+        :param string_id: int
+        :return: str
+        """
+        string_offsets = self._arrays['string_offsets']
+        start = self._string_bytes_start + int(string_offsets[string_id])
+        end = self._string_bytes_start + int(string_offsets[string_id + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def get_person(self, row):
+        """
+        Creates the Person stored in a row
+        :param row: int
+        :return: Person
+        """
+        arrays = self._arrays
+        state = {'last': self.get_string(arrays['lasts'][row]),
+                 'first': self.get_string(arrays['firsts'][row]),
+                 'middle': self.get_string(arrays['middles'][row]),
+                 'count': int(arrays['counts'][row]),
+                 'person_id': int(arrays['person_ids'][row])}
+        for attr, column in [('aliases', 'alias'), ('positions', 'position')]:
+            start, end = arrays[f'{column}_offsets'][row:row + 2]
+            packed = []
+            for string_id, count in zip(arrays[f'{column}_strings'][start:end].tolist(),
+                                        arrays[f'{column}_counts'][start:end].tolist()):
+                packed += [self.get_string(string_id), count]
+            state[attr] = tuple(packed)
+
+        person = Person.__new__(Person)
+        person.__setstate__(state)
+        return person
+
+    def find_row(self, alias):
+        """
+        Returns the row of the person that PeopleDatabase.get_person_from_alias would return
+        for alias
+        :param alias: str
+        :return: int or None
+        """
+        alias_bytes = alias.lower().encode('utf-8')
+        index_keys = self._arrays['alias_index_keys']
+        string_offsets = self._arrays['string_offsets']
+        index_mask = len(index_keys) - 1
+        slot = get_alias_hash(alias_bytes) & index_mask
+        while True:
+            string_id = int(index_keys[slot])
+            if string_id == -1:
+                return None
+            start = self._string_bytes_start + int(string_offsets[string_id])
+            end = self._string_bytes_start + int(string_offsets[string_id + 1])
+            if self._mmap[start:end] == alias_bytes:
+                return int(self._arrays['alias_index_rows'][slot])
+            slot = (slot + 1) & index_mask
+
+    def get_person_from_alias(self, alias):
+        """
+        Same as PeopleDatabase.get_person_from_alias without loading the whole db. Every call
+        creates a new Person object.
+        :param alias: str
+        :return: Person or None
+        """
+        row = self.find_row(alias)
+        return None if row is None else self.get_person(row)
+
+    def to_people_db(self):
+        """
+        Loads the whole store into a PeopleDatabase
+        :return: PeopleDatabase
+        """
+        people_db = PeopleDatabase()
+        persons = list(self)
+        for person in persons:
+            people_db.add_person(person)
+        people_db.next_person_id = self.next_person_id
+        people_db.raw_org_to_clean_org_dict = ORG_DICTIONARY.raw_to_clean.copy()
+
+        index_keys = self._arrays['alias_index_keys']
+        index_rows = self._arrays['alias_index_rows']
+        for slot in np.flatnonzero(index_keys != -1).tolist():
+            people_db.add_alias_to_alias_to_person_dict(self.get_string(index_keys[slot]),
+                                                        persons[index_rows[slot]])
+        return people_db
+
+
+def convert_pickle_to_people_store(pickle_path, store_path=None):
+    """
+    Converts a people db pickle (e.g. d_names_db.pickle) into a people store. The store holds
+    the db as PeopleDatabase.load_from_disk returns it, i.e. without company accounts and with
+    the manually merged names.
+
+    :param pickle_path: Path
+    :param store_path: Path, defaults to pickle_path with the suffix .peoplestore
+    :return: Path of the people store
+    """
+    pickle_path = Path(pickle_path)
+    if store_path is None:
+        store_path = pickle_path.with_suffix('.peoplestore')
+    people_db = PeopleDatabase()
+    people_db.load_from_disk(pickle_path)
+    write_people_store(people_db, store_path)
+    return Path(store_path)
+
+
+class TestPeopleStore(unittest.TestCase):
+    """
+    Tests for storing and loading people stores
+    """
+    def setUp(self):
+        self.people_db = PeopleDatabase()
+        for name_raw, position in [('Dunn, WL', 'Philip Morris'), ('Garcia, Raquel', None),
+                                   ('Risi, Stephan', None), ('Dunn, WL', 'RJ Reynolds'),
+                                   ('Dunn, William L', None), ('Müller, Jürgen', 'BAT'),
+                                   ('Garcia, Raquel', None), ('Teague, CE', None)]:
+            self.people_db.add_person_raw(name_raw, 1, position=position)
+        self.people_db.generate_alias_to_person_dict()
+        temp_dir = tempfile.TemporaryDirectory()     # pylint: disable=R1732
+        self.addCleanup(temp_dir.cleanup)
+        self.store_path = Path(temp_dir.name, 'test.peoplestore')
+
+    def test_round_trip(self):
+        """
+        Loading a store has to give back the same persons, ids and alias lookups
+        """
+        write_people_store(self.people_db, self.store_path)
+        with PeopleStore(self.store_path) as store:
+            self.assertEqual(len(store), len(self.people_db))
+            self.assertEqual(store.next_person_id, self.people_db.next_person_id)
+            loaded_db = store.to_people_db()
+
+        self.assertEqual(loaded_db, self.people_db)
+        self.assertEqual(sorted(person.person_id for person in loaded_db.people),
+                         sorted(person.person_id for person in self.people_db.people))
+        self.assertEqual(loaded_db.check_index_consistency(), [])
+        for alias, person in self.people_db._alias_to_person_dict.items():  # pylint: disable=W0212
+            loaded_person = loaded_db.get_person_from_alias(alias)
+            self.assertEqual(loaded_person.person_id, person.person_id)
+            self.assertTrue(loaded_person.has_same_content(person))
+            self.assertEqual(loaded_person.alias_items(), person.alias_items())
+            self.assertEqual(loaded_person.position_items(), person.position_items())
+
+    def test_lazy_lookup(self):
+        """
+        Looking up an alias in the store has to return the same person as the people db
+        """
+        write_people_store(self.people_db, self.store_path)
+        with PeopleStore(self.store_path) as store:
+            for alias in ['Dunn, WL', 'DUNN, WL', 'müller, jürgen', 'Risi, Stephan']:
+                expected = self.people_db.get_person_from_alias(alias)
+                person = store.get_person_from_alias(alias)
+                self.assertEqual(person.person_id, expected.person_id)
+                self.assertTrue(person.has_same_content(expected))
+            self.assertIsNone(store.get_person_from_alias('Smith, John'))
+
+    def test_invalid_file(self):
+        """
+        Files that are not people stores (e.g. pickles) raise a ValueError
+        """
+        self.people_db.store_to_disk(self.store_path)
+        with self.assertRaises(ValueError):
+            PeopleStore(self.store_path)
+
+    def test_convert_pickle(self):
+        """
+        Converting d_names_db.pickle (pickled from __main__) has to give the db that
+        load_from_disk returns. The pickled persons have no ids and some aliases belong to
+        several persons, so ids and lookups of two loads only match if they come from the same
+        load.
+        """
+        pickle_path = Path('..', 'data', 'name_disambiguation', 'd_names_db.pickle')
+        people_db = PeopleDatabase()
+        people_db.load_from_disk(pickle_path)
+
+        convert_pickle_to_people_store(pickle_path, self.store_path)
+        with PeopleStore(self.store_path) as store:
+            self.assertEqual(store.to_people_db(), people_db)
+
+        write_people_store(people_db, self.store_path)
+        with PeopleStore(self.store_path) as store:
+            for alias, person in people_db._alias_to_person_dict.items():  # pylint: disable=W0212
+                self.assertEqual(store.get_person_from_alias(alias).person_id, person.person_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,21 +3,83 @@ The Person class represents a person's name and related information.
 Can parse raw name strings into Person objects
 """
 
-import copy
 import re
-import unittest
+import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 from nameparser import HumanName
-from nameparser.config import CONSTANTS
-from name_disambiguation.clean_org_names import RAW_ORG_TO_CLEAN_ORG_DICT
+from name_disambiguation.clean_org_names import ORG_DICTIONARY
+from name_disambiguation.fast_name_parser import configure_nameparser, split_name
+from name_disambiguation.name_parse_cache import NAME_PARSE_CACHE, init_name_parse_worker
 
-CONSTANTS.titles.remove(*CONSTANTS.titles)
+# used to normalize name parts like HumanName does when they get assigned (normalize_name_part)
+NAME_PIECES_PARSER = HumanName()
+
+
+def pack_counter(counter):
+    """
+    Packs a Counter into a flat tuple (key1, count1, key2, count2, ...) ordered like
+    Counter.most_common(), with interned keys. Packed tuples are passed through unchanged.
+    Empty Counters become the (shared) empty tuple.
+
+    >>> pack_counter(Counter({'DUNN,WL': 1, 'DUNN, W. L.': 3}))
+    ('DUNN, W. L.', 3, 'DUNN,WL', 1)
+
+    :param counter: Counter or packed tuple
+    :return: tuple
+    """
+    if isinstance(counter, tuple):
+        return counter
+    packed = []
+    for key, count in counter.most_common():
+        packed.append(sys.intern(key) if isinstance(key, str) else key)
+        packed.append(count)
+    return tuple(packed)
+
+
+def unpack_counter(packed):
+    """
+    Turns a tuple created by pack_counter back into a Counter (Counters are passed through)
+    :param packed: tuple or Counter
+    :return: Counter
+    """
+    if isinstance(packed, Counter):
+        return packed
+    return Counter(dict(zip(packed[::2], packed[1::2])))
+
+
+def counter_items(packed):
+    """
+    Returns the (key, count) pairs of a packed tuple or Counter, most common first
+    :param packed: tuple or Counter
+    :return: list of tuples
+    """
+    if isinstance(packed, Counter):
+        return packed.most_common()
+    return list(zip(packed[::2], packed[1::2]))
+
+
+def format_counter(packed):
+    """
+    Returns the same string as str(Counter) for a packed tuple or Counter
+
+    >>> format_counter(('PHILIP MORRIS', 2))
+    "Counter({'PHILIP MORRIS': 2})"
+
+    :param packed: tuple or Counter
+    :return: str
+    """
+    if not packed:
+        return 'Counter()'
+    return f'Counter({dict(counter_items(packed))!r})'
 
 
 class Person:
     """A Person object represents information of a person (possibly parsed from raw strings,
     or merged from different strings)
+    To keep large people databases small, persons use __slots__, interned name parts and store
+    positions and aliases as packed tuples (see pack_counter) until they get accessed.
     Attributes:
         last (str): official parsed last name
         first (str): official parsed first name
@@ -27,10 +89,16 @@ class Person:
                                     be clean official org names; can be in lower case)
         aliases (Counter of str): counter of raw names that correspond to the person
         count (int): number of times the person appeared in the data
+        person_id (int): id assigned by the PeopleDatabase that holds the person (None until the
+                         person gets added to one). Used for hashing and equality
     """
-    def __init__(self, name_raw=None, last='', first='',    # pylint: disable=R0912,R0913,W0212
+    __slots__ = ('last', 'first', 'middle', 'count', '_positions', '_aliases', 'docs_authored',
+                 'docs_received', 'person_id', '_most_likely_position')
+
+    def __init__(self, name_raw=None, last='', first='',  # pylint: disable=R0912,R0913,R0917,W0212
                  middle='',
-                 positions=None, aliases=None, count=1, docs_authored=None, docs_received=None):
+                 positions=None, aliases=None, count=1, docs_authored=None, docs_received=None,
+                 person_id=None):
         """
         Returns a person object
         :param name_raw: raw string for the name (str)
@@ -41,6 +109,8 @@ class Person:
         :param aliases: Counter of raw strings that correspond to this person object (if known) (
         list of str)
         :param count: number of times the alias appeared in the data (int)
+        :param person_id: id of the person in a PeopleDatabase (int). Usually left to
+        PeopleDatabase.add_person
         """
 
         # initialize positions as an empty Counter if it is not given
@@ -75,9 +145,9 @@ class Person:
         # TODO: SR: do we really want all the first/last/middle names to be ALL CAPS?
         # set last, first, middle, position, positions: all converted to upper case
         # set aliases and count
-        self.last = last.upper()
-        self.first = first.upper()
-        self.middle = middle.upper()
+        self.last = sys.intern(last.upper())
+        self.first = sys.intern(first.upper())
+        self.middle = sys.intern(middle.upper())
         #self.most_likely_org = most_likely_org
         # remove periods and convert to upper case
         if isinstance(positions, Counter):
@@ -111,6 +181,117 @@ class Person:
                 raise ValueError("docs_received for Person object has to be a set.")
 
         self.count = count
+        self.person_id = person_id
+        self.compact()
+
+    def __getstate__(self):
+        """
+        Returns the state for pickling: a dict of the attributes with positions and aliases as
+        packed tuples
+        :return: dict
+        """
+        state = {'last': self.last, 'first': self.first, 'middle': self.middle,
+                 'count': self.count, 'positions': pack_counter(self._positions),
+                 'aliases': pack_counter(self._aliases), 'person_id': self.person_id}
+        for attr in ['docs_authored', 'docs_received']:
+            if hasattr(self, attr):
+                state[attr] = getattr(self, attr)
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores a pickled person. Also reads pickles created before Person had __slots__, where
+        the state is the old __dict__ with positions and aliases as Counters. Attributes that
+        Person no longer has are dropped.
+        :param state: dict
+        :return: None
+        """
+        self.last = sys.intern(state.get('last', ''))
+        self.first = sys.intern(state.get('first', ''))
+        self.middle = sys.intern(state.get('middle', ''))
+        self.count = state.get('count', 1)
+        self.person_id = state.get('person_id')
+        self.positions = state.get('positions', ())
+        self.aliases = state.get('aliases', ())
+        for attr in ['docs_authored', 'docs_received']:
+            if attr in state:
+                setattr(self, attr, state[attr])
+        self.compact()
+
+    @property
+    def positions(self):
+        """
+        Counter of all parsed organizations of the person. Accessing it turns the packed
+        positions into a Counter; call compact() to pack them again after changing them
+        :return: Counter
+        """
+        if not isinstance(self._positions, Counter):
+            self._positions = unpack_counter(self._positions)
+            # the Counter can get changed -> most_likely_position has to be recalculated
+            self._most_likely_position = None
+        return self._positions
+
+    @positions.setter
+    def positions(self, positions):
+        """
+        :param positions: Counter or packed tuple (see pack_counter)
+        """
+        self._positions = positions if isinstance(positions, (Counter, tuple)) else \
+            Counter(positions)
+        self._most_likely_position = None
+
+    @property
+    def aliases(self):
+        """
+        Counter of raw names of the person. Accessing it turns the packed aliases into a
+        Counter; call compact() to pack them again after changing them
+        :return: Counter
+        """
+        if not isinstance(self._aliases, Counter):
+            self._aliases = unpack_counter(self._aliases)
+        return self._aliases
+
+    @aliases.setter
+    def aliases(self, aliases):
+        """
+        :param aliases: Counter or packed tuple (see pack_counter)
+        """
+        self._aliases = aliases if isinstance(aliases, (Counter, tuple)) else Counter(aliases)
+
+    def compact(self):
+        """
+        Packs positions and aliases into tuples with interned strings to save memory. They turn
+        back into Counters the next time they get accessed
+        :return: None
+        """
+        self._positions = pack_counter(self._positions)
+        self._aliases = pack_counter(self._aliases)
+
+    def position_items(self):
+        """
+        Returns (position, count) pairs, most common first, without turning packed positions
+        into a Counter
+        :return: list of tuples (str, int)
+        """
+        return counter_items(self._positions)
+
+    def alias_items(self):
+        """
+        Returns (alias, count) pairs, most common first, without turning packed aliases into a
+        Counter
+        :return: list of tuples (str, int)
+        """
+        return counter_items(self._aliases)
+
+    def alias_keys(self):
+        """
+        Returns the aliases without their counts, most common first. Cheaper than alias_items
+        for packed aliases
+        :return: tuple or list of str
+        """
+        if isinstance(self._aliases, Counter):
+            return [alias for alias, _ in self._aliases.most_common()]
+        return self._aliases[::2]
 
     def __repr__(self):
         """
@@ -119,18 +300,22 @@ class Person:
         :return: str of first, middle, last, positions, aliases
         """
         str_name = self.full_name + f'   F:{self.first} M:{self.middle} L:{self.last}'
-        str_name = str_name + ", Position: " + str(self.positions) + ", Aliases: " + \
-            str(self.aliases.most_common()) + ", count: " + str(self.count)
+        str_name = str_name + ", Position: " + format_counter(self._positions) + \
+            ", Aliases: " + str(self.alias_items()) + ", count: " + str(self.count)
         return str_name
 
     def __eq__(self, other):
         """
-        Compares two person object using hash (which hashes the string of last, first, middle,
-        position, positions, aliases, and count)
+        Compares two person objects by person_id. Persons without a person_id are only equal to
+        themselves. Use has_same_content to compare names, positions, and aliases
         :param other: another person object
         :return: bool (if two person objects are the same)
         """
-        return hash(self) == hash(other)
+        if not isinstance(other, Person):
+            return NotImplemented
+        if self.person_id is None or other.person_id is None:
+            return self is other
+        return self.person_id == other.person_id
 
     def __lt__(self, other):
 
@@ -138,19 +323,54 @@ class Person:
 
     def copy(self):
         """
-        Copies a person object
+        Copies a person object. The copy is a new person without a person_id
         :return: a copied person object
         """
         return Person(last=self.last, first=self.first, middle=self.middle,
-                      positions=copy.deepcopy(self.positions),
-                      aliases=copy.deepcopy(self.aliases), count=self.count)
+                      positions=unpack_counter(self._positions),
+                      aliases=unpack_counter(self._aliases), count=self.count)
+
+    def clone(self):
+        """
+        Copies a person object including its person_id, so the clone is equal to the person and
+        can replace it in a PeopleDatabase. Packed positions and aliases are tuples and get
+        shared with the clone instead of copied
+        :return: a cloned person object
+        """
+        clone = Person.__new__(Person)
+        clone.__setstate__(self.__getstate__())
+        for attr in ['docs_authored', 'docs_received']:
+            if hasattr(self, attr):
+                setattr(clone, attr, set(getattr(self, attr)))
+        # the positions did not change -> the cached most likely position stays valid
+        clone._most_likely_position = self._most_likely_position    # pylint: disable=W0212
+        return clone
 
     def __hash__(self):
         """
-        Hashes the person
+        Hashes the person by person_id, so the hash does not change when the person gets
+        updated. Persons without a person_id hash by identity
         :return: hash (int)
         """
-        return hash(f'{self.last} {self.first} {self.middle} {self.positions} {self.aliases}')
+        if self.person_id is None:
+            return id(self)
+        return hash(self.person_id)
+
+    def content_key(self):
+        """
+        Returns the names, positions, and aliases of the person as a hashable tuple
+        :return: tuple
+        """
+        return (self.last, self.first, self.middle, frozenset(self.position_items()),
+                frozenset(self.alias_items()))
+
+    def has_same_content(self, other):
+        """
+        Compares names, positions, and aliases of two persons (ignoring person_id)
+        :param other: another person object
+        :return: bool
+        """
+        return self.content_key() == other.content_key()
 
     def stemmed(self):
         """
@@ -192,13 +412,32 @@ class Person:
     @property
     def most_likely_position(self, official_org=True):      # pylint: disable=R0206
         """
-        Calculates and sets most_likely_org as the organization with the highest number of count
+        Returns the most likely organization of the person (see get_most_likely_position).
+        The result is cached until positions get changed.
+
+        :param official_org: if consider only orgs in RAW_ORG_TO_CLEAN_ORG_DICT
+        :return: str
+        """
+        # positions that are not packed can change at any time -> only cache packed positions
+        if not isinstance(self._positions, tuple):
+            return self.get_most_likely_position(self.position_items(), official_org)
+
+        if self._most_likely_position is None:
+            self._most_likely_position = self.get_most_likely_position(self.position_items(),
+                                                                       official_org)
+        return self._most_likely_position
+
+    @staticmethod
+    def get_most_likely_position(position_items, official_org=True):
+        """
+        Calculates most_likely_org as the organization with the highest number of count
         If official_org=True, returns official name of most common organization that is in
         RAW_ORG_TO_CLEAN_ORG_DICT (if none of the raw orgs are in the dict, return the most common)
 
 
+        :param position_items: list of (position, count) pairs, most common first
         :param official_org: if consider only orgs in RAW_ORG_TO_CLEAN_ORG_DICT
-        :return: None
+        :return: str
         """
 
         if not official_org:
@@ -206,7 +445,9 @@ class Person:
                   "just to correct spelling mistakes. Keeping around for compatibility and "
                   "possibly to see what organizations our offical list misses.")
 
-        for position, position_count in self.positions.most_common():
+        raw_org_to_clean_org_dict = ORG_DICTIONARY.raw_to_clean
+
+        for position, position_count in position_items:
             # a single mention of an affiliation is not enough to count. need at least 2
             if position_count == 1:
                 return 'no positions available'
@@ -215,20 +456,20 @@ class Person:
             # we update the position to the corrected version.
             # otherwise, skip this position. w/o official position, just use the raw position.
             if official_org:
-                if (position in RAW_ORG_TO_CLEAN_ORG_DICT and
-                        RAW_ORG_TO_CLEAN_ORG_DICT[position] != "@skip@"):
-                    return RAW_ORG_TO_CLEAN_ORG_DICT[position]
+                if (position in raw_org_to_clean_org_dict and
+                        raw_org_to_clean_org_dict[position] != "@skip@"):
+                    return raw_org_to_clean_org_dict[position]
                 else:
                     continue
             else:
                 return position
 
         # if nothing found, return nothing found
-        if len(self.positions) > 0:
-            for position, _ in self.positions.most_common():
+        if len(position_items) > 0:
+            for position, _ in position_items:
                 if (
-                        position in RAW_ORG_TO_CLEAN_ORG_DICT and
-                        RAW_ORG_TO_CLEAN_ORG_DICT[position] == '@skip@'
+                        position in raw_org_to_clean_org_dict and
+                        raw_org_to_clean_org_dict[position] == '@skip@'
                 ):
                     continue
                 if len(position) < 5:
@@ -305,6 +546,96 @@ class Person:
         to be able to check if a name is valid (it prevents an infinite loop because by default,
         extracting organizations is part of the initialization of a person
 
+        Raw names repeat a lot, so results are cached in NAME_PARSE_CACHE (parsed with count=1
+        and scaled by count when returned).
+
+        :param name_raw: str
+        :param count: int
+        :param extract_orgs: bool
+        :return: str, str, str, Counter (first name, middle name, last name, positions Counter)
+        """
+        cached = NAME_PARSE_CACHE.get(name_raw, extract_orgs)
+        if cached is None:
+            cached = Person.parse_raw_name_uncached(name_raw, 1, extract_orgs)
+            NAME_PARSE_CACHE.set(name_raw, extract_orgs, cached)
+
+        first, middle, last, positions = cached
+        return first, middle, last, Counter({pos: pos_count * count
+                                             for pos, pos_count in positions.items()})
+
+    @staticmethod
+    def parse_many(names_raw, workers=1, chunksize=1000, extract_orgs=True):
+        """
+        Parses many raw names at once and returns their parse results in input order.
+        Duplicates get parsed only once and names already in NAME_PARSE_CACHE are not parsed
+        again. With workers > 1, the remaining names get parsed in a process pool (every worker
+        process has its own org dict and matcher).
+        New results get added to NAME_PARSE_CACHE as far as it has room for them (see
+        NameParseCache.set_many), so Persons created from these names afterwards mostly do not
+        have to parse anything.
+
+        Results are the same as those of parse_raw_name(name_raw, 1, extract_orgs). Names that
+        nameparser cannot split (IndexError) get None; creating a Person from them raises the
+        error again. Other errors get raised.
+
+        :param names_raw: iterable of str
+        :param workers: int, number of worker processes
+        :param chunksize: int, number of names that get sent to a worker at once
+        :param extract_orgs: bool
+        :return: list of (str, str, str, Counter) or None
+        """
+        names_raw = list(names_raw)
+        results = {}
+        names_to_parse = []
+        for name_raw in dict.fromkeys(names_raw):
+            cached = NAME_PARSE_CACHE.get(name_raw, extract_orgs)
+            if cached is None:
+                names_to_parse.append(name_raw)
+            else:
+                results[name_raw] = cached
+
+        new_results = parse_names_in_chunks(names_to_parse, workers, chunksize, extract_orgs)
+        NAME_PARSE_CACHE.set_many(new_results, extract_orgs)
+        results.update(new_results)
+
+        output = []
+        for name_raw in names_raw:
+            result = results[name_raw]
+            if result is not None:
+                first, middle, last, positions = result
+                result = (first, middle, last, Counter(positions))
+            output.append(result)
+        return output
+
+    @classmethod
+    def from_parse_result(cls, name_raw, parse_result, count=1):
+        """
+        Creates the person for a raw name from its parse result without parsing the name
+        again. Gives the same person as Person(name_raw, count=count), but positions and
+        aliases get set as packed tuples.
+
+        :param name_raw: str
+        :param parse_result: (first, middle, last, positions) for count 1 as returned by
+                             parse_many
+        :param count: int
+        :return: Person
+        """
+        first, middle, last, positions = parse_result
+        person = cls(last=last, first=first, middle=middle, count=count)
+        if positions:
+            # unary + drops positions without counts, like __init__
+            person.positions = pack_counter(+Counter({position: position_count * count
+                                                      for position, position_count
+                                                      in positions.items()}))
+        person.aliases = (sys.intern(name_raw.upper()), count)
+        return person
+
+    @staticmethod
+    def parse_raw_name_uncached(name_raw: str, count: int,
+                                extract_orgs=True) -> (str, str, str, Counter):
+        """
+        Does the actual parsing for parse_raw_name without looking at NAME_PARSE_CACHE
+
         :param name_raw: str
         :param count: int
         :param extract_orgs: bool
@@ -344,116 +675,190 @@ class Person:
         if len(name_raw) > 2 and name_raw[-3] == '-':
             name_raw = name_raw[:-3] + " " + name_raw[-2:]
 
-        # Parse current string using HumanName
-        name = HumanName(name_raw)
+        # Split current string into first, middle, last, and suffix: simple shapes like "DUNN,WL"
+        # are handled by the fast path, everything else by HumanName.
+        # HumanName normalizes every value assigned to one of its name parts, so from here on,
+        # all assignments go through normalize_name_part.
+        first, middle, last, suffix = split_name(name_raw)
 
         # e.g. Dunn W -> parsed as last name W. -> switch first/last
-        if len(name.last) <= 2 < len(name.first):
-            name.first, name.last = name.last, name.first
+        if len(last) <= 2 < len(first):
+            first, last = Person.normalize_name_part(last), Person.normalize_name_part(first)
 
         # remove periods from initials
-        if len(name.first) == 2 and name.first[1] == '.':
-            name.first = name.first[0]
-        if len(name.middle) == 2 and name.middle[1] == '.':
-            name.middle = name.middle[0]
+        if len(first) == 2 and first[1] == '.':
+            first = Person.normalize_name_part(first[0])
+        if len(middle) == 2 and middle[1] == '.':
+            middle = Person.normalize_name_part(middle[0])
 
         # If first name is length 2 (Teague, CE), the two letters are most likely initials.
-        if len(name.middle) == 0 and len(name.first) == 2:
-            name.middle = name.first[1].upper()
-            name.first = name.first[0].upper()
+        if len(middle) == 0 and len(first) == 2:
+            middle = Person.normalize_name_part(first[1].upper())
+            first = Person.normalize_name_part(first[0].upper())
 
         # If first and middle initials have periods but not spaces -> separate, e.g. "R.K. Teague"
-        if re.match(r'[a-zA-Z]\.[a-zA-Z]\.', name.first):
-            name.middle = name.first[2]
-            name.first = name.first[0]
+        if re.match(r'[a-zA-Z]\.[a-zA-Z]\.', first):
+            middle = Person.normalize_name_part(first[2])
+            first = Person.normalize_name_part(first[0])
 
-        name.last = name.last.capitalize()
-        name.first = name.first.capitalize()
-        name.middle = name.middle.capitalize()
+        last = Person.normalize_name_part(last.capitalize())
+        first = Person.normalize_name_part(first.capitalize())
+        middle = Person.normalize_name_part(middle.capitalize())
 
         # if multiple names are passed, they often end up in the middle name
         # e.g. 'Holtzman, A.,  Murray, J. ,  Henson, A.  -> only allow one comma or set to empty
-        if name.middle.count(',') > 1:
-            name.middle = ''
+        if middle.count(',') > 1:
+            middle = ''
+
+        if len(suffix) > 20 and suffix.count('.') > 2:
+            suffix = ''
+
+        if suffix:
+            extracted_positions.append(suffix)
 
-        if len(name.suffix) > 20 and name.suffix.count('.') > 2:
-            name.suffix = ''
+        return first, middle, last, Person.get_clean_positions(extracted_positions, count)
 
-        if name.suffix:
-            extracted_positions.append(name.suffix)
+    @staticmethod
+    def get_clean_positions(extracted_positions, count):
+        """
+        Maps the positions extracted by parse_raw_name_uncached to clean official organization
+        names (if they are in the ORG_DICTIONARY) and counts them
 
+        :param extracted_positions: list of str
+        :param count: int
+        :return: Counter
+        """
         # map organization names to clean official names (if they are in the dict) using
         # RAW_ORG_TO_CLEAN_ORG_DICT
+        raw_org_to_clean_org_dict = ORG_DICTIONARY.raw_to_clean
         clean_orgs = []
         for raw_org in extracted_positions:
-            if raw_org in RAW_ORG_TO_CLEAN_ORG_DICT:
-                clean_org = RAW_ORG_TO_CLEAN_ORG_DICT[raw_org]
+            if raw_org in raw_org_to_clean_org_dict:
+                clean_org = raw_org_to_clean_org_dict[raw_org]
                 if clean_org != '@skip@':
                     clean_orgs.append(clean_org)
             else:
                 clean_orgs.append(raw_org)
-        extracted_positions = clean_orgs
 
         # convert mapped positions into a counter
         result_positions = Counter()
-        for position in extracted_positions:
+        for position in clean_orgs:
             cleaned = re.sub(r'\.', '', position)
             result_positions[cleaned.upper()] += count
+        return result_positions
+
+    @staticmethod
+    def normalize_name_part(value):
+        """
+        Returns a first/middle/last name the way HumanName stores it when it gets assigned to a
+        HumanName attribute (split on spaces, commas stripped from every piece, conjunctions and
+        prefixes joined). parse_raw_name used to modify HumanName attributes directly, this keeps
+        its results the same.
 
-        # print(name.first, name.middle, name.last, result_positions)
-        return name.first, name.middle, name.last, result_positions
+        >>> Person.normalize_name_part('Murray, J. , Henson')
+        'Murray J.  Henson'
+
+        :param value: str
+        :return: str
+        """
+        # values without periods, commas and at most two pieces never change
+        if '.' not in value and ',' not in value and value.count(' ') < 2:
+            return value
+        configure_nameparser()
+        return ' '.join(NAME_PIECES_PARSER.parse_pieces([value]))
 
     @staticmethod
-    def extract_raw_org_names_from_name(name_raw):
+    def extract_known_raw_org_names(name_raw):
         """
-        Finds raw org names like "B&W" in a name string, standarizes them (e.g. to
-        "Brown & Williamson," and returns the name without that raw org name + extracted positions
+        Finds and removes all raw org names of RAW_ORG_TO_CLEAN_ORG_DICT in a name string.
+        Raw orgs are handled in the order of the dict and for each one, the last hit gets removed
+        first. Two letter raw orgs (e.g. "PM") only get removed if the rest still looks like
+        a name with first or middle name. "@skip@" orgs get removed without adding a position.
 
+        >>> Person.extract_known_raw_org_names('TEMKO PM, PM')
+        ('TEMKO PM, ', ['Philip Morris'])
 
         :param name_raw: str
-        :param extract_orgs: bool
-        :return: str (name_raw without the raw org name), list of str (extracted clean
+        :return: str (name_raw without the raw org names), list of str (extracted clean
         organization names)
         """
         extracted_positions = []
+        raw_org_matcher = ORG_DICTIONARY.matcher
+
+        # RAW_ORG_MATCHER finds all raw orgs that could be in name_raw with a single scan.
+        # We then go through those candidates in the order of RAW_ORG_TO_CLEAN_ORG_DICT. Every
+        # extraction changes name_raw, so after one, we rescan for the remaining raw orgs.
+        next_raw_org_id = 0
+        while True:
+            name_raw_changed = False
+            for raw_org_id in raw_org_matcher.get_candidate_ids(name_raw):
+                if raw_org_id < next_raw_org_id:
+                    continue
+
+                raw_org = raw_org_matcher.raw_orgs[raw_org_id]
+                clean_org = raw_org_matcher.clean_orgs[raw_org_id]
+                pattern = raw_org_matcher.get_pattern(raw_org_id)
 
-        for raw_org, clean_org in RAW_ORG_TO_CLEAN_ORG_DICT.items():
+                while True:
+                    search_hit = None
+                    # this is a bit of an ugly hack to get the last (rather than the first) search
+                    # hit for a string: we iterate over all matches and the last one gets stored in
+                    # search_hit
+                    for search_hit in pattern.finditer(name_raw):
+                        pass
 
-            while True:
-                search_hit = None
-                # this is a bit of an ugly hack to get the last (rather than the first) search hit
-                # for a string: we iterate over all matches and the last one gets stored in
-                # search_hit
+                    if not search_hit:
+                        break
 
-                for search_hit in re.finditer(r'\b' + raw_org + r'\b', name_raw):
-                    pass
+                    if len(raw_org) >= 3:
+                        name_raw = name_raw[0:search_hit.start()] + name_raw[search_hit.end():]
+                        name_raw_changed = True
+                        if not clean_org == "@skip@":
+                            extracted_positions.append(clean_org)
+
+                    elif len(raw_org) == 2:
+                        name_raw_test = name_raw[0:search_hit.start()] + \
+                                        name_raw[search_hit.end():]
+
+                        # test if deleted, there exists first & middle name
+                        first, middle, last, _ = split_name(name_raw_test)
+                        # if first & middle name do not exist after deletion, the deleted org
+                        # might actually be initials, so ignore the match
+                        if not first and not middle:
+                            break
+
+                        # last names without middle names ("TEMKO") get interpreted as first
+                        # names without last names. Skip those cases
+                        if not last:
+                            break
+
+                        # if not, do extract raw_org
+                        extracted_positions.append(clean_org)
+                        name_raw = name_raw_test
+                        name_raw_changed = True
 
-                if not search_hit:
+                if name_raw_changed:
+                    next_raw_org_id = raw_org_id + 1
                     break
 
-                if len(raw_org) >= 3:
-                    name_raw = name_raw[0:search_hit.start()] + name_raw[search_hit.end():]
-                    if not clean_org == "@skip@":
-                        extracted_positions.append(clean_org)
+            if not name_raw_changed:
+                break
 
-                elif len(raw_org) == 2:
-                    name_raw_test = name_raw[0:search_hit.start()] + name_raw[search_hit.end():]
+        return name_raw, extracted_positions
 
-                    # test if deleted, there exists first & middle name
-                    name = HumanName(name_raw_test)
-                    # if first & middle name do not exist after deletion, the deleted org might
-                    # actually be initials, so ignore the match
-                    if not name.first and not name.middle:
-                        break
+    @staticmethod
+    def extract_raw_org_names_from_name(name_raw):
+        """
+        Finds raw org names like "B&W" in a name string, standarizes them (e.g. to
+        "Brown & Williamson," and returns the name without that raw org name + extracted positions
 
-                    # last names without middle names ("TEMKO") get interpreted as first names
-                    # without last names. Skip those cases
-                    if not name.last:
-                        break
 
-                    # if not, do extract raw_org
-                    extracted_positions.append(clean_org)
-                    name_raw = name_raw_test
+        :param name_raw: str
+        :param extract_orgs: bool
+        :return: str (name_raw without the raw org name), list of str (extracted clean
+        organization names)
+        """
+        name_raw, extracted_positions = Person.extract_known_raw_org_names(name_raw)
 
         name_raw = name_raw.strip(', ')
 
@@ -505,274 +910,41 @@ class Person:
 
         return status
 
-
-
-class TestNameChecker(unittest.TestCase):
+def parse_names_uncached(names_raw, extract_orgs=True):
     """
-    Tests the check_if_this_person_looks_valid test
+    Parses a list of raw names with count 1 (used by the workers of Person.parse_many)
+    :param names_raw: list of str
+    :param extract_orgs: bool
+    :return: list of (str, str, str, Counter), None for names that nameparser cannot split
     """
-    def test_check_if_this_person_looks_valid(self):        # pylint: disable=C0103
-        """
-        ibid.
-
-        :return:
-        """
-        outcomes_and_names = [
-            (True, Person(last='PEPPLES', first='E')),
-
-            # no special characters in last or first name
-            (False, Person(last='PEPPLES', first='Erest, B&W')),
-            (False, Person(last='PEPPLES B&W', first='E')),
-
-            # has to have a first name
-            (False, Person(last='PEPPLES', first='')),
-
-            # organizations should return False
-            (False, Person(name_raw='US HOUSE COMM ON INTERSTATE AND FOREIGN COMMERCE'))
-        ]
-
-        for outcome, person in outcomes_and_names:
-            print(person.check_if_this_person_looks_valid(), outcome, person)
-            self.assertEqual(outcome, person.check_if_this_person_looks_valid())
+    results = []
+    for name_raw in names_raw:
+        try:
+            results.append(Person.parse_raw_name_uncached(name_raw, 1, extract_orgs))
+        except IndexError:
+            results.append(None)
+    return results
 
 
-class TestNameParser(unittest.TestCase):
-    """Tests name parsing (parse_raw_name) of the Person class
-    Attributes:
-        test_raw_names: dict that corresponds raw names (str) to the expected Person object
+def parse_names_in_chunks(names_raw, workers, chunksize, extract_orgs):
     """
-    def setUp(self):
-        self.test_raw_names = {
-        }
-
-    # Not sure what the correct parsing is!
-    # This one breaks. But I don't think it can be avoided.
-    # >> > n = Person('Holtz, Jacob Alexander, Jacob & Medinger')
-    # >> > n.last, n.first, n.middle, " ".join(n.positions).upper()
-    # ('Holtz', '', '', 'JACOB ALEXANDER, JACOB & MEDINGER')
-
-    def test_parse_name_1(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        # Also test Person constructor: use list as positions
-        self.assertEqual(Person(last="Teague", first="C", middle="E", positions=Counter({'JR': 1}),
-                                aliases=Counter(["TEAGUE CE JR"])),
-                         Person(name_raw="TEAGUE CE JR"))
-
-    def test_parse_name_2(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        # Also test Person constructor: use Counter as positions
-        self.assertEqual(Person(last="Teague", first="C", middle="E", positions=Counter(["JR"]),
-                                aliases=Counter(["TEAGUE CE JR"])),
-                         Person(name_raw="teague ce jr"))
-
-    # TODO parse JR & PHD in positions into two separate strings
-    # def test_parse_name_3(self):
-    #     """
-    #     checks to see that a raw name is parsed correctly
-    #     """
-    #     # (currently parse them together, which is suboptimal but acceptable)
-    #     self.assertEqual(Person(last="Teague", first="Claude", middle="Edward",
-    #                             positions={"JR", "PHD"},
-    #                             aliases=["Teague, Claude Edward, Jr., Ph.D."]),
-    #                      Person(name_raw="Teague, Claude Edward, Jr., Ph.D."))
-
-    def test_parse_name_4(self):
-        """
-        checks to see that a raw name is parsed correctly: test parsing of dashes
-        """
-        self.assertEqual(Person(last="Baker", first="T", middle="E",
-                                positions={"NATIONAL ASSOCIATION OF ATTORNEYS GENERAL"},
-                                aliases=Counter(["BAKER, T E - NATIONAL ASSOCIATION OF ATTORNEYS "
-                                                 "GENERAL"])
-                               ),
-                         Person(name_raw="BAKER, T E - NATIONAL ASSOCIATION OF ATTORNEYS GENERAL"))
-
-    def test_parse_name_5(self):
-        """
-        checks to see that a raw name is parsed correctly: test parsing of dashes
-        """
-        self.assertEqual(Person(last="Baker", first="C", middle="J", positions={},
-                                aliases=Counter(["BAKER-CJ"])),
-                         Person(name_raw="BAKER-cj"))
-
-    def test_parse_name_6(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        # Not specify positions: test to make sure Person constructor can handle no data
-        # Here we assume for "Baker, JR", it is more likely that JR are initials and not junior
-        self.assertEqual(Person(last="Baker", first="J", middle="R",
-                                aliases=Counter(["BAKER, JR"])),
-                         Person(name_raw="Baker, JR"))
-
-    def test_parse_name_7(self):
-        """
-        checks to see that a raw name is parsed correctly: test if parser ignores "#"
-        """
-        self.assertEqual(Person(last="Dunn", first="W", middle="L",
-                                aliases=Counter(["DUNN WL #"])),
-                         Person(name_raw="DUNN WL #"))
-
-    def test_parse_name_8(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Dunn", first="W", middle="L",
-                                aliases=Counter(["DUNN, W. L."])),
-                         Person(name_raw="Dunn, W. L."))
-
-    def test_parse_name_9(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Temko", first="S", middle="L",
-                                positions=["COVINGTON & BURLING"],
-                                aliases=Counter(["TEMKO SL, COVINGTON AND BURLING"])),
-                         Person(name_raw="TEMKO SL, COVINGTON AND BURLING"))
-
-    def test_parse_name_10(self):
-        """
-        checks to see that a raw name is parsed correctly: test if Privlog is handled correctly
-        """
-        self.assertEqual(Person(last="Temko", first="Stanley", middle="L",
-                                aliases=Counter(["TEMKO, STANLEY L [PRIVLOG:] TEMKO,SL"])),
-                         Person(name_raw="Temko, Stanley L [Privlog:] TEMKO,SL"))
-
-    def test_parse_name_11(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Temko", first="S", middle="L",
-                                positions=["Covington & Burling"],
-                                aliases=Counter(["TEMKO-SL, COVINGTON & BURLING"])),
-                         Person(name_raw="Temko-SL, Covington & Burling"))
-
-    def test_parse_name_12(self):
-        """
-        checks to see that a raw name is parsed correctly:
-        test if info inside parentheses is taken as positions
-        """
-        self.assertEqual(Person(last="Henson", first="A", middle="",
-                                positions=["AMERICAN SENIOR VICE PRESIDENT AND GENERAL COUNSEL"],
-                                aliases=Counter(["HENSON, A. (AMERICAN SENIOR VICE PRESIDENT AND "
-                                                 "GENERAL COUNSEL)"])),
-                         Person(name_raw="HENSON, A. (AMERICAN SENIOR VICE PRESIDENT AND GENERAL "
-                                         "COUNSEL)"))
-
-    def test_parse_name_13(self):
-        """
-        checks to see that a raw name is parsed correctly:
-        test if only the first person's name is extracted if the raw string contain multiple people
-        """
-        self.assertEqual(Person(last="Henson", first="A", middle="",
-                                positions=["CHADBOURNE, PARK, WHITESIDE & WOLFF"],
-                                aliases=Counter(["HENSON, A. (CHADBOURNE, PARKE, WHITESIDE & "
-                                                 "WOLFF, "
-                                                 "AMERICAN OUTSIDE COUNSEL) (HANDWRITTEN NOTES)"])),
-                         Person(name_raw="HENSON, A. (CHADBOURNE, PARKE, WHITESIDE & WOLFF, "
-                                         "AMERICAN OUTSIDE COUNSEL) (HANDWRITTEN NOTES)"))
-
-    # TODO fix when multiple names are in the same string, not parse remaining name as positions
-    # def test_parse_name_14(self):
-    #     """
-    #     checks to see that a raw name is parsed correctly:
-    #     test parsing of multiple people in raw string
-    #     """
-    #     # This one does not discard the rest of the names and instead stores in positions
-    #     # (see test_parse_name_14b which correctly handles it when there are more names)
-    #     print("positions: ", Person(name_raw="Holtzman, A.,  Murray, J. ,  Henson, A.").positions)
-    #     self.assertEqual(Person(last="Holtzman", first="A", middle="", positions=[],
-    #                             aliases=["Holtzman, A.,  Murray, J. ,  Henson, A."]),
-    #                      Person(name_raw="Holtzman, A.,  Murray, J. ,  Henson, A."))
-
-    def test_parse_name_14b(self):
-        """
-        checks to see that a raw name is parsed correctly: comparison to 14
-        """
-        self.assertEqual(Person(last="Holtzman", first="A", middle="", positions=[],
-                                aliases=Counter(["HOLTZMAN, A.,  MURRAY, J. ,  HENSON, A. ,  "
-                                                 "PEPPLES, E. ,  STEVENS, A. ,  WITT, S."])),
-                         Person(name_raw="Holtzman, A.,  Murray, J. ,  Henson, A. ,  "
-                                         "Pepples, E. ,  Stevens, A. ,  Witt, S."))
-
-    def test_parse_name_15(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Holtz", first="Jacob", middle="",
-                                positions=["Jacob & Medinger"],
-                                aliases=Counter(["HOLTZ, JACOB, JACOB & MEDINGER"])),
-                         Person(name_raw="Holtz, Jacob, Jacob & Medinger"))
-
-    def test_parse_name_16(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Proctor", first="D", middle="F",
-                                positions=["Johns Hopkins University"],
-                                aliases=Counter(["PROCTOR DF, JOHNS HOPKINS SCHOOL OF HYGIENE"])),
-                         Person(name_raw="PROCTOR DF, JOHNS HOPKINS SCHOOL OF HYGIENE"))
-
-    def test_parse_name_17(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Smith", first="Andy", middle="B", positions=["JR"],
-                                aliases=["SMITH, ANDY B, J.R."]),
-                         Person(name_raw="Smith, Andy B, J.R."))
-
-    def test_parse_name_18(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Cantrell", first="D", middle="",
-                                positions=["BROWN & WILLIAMSON"], aliases=["D CANTRELL, B&W"]),
-                         Person(name_raw="D Cantrell, B&W"))
-
-    def test_parse_name_19(self):
-        """
-        checks to see that a raw name is parsed correctly
-        """
-        self.assertEqual(Person(last="Cantrell", first="A", middle="B",
-                                positions=["BROWN & WILLIAMSON"], aliases=["A B CANTRELL, BW"]),
-                         Person(name_raw="A B Cantrell, BW"))
-
-
-class TestOrgParser(unittest.TestCase):
-    """
-    Tests organization parser and extracter in extract_raw_org_names_from_name
+    Parses a list of distinct raw names in chunks, in a process pool if workers > 1
+    :param names_raw: list of str
+    :param workers: int, number of worker processes
+    :param chunksize: int, number of names that get sent to a worker at once
+    :param extract_orgs: bool
+    :return: dict of name_raw -> (str, str, str, Counter) or None, in the order of names_raw
     """
-
-    def test_parse_org_1(self):
-        self.assertEqual(
-            Person.extract_raw_org_names_from_name('TEMKO SL, COVINGTON AND BURLING'),
-            ('TEMKO SL', ['Covington & Burling'])
-        )
-
-    def test_parse_org_2(self):
-        # if an organization could also be name initials, keep the initials
-        self.assertEqual(
-            Person.extract_raw_org_names_from_name('TEMKO PM'),
-            ('TEMKO PM', [])
-        )
-
-    def test_parse_org_3(self):
-        self.assertEqual(
-            Person.extract_raw_org_names_from_name('TEMKO PM, PM'),
-            ('TEMKO PM', ['Philip Morris'])
-        )
-
-    def test_parse_org_4(self):
-        # organizations in @skip@ like UNK (unknown) should be deleted
-        self.assertEqual(
-            Person.extract_raw_org_names_from_name('TEMKO PM, UNK'),
-            ('TEMKO PM', [])
-        )
-
-
-if __name__ == '__main__':
-    unittest.main()
+    chunks = [names_raw[i:i + chunksize] for i in range(0, len(names_raw), chunksize)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_name_parse_worker) as executor:
+            chunk_results = list(executor.map(parse_names_uncached, chunks,
+                                              [extract_orgs] * len(chunks)))
+    else:
+        chunk_results = [parse_names_uncached(chunk, extract_orgs) for chunk in chunks]
+
+    results = {}
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        results.update(zip(chunk, chunk_result))
+    return results
@@ -0,0 +1,47 @@
+"""
+Tests of the network generation (network_generation.py)
+"""
+
+import contextlib
+import io
+import unittest
+from collections import Counter
+
+from name_disambiguation.network_generation import create_network_people_db
+from name_disambiguation.people_db import PeopleDatabase
+
+
+class TestNetworkGeneration(unittest.TestCase):
+    """
+    Test cases for the network generation
+    """
+    def test_create_network_people_db(self):
+        """
+        Persons merged in the network db must not get the person_id of another person of the
+        loaded people db, which could then be mistaken for them (e.g. for a center person)
+        """
+        people_db = PeopleDatabase()
+        for name in ['Dunn, WL', 'Dunn, William L', 'Risi, Stephan']:
+            people_db.add_person_raw(name, 1)
+        dunn_wl = people_db.get_person_from_alias('Dunn, WL')
+        dunn_william = people_db.get_person_from_alias('Dunn, William L')
+        center_people = {people_db.get_person_from_alias('Risi, Stephan')}
+        nodes_temp = Counter({dunn_wl: 3, dunn_william: 2})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            network_db = create_network_people_db(people_db, nodes_temp, manual_merge=False)
+
+        self.assertEqual(len(network_db), 1)
+        merged = next(iter(network_db.people))
+        self.assertEqual(merged.full_name, 'William L. Dunn')
+        self.assertEqual(merged.count, 5)
+        self.assertGreaterEqual(merged.person_id, people_db.next_person_id)
+        self.assertNotIn(merged, center_people)
+        self.assertEqual(nodes_temp[merged], 0)
+        # the network counts do not change the loaded people db
+        self.assertEqual((dunn_wl.count, dunn_william.count), (1, 1))
+        self.assertEqual(len(people_db), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,650 @@
+"""
+Tests of the PeopleDatabase (people_db.py) and its merge engines, copy-on-write copies,
+checkpoints and manual merges
+"""
+
+import os
+import random
+import stat
+import tempfile
+import threading
+import unittest
+from collections import Counter, defaultdict
+from pathlib import Path
+from unittest import mock
+
+from name_disambiguation.clean_org_names import ORG_DICTIONARY
+from name_disambiguation.config import COMPANY_ABBREVIATIONS_TO_SKIP
+from name_disambiguation.merge_checkpoint import MergeCheckpointWriter, write_merge_checkpoint
+from name_disambiguation.merge_log import MERGE_RULE_MANUALLY_MERGED_NAMES, \
+    MERGE_RULE_SIMILAR_LAST_NAME, MergeLog, read_merge_log
+from name_disambiguation.people_db import PeopleDatabase, get_post_load_fingerprint, \
+    get_post_load_state_path
+from name_disambiguation.person import Person
+
+
+class TestPeopleDB(unittest.TestCase):
+    """
+    Test cases for the people db
+    """
+    def setUp(self):
+        self.people_db = PeopleDatabase()
+        for initial_name in ['Dunn, WL', 'Garcia, Raquel', 'Risi, Stephan', 'Dunn, WL',
+                             'Dunn, William L', 'Garcia, Raquel']:
+            self.people_db.add_person_raw(initial_name, 1)
+
+    def test_pickle(self):
+        """
+        Test if pickling works
+        """
+        self.people_db.store_to_disk(Path('..', 'data', 'name_disambiguation',
+                                          'test_peopledb.pickle'))
+        loaded_db = PeopleDatabase()
+        loaded_db.load_from_disk(Path('..', 'data', 'name_disambiguation',
+                                      'test_peopledb.pickle'))
+        self.assertEqual(self.people_db, loaded_db)
+
+    def test_post_load_state(self):
+        """
+        The post-load state gets stored next to the pickle and reused on the next load as long
+        as the pickle and the config lists do not change. The pickle itself never changes, so
+        config changes in both directions apply to the original persons.
+        """
+        self.people_db.add_person_raw('UNK', 1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pickle_path = Path(temp_dir, 'people_db.pickle')
+            self.people_db.store_to_disk(pickle_path)
+            pickle_bytes = pickle_path.read_bytes()
+
+            loaded_db = PeopleDatabase()
+            loaded_db.load_from_disk(pickle_path, store_post_load_state=True)
+            self.assertIsNone(loaded_db.get_person_from_alias('UNK'))
+            self.assertEqual(loaded_db.post_load_fingerprint, get_post_load_fingerprint())
+            self.assertEqual(pickle_path.read_bytes(), pickle_bytes)
+            self.assertTrue(get_post_load_state_path(pickle_path).exists())
+
+            # the post-load steps must not run again
+            reloaded_db = PeopleDatabase()
+            with mock.patch.object(PeopleDatabase, 'add_manually_merged_names',
+                                   side_effect=AssertionError):
+                reloaded_db.load_from_disk(pickle_path)
+            self.assertEqual(reloaded_db, loaded_db)
+            self.assertEqual(reloaded_db.check_index_consistency(), [])
+            self.assertEqual(reloaded_db.get_person_from_alias('dunn, wl').person_id,
+                             loaded_db.get_person_from_alias('dunn, wl').person_id)
+
+            # changing the db or the config lists invalidates the stored state
+            reloaded_db.add_person_raw('Teague, CE', 1)
+            self.assertIsNone(reloaded_db.post_load_fingerprint)
+            with mock.patch('name_disambiguation.people_db.COMPANY_ABBREVIATIONS_TO_SKIP',
+                            COMPANY_ABBREVIATIONS_TO_SKIP | {'risi,stephan'}):
+                reloaded_db = PeopleDatabase()
+                reloaded_db.load_from_disk(pickle_path, store_post_load_state=True)
+            self.assertIsNone(reloaded_db.get_person_from_alias('Risi, Stephan'))
+            self.assertEqual(len(reloaded_db), len(loaded_db) - 1)
+
+            # removing the entry again brings the person back
+            reloaded_db = PeopleDatabase()
+            reloaded_db.load_from_disk(pickle_path)
+            self.assertIsNotNone(reloaded_db.get_person_from_alias('Risi, Stephan'))
+            self.assertEqual(reloaded_db, loaded_db)
+
+            # a new pickle does not use the post-load state of the old one
+            self.people_db.add_person_raw('Teague, CE', 1)
+            self.people_db.store_to_disk(pickle_path)
+            reloaded_db = PeopleDatabase()
+            reloaded_db.load_from_disk(pickle_path)
+            self.assertIsNotNone(reloaded_db.get_person_from_alias('Teague, CE'))
+
+    @unittest.skipUnless(os.name == 'posix', 'file permissions')
+    def test_store_permissions(self):
+        """
+        Stored pickles and post-load states get the permissions of the files they replace, or
+        the usual permissions of new files, instead of the 0600 of temporary files.
+        """
+        previous_umask = os.umask(0o022)
+        self.addCleanup(os.umask, previous_umask)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pickle_path = Path(temp_dir, 'people_db.pickle')
+            self.people_db.store_to_disk(pickle_path)
+            PeopleDatabase().load_from_disk(pickle_path, store_post_load_state=True)
+            self.assertEqual(stat.S_IMODE(pickle_path.stat().st_mode), 0o644)
+            self.assertEqual(
+                stat.S_IMODE(get_post_load_state_path(pickle_path).stat().st_mode), 0o644)
+
+            os.chmod(str(pickle_path), 0o640)
+            self.people_db.store_to_disk(pickle_path)
+            self.assertEqual(stat.S_IMODE(pickle_path.stat().st_mode), 0o640)
+
+    def test_add_people_bulk(self):
+        """
+        add_people_bulk has to give the same db (including person ids, alias order and the alias
+        dict) as adding the names one by one with add_person_raw
+        """
+        names = ['Dunn, WL', 'DUNN, WL', 'Dunn, WL', 'W. L. Dunn', 'Dunn, William L',
+                 'Garcia, Raquel', 'Risi, Stephan (Philip Morris)', 'Risi, Stephan',
+                 'Teague, CE - RJ Reynolds', 'Teague, CE', 'DUKE UNIVERSITY', 'Garcia, Raquel']
+        for min_count in [1, 2]:
+            expected_db = PeopleDatabase()
+            for name, count in Counter(names).items():
+                if count >= min_count:
+                    expected_db.add_person_raw(name, count)
+
+            bulk_db = PeopleDatabase()
+            bulk_db.add_people_bulk(names, min_count=min_count)
+            self.assertEqual(bulk_db, expected_db)
+            self.assertEqual(
+                sorted((person.person_id, person.full_name, person.count, person.alias_items(),
+                        person.position_items()) for person in bulk_db.people),
+                sorted((person.person_id, person.full_name, person.count, person.alias_items(),
+                        person.position_items()) for person in expected_db.people))
+            bulk_aliases = bulk_db._alias_to_person_dict             # pylint: disable=W0212
+            expected_aliases = expected_db._alias_to_person_dict     # pylint: disable=W0212
+            self.assertEqual({alias: person.person_id for alias, person in bulk_aliases.items()},
+                             {alias: person.person_id
+                              for alias, person in expected_aliases.items()})
+            self.assertEqual(bulk_db.raw_org_to_clean_org_dict,
+                             expected_db.raw_org_to_clean_org_dict)
+            self.assertEqual(bulk_db.check_index_consistency(), [])
+
+        # counters and dicts are counts per raw name
+        bulk_db = PeopleDatabase()
+        bulk_db.add_people_bulk(Counter({'Dunn, WL': 2, 'Garcia, Raquel': 1}), min_count=2)
+        self.assertEqual(len(bulk_db), 1)
+        self.assertEqual(bulk_db.get_person_from_alias('dunn, wl').count, 2)
+
+    def test_merge1(self):
+        """
+        Test people_db merge 1
+        """
+
+        self.people_db.merge_duplicates()
+        self.assertEqual(len(self.people_db), 3)
+
+        alias_set = len(set(self.people_db._alias_to_person_dict.values())) # pylint: disable=W0212
+        self.assertEqual(len(self.people_db), alias_set)
+
+    def test_person_ids(self):
+        """
+        Every person gets a unique id that stays the same when the person gets updated, and
+        merged persons get a new id
+        """
+        person_ids = {person.person_id for person in self.people_db.people}
+        self.assertEqual(person_ids, {0, 1, 2, 3})
+
+        dunn = self.people_db.get_person_from_alias('Dunn, WL')
+        dunn_id = dunn.person_id
+        self.people_db.add_person_raw('Dunn, WL', 2)
+        self.assertEqual(dunn.person_id, dunn_id)
+        self.assertIn(dunn, self.people_db.people)
+
+        self.people_db.merge_duplicates()
+        self.assertEqual(self.people_db.get_person_from_alias('Dunn, WL').person_id, 4)
+        self.assertEqual(self.people_db.next_person_id, 5)
+
+    def test_equality_compares_content(self):
+        """
+        Databases with the same persons are equal even if the person ids differ
+        """
+        other_db = PeopleDatabase()
+        for name in ['Garcia, Raquel', 'Garcia, Raquel', 'Dunn, William L', 'Risi, Stephan',
+                     'Dunn, WL', 'Dunn, WL']:
+            other_db.add_person_raw(name, 1)
+        self.assertEqual(self.people_db, other_db)
+        other_db.add_person_raw('Risi, Stephan', 1)
+        self.assertNotEqual(self.people_db, other_db)
+
+    def test_most_likely_positions(self):
+        """
+        Test that most likely positions get calculated for all persons and update with new
+        positions
+        """
+        self.people_db.add_person_raw('Risi, Stephan (Philip Morris)', 1)
+        risi = self.people_db.get_person_from_alias('Risi, Stephan (Philip Morris)')
+        most_likely_positions = self.people_db.get_most_likely_positions()
+        self.assertEqual(len(most_likely_positions), len(self.people_db))
+        self.assertEqual(most_likely_positions[risi], 'no positions available')
+
+        # a second mention of the org is enough
+        self.people_db.add_person_raw('Risi, Stephan (Philip Morris)', 1)
+        self.assertEqual(risi.most_likely_position, ORG_DICTIONARY.raw_to_clean['PHILIP MORRIS'])
+        self.assertEqual(self.people_db.get_most_likely_positions()[risi],
+                         ORG_DICTIONARY.raw_to_clean['PHILIP MORRIS'])
+
+    def test_last_name_index(self):
+        """
+        The last name index has to contain exactly the persons of the db, grouped by last name,
+        after adding, merging and loading persons
+        """
+        def assert_index_matches_people(people_db):
+            expected = defaultdict(set)
+            for person in people_db.people:
+                expected[person.last].add(person)
+            last_name_index = people_db._last_name_to_people        # pylint: disable=W0212
+            self.assertEqual(dict(last_name_index), dict(expected))
+
+        assert_index_matches_people(self.people_db)
+        self.people_db.add_person_raw('Dunn, Frank', 1)
+        assert_index_matches_people(self.people_db)
+        self.people_db.merge_duplicates()
+        assert_index_matches_people(self.people_db)
+        dunns = self.people_db._last_name_to_people['DUNN']     # pylint: disable=W0212
+        self.assertEqual(len(dunns), 2)
+
+        test_path = Path('..', 'data', 'name_disambiguation', 'test_peopledb.pickle')
+        self.people_db.store_to_disk(test_path)
+        loaded_db = PeopleDatabase()
+        loaded_db.load_from_disk(test_path)
+        assert_index_matches_people(loaded_db)
+        assert_index_matches_people(self.people_db.copy())
+
+    def test_merge2(self):
+        """
+        Test people_db merge 2
+        """
+
+        people_db_test = PeopleDatabase()
+        for name in ['DUNN,W', 'DUNN,WL', 'DUNN,WL JR', 'DUNN, W. L.', 'Dunn, FW,'
+                     'Dunn, William L', 'Dunn,WL', 'DUNN,WL Jr', 'DUNN, WL', 'Dunn, Frank',
+                     'Dunn, Frank W']:
+            people_db_test.add_person_raw(name, 1)
+        people_db_test.merge_duplicates()
+        self.assertEqual(len(people_db_test), 4)
+        alias_set = len(set(self.people_db._alias_to_person_dict.values()))  # pylint: disable=W0212
+        self.assertEqual(len(people_db_test), alias_set)
+
+
+    def test_union_find_engine(self):
+        """
+        The union_find engine has to produce the same persons as the sequential engine
+        """
+        for names in [
+                ['Dunn, WL', 'Garcia, Raquel', 'Risi, Stephan', 'Dunn, WL', 'Dunn, William L',
+                 'Garcia, Raquel'],
+                ['DUNN,W', 'DUNN,WL', 'DUNN,WL JR', 'DUNN, W. L.', 'Dunn, FW,', 'Dunn, William L',
+                 'Dunn,WL', 'DUNN,WL Jr', 'DUNN, WL', 'Dunn, Frank', 'Dunn, Frank W'],
+                ['Dunn, W', 'Dunn, William', 'Dunn, Walter', 'Dunn, WL', 'Dunn, Walter L',
+                 'Dunn, William K', 'Dunn, WK']
+        ]:
+            sequential_db = PeopleDatabase()
+            union_find_db = PeopleDatabase()
+            for name in names:
+                sequential_db.add_person_raw(name, 1)
+                union_find_db.add_person_raw(name, 1)
+            sequential_db.merge_duplicates()
+            union_find_db.merge_duplicates(engine='union_find')
+            self.assertEqual(sequential_db, union_find_db)
+
+            aliases = union_find_db._alias_to_person_dict           # pylint: disable=W0212
+            self.assertEqual(set(aliases.values()), union_find_db.people)
+
+        with self.assertRaises(ValueError):
+            self.people_db.merge_duplicates(engine='recursive')
+
+    def test_parallel_merge(self):
+        """
+        Merging in a process pool has to produce the same persons, aliases and person ids for
+        any number of workers as the serial merge
+        """
+        names = ['DUNN,W', 'DUNN,WL', 'DUNN,WL JR', 'DUNN, W. L.', 'Dunn, William L', 'Dunn,WL',
+                 'Dunn, Frank', 'Dunn, Frank W', 'Garcia, Raquel', 'Garcia, R', 'Risi, Stephan',
+                 'Risi, S', 'Risi, Stephan (Philip Morris)', 'Teague, CE', 'Teague, Claude E',
+                 'Mueller, Anna', 'Mueller, Bernd', 'Dunn, Zoe']
+        for engine in ['sequential', 'union_find']:
+            merged_dbs = []
+            for workers in [1, 2, 3]:
+                people_db = PeopleDatabase()
+                for name in names:
+                    people_db.add_person_raw(name, 1)
+                unchanged_persons = [people_db.get_person_from_alias(name)
+                                     for name in ['Mueller, Anna', 'Mueller, Bernd', 'Dunn, Zoe']]
+                if workers < 3:
+                    people_db.merge_duplicates(print_merge_results_for_name=None, engine=engine,
+                                               workers=workers)
+                else:
+                    # small tasks so that the last names get spread over the workers
+                    people_db.merge_last_names_in_parallel(engine, workers, task_size=3)
+                # persons that did not get merged stay the same objects
+                for person, name in zip(unchanged_persons,
+                                        ['Mueller, Anna', 'Mueller, Bernd', 'Dunn, Zoe']):
+                    self.assertIs(people_db.get_person_from_alias(name), person)
+                    self.assertTrue(any(db_person is person for db_person in people_db.people))
+                merged_dbs.append(people_db)
+
+            for people_db in merged_dbs[1:]:
+                self.assertEqual(people_db, merged_dbs[0])
+                aliases = people_db._alias_to_person_dict           # pylint: disable=W0212
+                first_aliases = merged_dbs[0]._alias_to_person_dict  # pylint: disable=W0212
+                self.assertEqual({alias: person.content_key() for alias, person in aliases.items()},
+                                 {alias: person.content_key()
+                                  for alias, person in first_aliases.items()})
+                self.assertEqual(set(aliases.values()), people_db.people)
+                self.assertEqual(people_db.check_index_consistency(), [])
+                self.assertEqual(sorted(person.person_id for person in people_db.people),
+                                 sorted(person.person_id for person in merged_dbs[0].people))
+
+    def test_merge_matrix(self):
+        """
+        get_merge_matrix has to agree with check_if_persons_can_be_merged on random persons
+        """
+        random_generator = random.Random(0)
+        names = ['', '', '', '', 'W', 'L', 'WL', 'Wi', 'William', 'Walter', 'Lee', 'Lewis',
+                 'w/shook', 'Ä', 'Äbel']
+        # some aliases are shared by several persons, some only belong to one person
+        aliases = ['DUNN, WL', 'DUNN, W', 'DUNN WL', 'W DUNN'] + [f'DUNN {i}' for i in range(100)]
+        for _ in range(50):
+            persons = []
+            for _ in range(random_generator.randint(1, 40)):
+                persons.append(Person(
+                    last='Dunn', first=random_generator.choice(names),
+                    middle=random_generator.choice(names),
+                    aliases=Counter(random_generator.sample(aliases,
+                                                            random_generator.randint(0, 2)))))
+            merge_matrix = PeopleDatabase.get_merge_matrix(persons)
+            for person1_idx, person1 in enumerate(persons):
+                for person2_idx, person2 in enumerate(persons):
+                    self.assertEqual(merge_matrix[person1_idx, person2_idx],
+                                     PeopleDatabase.check_if_persons_can_be_merged(person1,
+                                                                                    person2),
+                                     msg=f'{person1} {person2}')
+
+    def test_alias_index(self):
+        """
+        The alias index has to stay consistent when persons get added, merged, copied and
+        loaded, and get_alias_groups has to find the persons that share aliases
+        """
+        self.assertEqual(self.people_db.check_index_consistency(), [])
+        self.people_db.add_person_raw('Dunn, Frank', 1)
+        self.people_db.add_person_raw('Dunn, William L', 2)
+        dunns = sorted(self.people_db._last_name_to_people['DUNN'],  # pylint: disable=W0212
+                       key=lambda x: x.person_id)
+        dunns[1].aliases += Counter({'DUNN, WL': 1})
+        dunns[1].compact()
+        self.assertEqual(len(self.people_db.check_index_consistency()), 1)
+        self.people_db.remove_person(dunns[1])
+        self.people_db.add_person(dunns[1])
+        self.assertEqual(self.people_db.check_index_consistency(), [])
+        self.assertEqual(self.people_db.get_alias_groups(dunns), [[0, 1]])
+
+        self.people_db.merge_duplicates()
+        self.assertEqual(self.people_db.check_index_consistency(), [])
+        self.assertEqual(self.people_db.copy().check_index_consistency(), [])
+
+        test_path = Path('..', 'data', 'name_disambiguation', 'test_peopledb.pickle')
+        self.people_db.store_to_disk(test_path)
+        loaded_db = PeopleDatabase()
+        loaded_db.load_from_disk(test_path)
+        self.assertEqual(loaded_db.check_index_consistency(), [])
+
+    def test_copy_on_write(self):
+        """
+        A copy shares persons and index sets with the original db until one of them changes,
+        keeps the alias index, and changes to either db do not show up in the other one
+        """
+        original_key = sorted(person.content_key() for person in self.people_db.people)
+        people_db_copy = self.people_db.copy()
+        risi = self.people_db.get_person_from_alias('Risi, Stephan')
+        self.assertIs(people_db_copy.get_person_from_alias('Risi, Stephan'), risi)
+        self.assertEqual(people_db_copy.raw_org_to_clean_org_dict,
+                         self.people_db.raw_org_to_clean_org_dict)
+
+        # adding an existing name changes the person -> it gets cloned in the copy only
+        people_db_copy.add_person_raw('Risi, Stephan', 2)
+        people_db_copy.merge_duplicates()
+        self.assertEqual(sorted(person.content_key() for person in self.people_db.people),
+                         original_key)
+        self.assertEqual(risi.count, 1)
+        self.assertIs(self.people_db.get_person_from_alias('Risi, Stephan'), risi)
+        self.assertEqual(people_db_copy.get_person_from_alias('Risi, Stephan').count, 3)
+        self.assertEqual(len(self.people_db._last_name_to_people['RISI']),  # pylint: disable=W0212
+                         1)
+
+        # and the other way round
+        self.people_db.add_person_raw('Garcia, Raquel', 5)
+        self.assertEqual(people_db_copy.get_person_from_alias('Garcia, Raquel').count, 2)
+        self.assertEqual(self.people_db.get_person_from_alias('Garcia, Raquel').count, 7)
+
+        self.assertEqual(self.people_db.check_index_consistency(), [])
+        self.assertEqual(people_db_copy.check_index_consistency(), [])
+
+        # persons that get changed directly have to be owned first
+        people_db_copy = self.people_db.copy()
+        garcia = self.people_db.get_person_from_alias('Garcia, Raquel')
+        owned_garcia = people_db_copy.own_person(
+            people_db_copy.get_person_from_alias('Garcia, Raquel'))
+        self.assertIsNot(owned_garcia, garcia)
+        owned_garcia.count += 1
+        self.assertEqual(garcia.count, 7)
+        self.assertIs(people_db_copy.get_person_from_alias('Garcia, Raquel'), owned_garcia)
+
+        # once all sets of an index have been copied, the copied keys are not tracked anymore
+        # pylint: disable=W0212
+        for last_name in list(people_db_copy._last_name_to_people):
+            people_db_copy.get_index_set('_last_name_to_people', last_name)
+        self.assertIsNone(people_db_copy._owned_index_keys['_last_name_to_people'])
+        self.assertIsNotNone(self.people_db._owned_index_keys['_last_name_to_people'])
+        self.assertEqual(people_db_copy.check_index_consistency(), [])
+
+    def test_merge_log(self):
+        """
+        Replaying the merge log of a merge on the unmerged db has to give the same persons,
+        person ids and alias lookups, for every engine and number of workers
+        """
+        names = ['DUNN,W', 'DUNN,WL', 'DUNN,WL JR', 'DUNN, W. L.', 'Dunn, William L', 'Dunn,WL',
+                 'Dunn, Frank', 'Dunn, Frank W', 'Garcia, Raquel', 'Garcia, R', 'Risi, Stephan',
+                 'Risi, S', 'Risi, Stephan (Philip Morris)', 'Wakeham, Helmut',
+                 'Wakehan, Helmut', 'Teague, CE', 'Teague, Claude E']
+        for engine, workers in [('sequential', 1), ('union_find', 1), ('union_find', 2)]:
+            raw_db = PeopleDatabase()
+            raw_db.add_people_bulk(names)
+            merged_db = raw_db.copy()
+            with tempfile.TemporaryDirectory() as temp_dir:
+                log_path = Path(temp_dir, 'merges.log')
+                with MergeLog(log_path, batch_size=2) as merge_log:
+                    merged_db.merge_log = merge_log
+                    merged_db.merge_duplicates(print_merge_results_for_name=None, engine=engine,
+                                               workers=workers, similar_last_names=True)
+                    merged_db.merge_two_persons(
+                        merged_db.get_person_from_alias('Garcia, Raquel'),
+                        merged_db.get_person_from_alias('Teague, CE'),
+                        {'last': 'Garcia', 'first': 'Raquel', 'middle': '',
+                         'affiliation': 'Philip Morris'},
+                        rule=MERGE_RULE_MANUALLY_MERGED_NAMES)
+                    # both aliases belong to the same person -> the person gets renamed
+                    with mock.patch('name_disambiguation.people_db.MANUALLY_MERGED_NAMES', [{
+                            'authoritative_name': {'last': 'Risi', 'first': 'Stephan',
+                                                   'middle': 'P', 'affiliation': 'RJ Reynolds'},
+                            'aliases_to_merge': ['Risi, Stephan', 'RISI, STEPHAN']}]):
+                        merged_db.add_manually_merged_names()
+                records = read_merge_log(log_path)
+                self.assertEqual(raw_db.replay_merge_log(log_path), len(records))
+                self.assertEqual(records[-1][1], (records[-1][2],))
+                self.assertEqual(raw_db.get_person_from_alias('Risi, Stephan').middle, 'P')
+
+            self.assertIn(MERGE_RULE_SIMILAR_LAST_NAME, [record[0] for record in records])
+            self.assertEqual(raw_db, merged_db)
+            self.assertEqual(raw_db.next_person_id, merged_db.next_person_id)
+            self.assertEqual(sorted(person.person_id for person in raw_db.people),
+                             sorted(person.person_id for person in merged_db.people))
+            # pylint: disable=W0212
+            self.assertEqual({alias: person.person_id
+                              for alias, person in raw_db._alias_to_person_dict.items()},
+                             {alias: person.person_id
+                              for alias, person in merged_db._alias_to_person_dict.items()})
+            self.assertEqual(raw_db.check_index_consistency(), [])
+
+            # the persons of the log are gone now
+            with self.assertRaises(ValueError):
+                raw_db.replay_merge_log(records)
+
+    def test_merge_checkpoint(self):
+        """
+        Resuming an interrupted merge from its last checkpoint has to give the same db as an
+        uninterrupted merge
+        """
+        names = ['DUNN,W', 'DUNN,WL', 'Dunn, William L', 'Dunn, Frank', 'Garcia, Raquel',
+                 'Garcia, R', 'Kornegay, Horace R', 'Kornegay, HR', 'Risi, Stephan',
+                 'Risi, Stephan (Philip Morris)', 'Teague, CE', 'Teague, Claude E']
+        expected_db = PeopleDatabase()
+        expected_db.add_people_bulk(names)
+        interrupted_db = expected_db.copy()
+        expected_db.merge_duplicates(print_merge_results_for_name=None)
+
+        merge_block = PeopleDatabase.merge_block
+        merged_last_names = []
+
+        def merge_block_until_interrupt(people_db, last_name, engine='sequential'):
+            if len(merged_last_names) == 3:
+                raise KeyboardInterrupt
+            merged_last_names.append(last_name)
+            return merge_block(people_db, last_name, engine)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint_path = Path(temp_dir, 'merge.checkpoint')
+            with mock.patch.object(PeopleDatabase, 'merge_block', merge_block_until_interrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    interrupted_db.merge_duplicates(print_merge_results_for_name=None,
+                                                    checkpoint_path=checkpoint_path,
+                                                    checkpoint_interval=0)
+            self.assertEqual(merged_last_names, ['DUNN', 'GARCIA', 'KORNEGAY'])
+
+            # checkpoints get skipped while the previous one is being written
+            resumed_db = PeopleDatabase()
+            self.assertIn(resumed_db.load_merge_checkpoint(checkpoint_path), merged_last_names)
+            resumed_db = PeopleDatabase()
+            resumed_db.merge_duplicates(print_merge_results_for_name=None,
+                                        resume_from=checkpoint_path)
+
+        self.assertEqual(resumed_db, expected_db)
+        self.assertEqual(sorted(person.person_id for person in resumed_db.people),
+                         sorted(person.person_id for person in expected_db.people))
+        self.assertEqual(resumed_db.check_index_consistency(), [])
+        for alias, person in expected_db._alias_to_person_dict.items():  # pylint: disable=W0212
+            self.assertEqual(resumed_db.get_person_from_alias(alias).person_id, person.person_id)
+
+    def test_threaded_merge_checkpoint(self):
+        """
+        Without fork, the checkpoint holds the persons as they were when it was started, even if
+        the merge changes them while the thread is still pickling
+        """
+        write_started = threading.Event()
+        write_allowed = threading.Event()
+        write_checkpoint = write_merge_checkpoint
+
+        def write_when_allowed(*args):
+            write_started.set()
+            write_allowed.wait()
+            write_checkpoint(*args)
+
+        dunn = self.people_db.get_person_from_alias('Dunn, WL')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint_path = Path(temp_dir, 'merge.checkpoint')
+            writer = MergeCheckpointWriter(checkpoint_path, use_fork=False)
+            with mock.patch('name_disambiguation.merge_checkpoint.write_merge_checkpoint',
+                            write_when_allowed):
+                self.assertTrue(writer.write(self.people_db, 'DUNN', force=True))
+                write_started.wait()
+                dunn.count += 10
+                dunn.aliases.update({'DUNN, W': 1})
+                write_allowed.set()
+                writer.close()
+
+            checkpoint_db = PeopleDatabase()
+            self.assertEqual(checkpoint_db.load_merge_checkpoint(checkpoint_path), 'DUNN')
+        checkpoint_dunn = checkpoint_db.get_person_from_alias('Dunn, WL')
+        self.assertEqual(checkpoint_dunn.count, dunn.count - 10)
+        self.assertNotIn('DUNN, W', checkpoint_dunn.alias_keys())
+
+    def test_manual_merge_decisions(self):
+        """
+        manually_merge_db asks once per pair, stores the answers and applies them on the next
+        run without asking
+        """
+        names = ['Kornegay, Horace R', 'Kornegay, H', 'Kornegay, Horace', 'Dunn, WL',
+                 'Dunn, Frank', 'Risi, Stephan']
+
+        def create_people_db():
+            people_db = PeopleDatabase()
+            people_db.add_people_bulk(names)
+            people_db.merge_duplicates(print_merge_results_for_name=None)
+            return people_db
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            decisions_path = Path(temp_dir, 'decisions.json')
+
+            # nothing decided yet -> nothing merged without user input
+            people_db = create_people_db()
+            report = people_db.manually_merge_db(decisions_path, interactive=False)
+            self.assertEqual(report['merges'], 0)
+            self.assertEqual(report['undecided'], 3)
+
+            people_db = create_people_db()
+            answers = iter(['y', 'n'])
+            with mock.patch('builtins.input', lambda _: next(answers)):
+                report = people_db.manually_merge_db(decisions_path)
+            # Dunn, WL and Dunn, Frank get skipped because of their first names. After the first
+            # merge, the merged Kornegay only gets compared to the third Kornegay once
+            self.assertEqual(report['prompted'], 2)
+            self.assertEqual(report['merges'], 1)
+            self.assertEqual(len(people_db._last_name_to_people['KORNEGAY']),  # pylint: disable=W0212
+                             2)
+
+            rebuilt_db = create_people_db()
+            with mock.patch('builtins.input', side_effect=AssertionError('asked again')):
+                report = rebuilt_db.manually_merge_db(decisions_path)
+            self.assertEqual(report['stored'], 2)
+            self.assertEqual(report['prompted'], 0)
+            self.assertEqual(rebuilt_db, people_db)
+
+    def test_merge_similar_last_names(self):
+        """
+        Persons with spelling variants of a last name get merged if their first and middle
+        names are compatible
+        """
+        people_db = PeopleDatabase()
+        for name, count in [('Ahrensfeld, Thomas F', 5), ('Arensfeld, TF', 1),
+                            ('Wakeham, Thomas W', 3), ('WAKEHAN, TW', 1), ('WAKEHAN, R', 1),
+                            ('Dunn, William L', 1), ('Dunne, William L', 1)]:
+            people_db.add_person_raw(name, count)
+        report = people_db.merge_similar_last_names()
+
+        self.assertEqual(report['similar_last_name_pairs'], 2)
+        self.assertEqual(report['merges'], 2)
+        self.assertEqual(len(people_db), 5)
+        self.assertEqual(people_db.get_person_from_alias('Arensfeld, TF').full_name,
+                         'Thomas F. Ahrensfeld')
+        self.assertEqual(people_db.get_person_from_alias('WAKEHAN, TW').count, 4)
+        self.assertEqual(people_db.get_person_from_alias('WAKEHAN, R').last, 'WAKEHAN')
+        self.assertEqual(people_db.check_index_consistency(), [])
+
+    def test_merge_incremental(self):
+        """
+        New names only get merged with persons of their last name, and the report lists the
+        new and merged persons and the changed aliases
+        """
+        self.people_db.merge_duplicates()
+        garcia = self.people_db.get_person_from_alias('Garcia, Raquel')
+        report = self.people_db.merge_incremental({'Dunn, W L': 1, 'Garcia, Raquel': 2,
+                                                   'Teague, Claude E': 1, 'TEAGUE, CE': 3})
+
+        self.assertEqual(len(self.people_db), 4)
+        self.assertEqual(report['changed_last_names'], 2)
+        self.assertEqual([person.full_name for person in report['new_persons']], [])
+        self.assertEqual(sorted(person.full_name for person in report['merged_persons']),
+                         ['Claude E. Teague', 'William L. Dunn'])
+        # the old aliases of Dunn now point to the merged person
+        self.assertIn('dunn, w l', report['changed_aliases'])
+        self.assertIn('dunn, wl', report['changed_aliases'])
+        self.assertIn('teague, ce', report['changed_aliases'])
+        self.assertNotIn('garcia, raquel', report['changed_aliases'])
+        # existing names only add to the count of the existing person
+        self.assertIs(self.people_db.get_person_from_alias('Garcia, Raquel'), garcia)
+        self.assertEqual(garcia.count, 4)
+        self.assertEqual(self.people_db.check_index_consistency(), [])
+
+        report = self.people_db.merge_incremental(['Risi, Stephan', 'Risi, Ruth'])
+        self.assertEqual([person.full_name for person in report['new_persons']], ['Ruth Risi'])
+        self.assertEqual(report['merged_persons'], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,620 @@
+"""
+Tests of the Person class (person.py), its name and organization parsing and the name parse
+cache
+"""
+
+import json
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+
+from name_disambiguation.clean_org_names import ORG_DICTIONARY, OrgDictionary, \
+    get_clean_org_names
+from name_disambiguation.config import DATA_PATH
+from name_disambiguation import fast_name_parser
+from name_disambiguation.name_parse_cache import NAME_PARSE_CACHE, PARSER_VERSION, \
+    NameParseCache, persistent_name_parse_cache
+from name_disambiguation.parse_store import ORG_NAMES_PATH, PersistentParseStore
+from name_disambiguation.person import Person
+
+
+class TestNameChecker(unittest.TestCase):
+    """
+    Tests the check_if_this_person_looks_valid test
+    """
+    def test_check_if_this_person_looks_valid(self):        # pylint: disable=C0103
+        """
+        ibid.
+
+        :return:
+        """
+        outcomes_and_names = [
+            (True, Person(last='PEPPLES', first='E')),
+
+            # no special characters in last or first name
+            (False, Person(last='PEPPLES', first='Erest, B&W')),
+            (False, Person(last='PEPPLES B&W', first='E')),
+
+            # has to have a first name
+            (False, Person(last='PEPPLES', first='')),
+
+            # organizations should return False
+            (False, Person(name_raw='US HOUSE COMM ON INTERSTATE AND FOREIGN COMMERCE'))
+        ]
+
+        for outcome, person in outcomes_and_names:
+            print(person.check_if_this_person_looks_valid(), outcome, person)
+            self.assertEqual(outcome, person.check_if_this_person_looks_valid())
+
+
+class TestCompactPerson(unittest.TestCase):
+    """
+    Tests the __slots__ based Person with packed positions and aliases
+    """
+    def test_packed_until_accessed(self):
+        """
+        Positions and aliases are packed after initialization and turn into Counters on access
+        """
+        person = Person(name_raw='Dunn, William L (Philip Morris)', count=3)
+        self.assertFalse(hasattr(person, '__dict__'))
+        self.assertEqual(person.alias_items(), [('DUNN, WILLIAM L (PHILIP MORRIS)', 3)])
+        self.assertIsInstance(person._positions, tuple)             # pylint: disable=W0212
+
+        person.positions['LORILLARD'] += 1
+        self.assertIsInstance(person._positions, Counter)           # pylint: disable=W0212
+        person.compact()
+        self.assertEqual(person.positions, Counter({'PHILIP MORRIS': 3, 'LORILLARD': 1}))
+
+    def test_content_key(self):
+        """
+        A person has the same content with packed and unpacked positions and aliases
+        """
+        person = Person(name_raw='DUNN,WL', count=2)
+        packed_key = person.content_key()
+        self.assertEqual(person.aliases, Counter({'DUNN,WL': 2}))
+        self.assertIsInstance(person._aliases, Counter)             # pylint: disable=W0212
+        self.assertEqual(person.content_key(), packed_key)
+
+    def test_interned_names(self):
+        """
+        Name parts and aliases are interned
+        """
+        person1 = Person(name_raw='Dunn, William L')
+        person2 = Person(name_raw=''.join(['Dunn, ', 'William L']))
+        self.assertIs(person1.first, person2.first)
+        self.assertIs(person1.alias_items()[0][0], person2.alias_items()[0][0])
+
+    def test_pickle(self):
+        """
+        Persons survive pickling and copying
+        """
+        person = Person(name_raw='Temko, Stanley L (Covington & Burling)', count=4, person_id=7)
+        unpickled = pickle.loads(pickle.dumps(person))
+        self.assertEqual(repr(unpickled), repr(person))
+        self.assertEqual(unpickled, person)
+        self.assertTrue(unpickled.has_same_content(person))
+        self.assertTrue(person.copy().has_same_content(person))
+        self.assertIsNone(person.copy().person_id)
+
+    def test_unpickle_dict_state(self):
+        """
+        Pickles created before Person had __slots__ store the __dict__ as state
+        """
+        person = Person.__new__(Person)
+        person.__setstate__({'last': 'DUNN', 'first': 'W', 'middle': 'L',
+                             'position': 'not calculated',
+                             'positions': Counter({'PHILIP MORRIS': 2}),
+                             'aliases': Counter({'DUNN,WL': 2}), 'count': 2})
+        self.assertIsNone(person.person_id)
+        self.assertTrue(person.has_same_content(Person(last='DUNN', first='W', middle='L',
+                                                       positions=Counter({'PHILIP MORRIS': 2}),
+                                                       aliases=Counter({'DUNN,WL': 2}),
+                                                       count=2)))
+
+    def test_identity(self):
+        """
+        Persons are equal if they have the same person_id, and their hash does not change when
+        they get updated
+        """
+        person = Person(name_raw='DUNN,WL', person_id=3)
+        person_hash = hash(person)
+        person.positions['PHILIP MORRIS'] += 1
+        person.first = 'WILLIAM'
+        self.assertEqual(hash(person), person_hash)
+        self.assertEqual(person, Person(name_raw='Teague, CE', person_id=3))
+        self.assertNotEqual(Person(name_raw='DUNN,WL'), Person(name_raw='DUNN,WL'))
+        self.assertTrue(Person(name_raw='DUNN,WL').has_same_content(Person(name_raw='DUNN,WL')))
+
+
+class TestMostLikelyPosition(unittest.TestCase):
+    """
+    Tests the cached most_likely_position
+    """
+    def test_cache_invalidation(self):
+        """
+        most_likely_position gets recalculated when positions change
+        """
+        person = Person(last='DUNN', first='W', positions=Counter({'PHILIP MORRIS': 2}))
+        philip_morris = ORG_DICTIONARY.raw_to_clean['PHILIP MORRIS']
+        self.assertEqual(person.most_likely_position, philip_morris)
+        self.assertEqual(person.most_likely_position, philip_morris)
+
+        person.positions['LORILLARD'] += 3
+        self.assertEqual(person.most_likely_position, ORG_DICTIONARY.raw_to_clean['LORILLARD'])
+        person.compact()
+        self.assertEqual(person.most_likely_position, ORG_DICTIONARY.raw_to_clean['LORILLARD'])
+
+        person.positions = Counter({'PHILIP MORRIS': 1})
+        self.assertEqual(person.most_likely_position, 'no positions available')
+
+
+class TestNameParser(unittest.TestCase):
+    """Tests name parsing (parse_raw_name) of the Person class
+    Attributes:
+        test_raw_names: dict that corresponds raw names (str) to the expected Person object
+        use_fast_path: if simple names get split by the fast path (see fast_name_parser.py)
+    """
+    use_fast_path = True
+
+    def setUp(self):
+        self.test_raw_names = {
+        }
+        # parse every name from scratch with the selected path
+        NAME_PARSE_CACHE.clear()
+        fast_name_parser.USE_FAST_PATH = self.use_fast_path
+        # persons are equal only if they have the same person_id -> compare their content
+        self.addTypeEqualityFunc(Person, self.assertSamePerson)
+
+    def tearDown(self):
+        NAME_PARSE_CACHE.clear()
+        fast_name_parser.USE_FAST_PATH = True
+
+    def assertSamePerson(self, person1, person2, msg=None):     # pylint: disable=C0103
+        """
+        Asserts that two persons have the same names, positions, and aliases
+        :param person1: Person
+        :param person2: Person
+        :param msg: str
+        """
+        if not person1.has_same_content(person2):
+            self.fail(self._formatMessage(msg, f'{person1} != {person2}'))
+
+    # Not sure what the correct parsing is!
+    # This one breaks. But I don't think it can be avoided.
+    # >> > n = Person('Holtz, Jacob Alexander, Jacob & Medinger')
+    # >> > n.last, n.first, n.middle, " ".join(n.positions).upper()
+    # ('Holtz', '', '', 'JACOB ALEXANDER, JACOB & MEDINGER')
+
+    def test_parse_name_1(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        # Also test Person constructor: use list as positions
+        self.assertEqual(Person(last="Teague", first="C", middle="E", positions=Counter({'JR': 1}),
+                                aliases=Counter(["TEAGUE CE JR"])),
+                         Person(name_raw="TEAGUE CE JR"))
+
+    def test_parse_name_2(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        # Also test Person constructor: use Counter as positions
+        self.assertEqual(Person(last="Teague", first="C", middle="E", positions=Counter(["JR"]),
+                                aliases=Counter(["TEAGUE CE JR"])),
+                         Person(name_raw="teague ce jr"))
+
+    # TODO parse JR & PHD in positions into two separate strings
+    # def test_parse_name_3(self):
+    #     """
+    #     checks to see that a raw name is parsed correctly
+    #     """
+    #     # (currently parse them together, which is suboptimal but acceptable)
+    #     self.assertEqual(Person(last="Teague", first="Claude", middle="Edward",
+    #                             positions={"JR", "PHD"},
+    #                             aliases=["Teague, Claude Edward, Jr., Ph.D."]),
+    #                      Person(name_raw="Teague, Claude Edward, Jr., Ph.D."))
+
+    def test_parse_name_4(self):
+        """
+        checks to see that a raw name is parsed correctly: test parsing of dashes
+        """
+        self.assertEqual(Person(last="Baker", first="T", middle="E",
+                                positions={"NATIONAL ASSOCIATION OF ATTORNEYS GENERAL"},
+                                aliases=Counter(["BAKER, T E - NATIONAL ASSOCIATION OF ATTORNEYS "
+                                                 "GENERAL"])
+                               ),
+                         Person(name_raw="BAKER, T E - NATIONAL ASSOCIATION OF ATTORNEYS GENERAL"))
+
+    def test_parse_name_5(self):
+        """
+        checks to see that a raw name is parsed correctly: test parsing of dashes
+        """
+        self.assertEqual(Person(last="Baker", first="C", middle="J", positions={},
+                                aliases=Counter(["BAKER-CJ"])),
+                         Person(name_raw="BAKER-cj"))
+
+    def test_parse_name_6(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        # Not specify positions: test to make sure Person constructor can handle no data
+        # Here we assume for "Baker, JR", it is more likely that JR are initials and not junior
+        self.assertEqual(Person(last="Baker", first="J", middle="R",
+                                aliases=Counter(["BAKER, JR"])),
+                         Person(name_raw="Baker, JR"))
+
+    def test_parse_name_7(self):
+        """
+        checks to see that a raw name is parsed correctly: test if parser ignores "#"
+        """
+        self.assertEqual(Person(last="Dunn", first="W", middle="L",
+                                aliases=Counter(["DUNN WL #"])),
+                         Person(name_raw="DUNN WL #"))
+
+    def test_parse_name_8(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Dunn", first="W", middle="L",
+                                aliases=Counter(["DUNN, W. L."])),
+                         Person(name_raw="Dunn, W. L."))
+
+    def test_parse_name_9(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Temko", first="S", middle="L",
+                                positions=["COVINGTON & BURLING"],
+                                aliases=Counter(["TEMKO SL, COVINGTON AND BURLING"])),
+                         Person(name_raw="TEMKO SL, COVINGTON AND BURLING"))
+
+    def test_parse_name_10(self):
+        """
+        checks to see that a raw name is parsed correctly: test if Privlog is handled correctly
+        """
+        self.assertEqual(Person(last="Temko", first="Stanley", middle="L",
+                                aliases=Counter(["TEMKO, STANLEY L [PRIVLOG:] TEMKO,SL"])),
+                         Person(name_raw="Temko, Stanley L [Privlog:] TEMKO,SL"))
+
+    def test_parse_name_11(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Temko", first="S", middle="L",
+                                positions=["Covington & Burling"],
+                                aliases=Counter(["TEMKO-SL, COVINGTON & BURLING"])),
+                         Person(name_raw="Temko-SL, Covington & Burling"))
+
+    def test_parse_name_12(self):
+        """
+        checks to see that a raw name is parsed correctly:
+        test if info inside parentheses is taken as positions
+        """
+        self.assertEqual(Person(last="Henson", first="A", middle="",
+                                positions=["AMERICAN SENIOR VICE PRESIDENT AND GENERAL COUNSEL"],
+                                aliases=Counter(["HENSON, A. (AMERICAN SENIOR VICE PRESIDENT AND "
+                                                 "GENERAL COUNSEL)"])),
+                         Person(name_raw="HENSON, A. (AMERICAN SENIOR VICE PRESIDENT AND GENERAL "
+                                         "COUNSEL)"))
+
+    def test_parse_name_13(self):
+        """
+        checks to see that a raw name is parsed correctly:
+        test if only the first person's name is extracted if the raw string contain multiple people
+        """
+        self.assertEqual(Person(last="Henson", first="A", middle="",
+                                positions=["CHADBOURNE, PARK, WHITESIDE & WOLFF"],
+                                aliases=Counter(["HENSON, A. (CHADBOURNE, PARKE, WHITESIDE & "
+                                                 "WOLFF, "
+                                                 "AMERICAN OUTSIDE COUNSEL) (HANDWRITTEN NOTES)"])),
+                         Person(name_raw="HENSON, A. (CHADBOURNE, PARKE, WHITESIDE & WOLFF, "
+                                         "AMERICAN OUTSIDE COUNSEL) (HANDWRITTEN NOTES)"))
+
+    # TODO fix when multiple names are in the same string, not parse remaining name as positions
+    # def test_parse_name_14(self):
+    #     """
+    #     checks to see that a raw name is parsed correctly:
+    #     test parsing of multiple people in raw string
+    #     """
+    #     # This one does not discard the rest of the names and instead stores in positions
+    #     # (see test_parse_name_14b which correctly handles it when there are more names)
+    #     print("positions: ", Person(name_raw="Holtzman, A.,  Murray, J. ,  Henson, A.").positions)
+    #     self.assertEqual(Person(last="Holtzman", first="A", middle="", positions=[],
+    #                             aliases=["Holtzman, A.,  Murray, J. ,  Henson, A."]),
+    #                      Person(name_raw="Holtzman, A.,  Murray, J. ,  Henson, A."))
+
+    def test_parse_name_14b(self):
+        """
+        checks to see that a raw name is parsed correctly: comparison to 14
+        """
+        self.assertEqual(Person(last="Holtzman", first="A", middle="", positions=[],
+                                aliases=Counter(["HOLTZMAN, A.,  MURRAY, J. ,  HENSON, A. ,  "
+                                                 "PEPPLES, E. ,  STEVENS, A. ,  WITT, S."])),
+                         Person(name_raw="Holtzman, A.,  Murray, J. ,  Henson, A. ,  "
+                                         "Pepples, E. ,  Stevens, A. ,  Witt, S."))
+
+    def test_parse_name_15(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Holtz", first="Jacob", middle="",
+                                positions=["Jacob & Medinger"],
+                                aliases=Counter(["HOLTZ, JACOB, JACOB & MEDINGER"])),
+                         Person(name_raw="Holtz, Jacob, Jacob & Medinger"))
+
+    def test_parse_name_16(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Proctor", first="D", middle="F",
+                                positions=["Johns Hopkins University"],
+                                aliases=Counter(["PROCTOR DF, JOHNS HOPKINS SCHOOL OF HYGIENE"])),
+                         Person(name_raw="PROCTOR DF, JOHNS HOPKINS SCHOOL OF HYGIENE"))
+
+    def test_parse_name_17(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Smith", first="Andy", middle="B", positions=["JR"],
+                                aliases=["SMITH, ANDY B, J.R."]),
+                         Person(name_raw="Smith, Andy B, J.R."))
+
+    def test_parse_name_18(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Cantrell", first="D", middle="",
+                                positions=["BROWN & WILLIAMSON"], aliases=["D CANTRELL, B&W"]),
+                         Person(name_raw="D Cantrell, B&W"))
+
+    def test_parse_name_19(self):
+        """
+        checks to see that a raw name is parsed correctly
+        """
+        self.assertEqual(Person(last="Cantrell", first="A", middle="B",
+                                positions=["BROWN & WILLIAMSON"], aliases=["A B CANTRELL, BW"]),
+                         Person(name_raw="A B Cantrell, BW"))
+
+
+class TestNameParseCache(unittest.TestCase):
+    """
+    Tests the NameParseCache used by parse_raw_name
+    """
+    def test_scaled_by_count(self):
+        """
+        A cache hit has to return the same result as parsing with the given count
+        """
+        NAME_PARSE_CACHE.clear()
+        name_raw = 'TEMKO SL, COVINGTON AND BURLING'
+        Person.parse_raw_name(name_raw, 1)
+        hits_before = NAME_PARSE_CACHE.hits
+        cached_result = Person.parse_raw_name(name_raw, 7)
+        self.assertEqual(NAME_PARSE_CACHE.hits, hits_before + 1)
+        self.assertEqual(cached_result, Person.parse_raw_name_uncached(name_raw, 7))
+
+    def test_keyed_on_extract_orgs(self):
+        """
+        Results with and without org extraction have to be cached separately
+        """
+        NAME_PARSE_CACHE.clear()
+        name_raw = 'D Cantrell, B&W'
+        with_orgs = Person.parse_raw_name(name_raw, 1)
+        without_orgs = Person.parse_raw_name(name_raw, 1, extract_orgs=False)
+        self.assertEqual(with_orgs, Person.parse_raw_name_uncached(name_raw, 1))
+        self.assertEqual(without_orgs,
+                         Person.parse_raw_name_uncached(name_raw, 1, extract_orgs=False))
+
+    def test_eviction(self):
+        """
+        Least recently used results get evicted once the cache is full
+        """
+        cache = NameParseCache(max_size=2)
+        cache.set('A', True, 1)
+        cache.set('B', True, 2)
+        self.assertEqual(cache.get('A', True), 1)
+        cache.set('C', True, 3)
+        self.assertIsNone(cache.get('B', True))
+        self.assertEqual(cache.get('A', True), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_persistent_store(self):
+        """
+        Results parsed in one run have to be found by the next one, unless the parser version
+        changes
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store_path = Path(temp_dir, 'parse_cache.sqlite3')
+            name_raw = 'TEMKO SL, COVINGTON AND BURLING'
+
+            NAME_PARSE_CACHE.clear()
+            with persistent_name_parse_cache(store_path):
+                first_run = Person.parse_raw_name(name_raw, 3)
+
+            NAME_PARSE_CACHE.clear()
+            with persistent_name_parse_cache(store_path) as store:
+                self.assertEqual(Person.parse_raw_name(name_raw, 3), first_run)
+                self.assertEqual(store.hits, 1)
+
+            store = PersistentParseStore(PARSER_VERSION + 1, store_path)
+            self.assertEqual(len(store), 0)
+            store.close()
+            NAME_PARSE_CACHE.clear()
+
+
+class TestParseMany(unittest.TestCase):
+    """
+    Tests batch parsing with Person.parse_many
+    """
+    def test_parse_many_matches_serial(self):
+        """
+        parse_many with a process pool has to return exactly the results of parse_raw_name, in
+        input order and including duplicates
+        """
+        with open(Path(DATA_PATH, 'name_disambiguation', 'tobacco_names_raw_test_small.json'),
+                  'r', encoding='utf-8') as infile:
+            names = list(json.load(infile))
+        names += ['DUNN,WL', 'TEMKO SL, COVINGTON AND BURLING', 'DUNN,WL', 'X']
+
+        serial_results = []
+        for name in names:
+            try:
+                serial_results.append(Person.parse_raw_name_uncached(name, 1))
+            except IndexError:
+                serial_results.append(None)
+
+        NAME_PARSE_CACHE.clear()
+        self.assertEqual(Person.parse_many(names, workers=2, chunksize=5), serial_results)
+
+        # afterwards, all parse results come from the cache
+        hits_before = NAME_PARSE_CACHE.hits
+        Person(name_raw='TEMKO SL, COVINGTON AND BURLING', count=3)
+        self.assertEqual(NAME_PARSE_CACHE.hits, hits_before + 1)
+        NAME_PARSE_CACHE.clear()
+
+    def test_parse_many_cache_size(self):
+        """
+        A batch larger than NAME_PARSE_CACHE must not grow the cache
+        """
+        names = ['DUNN,WL', 'Dunn, William L', 'RISI,S', 'Garcia, Raquel', 'TEAGUE,CE']
+        max_size = NAME_PARSE_CACHE.max_size
+        NAME_PARSE_CACHE.clear()
+        NAME_PARSE_CACHE.resize(2)
+        try:
+            results = Person.parse_many(names)
+            self.assertEqual(NAME_PARSE_CACHE.max_size, 2)
+            self.assertEqual(len(NAME_PARSE_CACHE), 2)
+            self.assertEqual(results, [Person.parse_raw_name_uncached(name, 1) for name in names])
+        finally:
+            NAME_PARSE_CACHE.resize(max_size)
+            NAME_PARSE_CACHE.clear()
+
+    def test_from_parse_result(self):
+        """
+        from_parse_result has to give the same person as creating it from the raw name
+        """
+        names = ['DUNN,WL', 'TEMKO SL, COVINGTON AND BURLING', 'Risi, Stephan (Philip Morris)']
+        for name, parse_result in zip(names, Person.parse_many(names)):
+            person = Person.from_parse_result(name, parse_result, count=3)
+            expected = Person(name_raw=name, count=3)
+            self.assertTrue(person.has_same_content(expected))
+            self.assertEqual(person.alias_items(), expected.alias_items())
+            self.assertEqual(person.position_items(), expected.position_items())
+            self.assertEqual(person.count, 3)
+
+
+class TestNameParserWithoutFastPath(TestNameParser):
+    """
+    Runs all TestNameParser tests with HumanName only, so we know both paths agree
+    """
+    use_fast_path = False
+
+
+class TestOrgDictionary(unittest.TestCase):
+    """
+    Tests loading and rebuilding of the OrgDictionary
+    """
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()     # pylint: disable=R1732
+        self.addCleanup(temp_dir.cleanup)
+        self.json_path = Path(temp_dir.name, 'clean_org_names_to_raw_org_names.json')
+        self.file_path = Path(temp_dir.name, 'clean_org_names.pickle')
+        shutil.copy(ORG_NAMES_PATH, self.json_path)
+
+    def test_rebuild(self):
+        """
+        The dict gets rebuilt when the json content changes, not when only its modification
+        time changes
+        """
+        org_dictionary = OrgDictionary(self.json_path, self.file_path)
+        self.assertIsNone(org_dictionary.rebuilt)
+        self.assertEqual(org_dictionary.raw_to_clean, get_clean_org_names(ORG_NAMES_PATH))
+        self.assertTrue(org_dictionary.rebuilt)
+
+        org_dictionary = OrgDictionary(self.json_path, self.file_path)
+        self.assertEqual(len(org_dictionary.matcher), len(org_dictionary.raw_to_clean))
+        self.assertFalse(org_dictionary.rebuilt)
+
+        json_stat = os.stat(self.json_path)
+        os.utime(self.json_path, ns=(json_stat.st_atime_ns, json_stat.st_mtime_ns + 10 ** 9))
+        org_dictionary = OrgDictionary(self.json_path, self.file_path)
+        self.assertIn('PHILIP MORRIS', org_dictionary.raw_to_clean)
+        self.assertFalse(org_dictionary.rebuilt)
+
+        with open(self.json_path, 'r', encoding='utf-8') as infile:
+            clean_to_raw = json.load(infile)
+        clean_to_raw['Test Org'] = ['TESTORG']
+        with open(self.json_path, 'w', encoding='utf-8') as outfile:
+            json.dump(clean_to_raw, outfile)
+        org_dictionary = OrgDictionary(self.json_path, self.file_path)
+        self.assertEqual(org_dictionary.raw_to_clean['TESTORG'], 'Test Org')
+        self.assertTrue(org_dictionary.rebuilt)
+        self.assertIn('TESTORG', org_dictionary.matcher.raw_orgs)
+
+    @unittest.skipUnless(os.name == 'posix', 'file permissions')
+    def test_store_permissions(self):
+        """
+        The stored pickle gets the usual permissions of new files instead of the 0600 of
+        temporary files
+        """
+        previous_umask = os.umask(0o022)
+        self.addCleanup(os.umask, previous_umask)
+        self.assertIn('PHILIP MORRIS', OrgDictionary(self.json_path, self.file_path).raw_to_clean)
+        self.assertEqual(stat.S_IMODE(self.file_path.stat().st_mode), 0o644)
+
+class TestOrgParser(unittest.TestCase):
+    """
+    Tests organization parser and extracter in extract_raw_org_names_from_name
+    """
+
+    def test_parse_org_1(self):
+        self.assertEqual(
+            Person.extract_raw_org_names_from_name('TEMKO SL, COVINGTON AND BURLING'),
+            ('TEMKO SL', ['Covington & Burling'])
+        )
+
+    def test_parse_org_2(self):
+        # if an organization could also be name initials, keep the initials
+        self.assertEqual(
+            Person.extract_raw_org_names_from_name('TEMKO PM'),
+            ('TEMKO PM', [])
+        )
+
+    def test_parse_org_3(self):
+        self.assertEqual(
+            Person.extract_raw_org_names_from_name('TEMKO PM, PM'),
+            ('TEMKO PM', ['Philip Morris'])
+        )
+
+    def test_parse_org_4(self):
+        # organizations in @skip@ like UNK (unknown) should be deleted
+        self.assertEqual(
+            Person.extract_raw_org_names_from_name('TEMKO PM, UNK'),
+            ('TEMKO PM', [])
+        )
+
+    def test_raw_org_matcher_candidates(self):
+        """
+        Every raw org whose regex matches a name has to be a candidate of RAW_ORG_MATCHER,
+        otherwise extract_known_raw_org_names would miss it
+        """
+        with open(Path(DATA_PATH, 'name_disambiguation', 'tobacco_names_raw_test_small.json'),
+                  'r', encoding='utf-8') as infile:
+            names = list(json.load(infile))
+        names += ['TEMKO SL, COVINGTON AND BURLING', 'D Cantrell, B&W', 'ROEMER HC, R.J. REYNOLDS',
+                  'SMITH, BAT UK and Export Limited', 'JONES AB, PM, UNK']
+
+        for name in names:
+            candidate_ids = set(ORG_DICTIONARY.matcher.get_candidate_ids(name))
+            for raw_org_id, pattern in enumerate(ORG_DICTIONARY.matcher.patterns):
+                if pattern.search(name):
+                    self.assertIn(raw_org_id, candidate_ids, msg=(name, pattern))
+
+
+if __name__ == '__main__':
+    unittest.main()